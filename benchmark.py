@@ -0,0 +1,256 @@
+import argparse
+import multiprocessing as mp
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from gui.model.decoder import BACKENDS, fitSize, openDecoder
+from gui.model.shm_ring import SharedFrameRing
+from gui.model.synthetic import SyntheticTrafficDecoder
+from gui.model.tracker import IoUTracker, createTracker
+from gui.utils.buffer_pool import FramePool
+
+
+def printTable(title: str, rows: list):
+    if not rows:
+        return
+    headers = list(rows[0].keys())
+    widths = [max(len(str(h)), *(len(str(row[h])) for row in rows)) for h in headers]
+    print(f"\n== {title} ==")
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(row[h]).ljust(w) for h, w in zip(headers, widths)))
+
+
+def benchDecode(video_path: str, stride: int = 1, max_side: int = None, max_frames: int = 500) -> list:
+    rows = []
+    for backend in BACKENDS[1:]:
+        try:
+            decoder = openDecoder(video_path, backend)
+        except Exception as e:
+            rows.append({"backend": backend, "stride": stride, "size": "-", "frames": 0, "fps": f"n/a ({e})"})
+            continue
+        if max_side:
+            decoder.size = fitSize(decoder.width, decoder.height, max_side)
+
+        frames = 0
+        start = time.perf_counter()
+        while frames < max_frames:
+            ret, _ = decoder.read(skip=stride - 1)
+            if not ret:
+                break
+            frames += 1
+        elapsed = time.perf_counter() - start
+        decoder.release()
+
+        rows.append(
+            {
+                "backend": backend,
+                "stride": stride,
+                "size": "x".join(map(str, decoder.outputSize)),
+                "frames": frames,
+                # source frames per second, skipped frames included
+                "fps": round(frames * stride / elapsed, 1) if elapsed else 0,
+            }
+        )
+    return rows
+
+
+def syntheticDetections(frames: int, jitter: float, dropout: float, seed: int = 0) -> list:
+    # ground truth boxes of a synthetic clip with pixel jitter and missed detections, as (gt ids, xyxy, cls, conf)
+    decoder = SyntheticTrafficDecoder(frames=frames, spawn_rate=0.01, seed=seed)
+    rng = np.random.default_rng(seed)
+    detections = []
+    while decoder.grab():
+        ids, xyxy, cls = decoder.groundTruth()
+        keep = rng.random(len(ids)) >= dropout
+        xyxy = xyxy[keep] + rng.normal(0, jitter, (int(keep.sum()), 4)).astype(np.float32)
+        conf = rng.uniform(0.6, 0.95, len(xyxy)).astype(np.float32)
+        detections.append((ids[keep], xyxy, cls[keep], conf))
+    decoder.release()
+    return detections
+
+
+def idSwitches(gt_ids: list, track_ids: list) -> tuple:
+    # (switches, identified detections, total detections), a switch is a ground truth vehicle changing track id
+    last, switches, identified, total = {}, 0, 0, 0
+    for gt, tracked in zip(gt_ids, track_ids):
+        for g, t in zip(gt.tolist(), tracked.tolist()):
+            total += 1
+            if t < 0:
+                continue
+            identified += 1
+            if g in last and last[g] != t:
+                switches += 1
+            last[g] = t
+    return switches, identified, total
+
+
+def benchTrackers(frames: int = 1800, jitter: float = 2.0, dropout: float = 0.1, seed: int = 0) -> list:
+    detections = syntheticDetections(frames, jitter, dropout, seed)
+    vehicles = len(set().union(*(d[0].tolist() for d in detections)))
+    trackers = {
+        "iou greedy": lambda: IoUTracker(method="greedy"),
+        "iou hungarian": lambda: IoUTracker(method="hungarian"),
+        "bytetrack": lambda: createTracker("bytetrack.yaml"),
+    }
+    rows = []
+    for name, factory in trackers.items():
+        try:
+            tracker = factory()
+        except Exception as e:
+            rows.append({"tracker": name, "fps": f"n/a ({e})", "id_switches": "-", "switches_per_100": "-", "identified": "-"})
+            continue
+        track_ids = []
+        start = time.perf_counter()
+        for _, xyxy, cls, conf in detections:
+            track_ids.append(tracker.update(xyxy, cls, conf))
+        elapsed = time.perf_counter() - start
+        switches, identified, total = idSwitches([d[0] for d in detections], track_ids)
+        rows.append(
+            {
+                "tracker": name,
+                # tracker updates per second, detection excluded
+                "fps": round(len(detections) / elapsed, 1) if elapsed else 0,
+                "id_switches": switches,
+                "switches_per_100": round(100 * switches / vehicles, 2) if vehicles else 0,
+                "identified": round(identified / total, 3) if total else 0,
+            }
+        )
+    return rows
+
+
+def queueProducer(frames_queue, shape: tuple, frames: int):
+    frame = np.zeros(shape, dtype=np.uint8)
+    for index in range(frames):
+        frame[0, 0, 0] = index % 256
+        frames_queue.put((index, frame))
+    frames_queue.put((None, None))
+
+
+def ringProducer(ring: SharedFrameRing, shape: tuple, frames: int):
+    frame = np.zeros(shape, dtype=np.uint8)
+    for index in range(frames):
+        frame[0, 0, 0] = index % 256
+        ring.put(frame, index)
+    ring.finish()
+    ring.close()
+
+
+def benchTransport(shape: tuple = (720, 1280, 3), frames: int = 300, slots: int = 8) -> list:
+    # frames per second from a producer process to this one, the consumer only touches each frame
+    frame_mb = np.prod(shape) / 2 ** 20
+    rows = []
+
+    frames_queue = mp.Queue(slots)
+    producer = mp.Process(target=queueProducer, args=(frames_queue, shape, frames))
+    start = time.perf_counter()
+    producer.start()
+    received = 0
+    while True:
+        index, frame = frames_queue.get()
+        if index is None:
+            break
+        int(frame[::64, ::64].sum())
+        received += 1
+    elapsed = time.perf_counter() - start
+    producer.join()
+    rows.append({"transport": "multiprocessing.Queue", "frames": received, "fps": round(received / elapsed, 1), "MB/s": round(received * frame_mb / elapsed, 1)})
+
+    ring = SharedFrameRing(shape, slots)
+    producer = mp.Process(target=ringProducer, args=(ring, shape, frames))
+    start = time.perf_counter()
+    producer.start()
+    received = 0
+    while True:
+        slot, index = ring.next()
+        if slot is None:
+            break
+        int(ring.view(slot)[::64, ::64].sum())
+        ring.release(slot)
+        received += 1
+    elapsed = time.perf_counter() - start
+    producer.join()
+    ring.close()
+    rows.append({"transport": "shared memory ring", "frames": received, "fps": round(received / elapsed, 1), "MB/s": round(received * frame_mb / elapsed, 1)})
+    return rows
+
+
+def displayLoop(decoder, pool: FramePool, panel: tuple, frames: int) -> dict:
+    # the per frame array work of App.updateFrame and App.__display without the model and Qt,
+    # pool None allocates every step like the loop did before the buffer pool
+    line = np.array([[100, 400], [1100, 400]], dtype=np.int32).reshape((-1, 1, 2))
+    allocations, allocated, done = 0, 0, 0
+    frame = rgb = scaled = None
+
+    def measure(step):
+        # an allocation shows up as a peak above the memory held before the step
+        nonlocal allocations, allocated
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = step()
+        grown = tracemalloc.get_traced_memory()[1] - before
+        if grown >= 64 * 1024:
+            allocations += 1
+            allocated += grown
+        return result
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    while done < frames:
+        if pool is None:
+            ret, frame = measure(lambda: decoder.read())
+        else:
+            ret, frame = measure(lambda: decoder.read(out=pool.get("decode", (decoder.height, decoder.width, 3))))
+        if not ret:
+            break
+        if pool is None:
+            rgb = measure(lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            canvas = rgb
+            scaled = measure(lambda: cv2.resize(canvas, panel, interpolation=cv2.INTER_NEAREST))
+        else:
+            rgb = measure(lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=pool.get("rgb", frame.shape)))
+            canvas = pool.get("display", rgb.shape)
+            np.copyto(canvas, rgb)
+            scaled = measure(lambda: cv2.resize(canvas, panel, dst=pool.get("scaled", (panel[1], panel[0], 3)), interpolation=cv2.INTER_NEAREST))
+        cv2.polylines(canvas, [line], False, (0, 255, 0), 2, lineType=cv2.LINE_AA)
+        done += 1
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    decoder.release()
+    return {
+        "buffers": "pooled" if pool is not None else "allocated",
+        "frames": done,
+        "allocations/frame": round(allocations / max(done, 1), 2),
+        "MB/frame": round(allocated / max(done, 1) / 2 ** 20, 2),
+        "ms/frame": round(1000 * elapsed / max(done, 1), 2),
+    }
+
+
+def benchFrameBuffers(video_path: str = None, frames: int = 300, panel: tuple = (960, 540)) -> list:
+    # the synthetic clip decodes straight into the passed buffer like the opencv backend
+    def opener():
+        if video_path:
+            return openDecoder(video_path, "opencv")
+        return SyntheticTrafficDecoder(frames=frames)
+
+    return [displayLoop(opener(), None, panel, frames), displayLoop(opener(), FramePool(), panel, frames)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="vehicle monitor throughput benchmarks")
+    parser.add_argument("video", nargs="?", help="video file used by the decode benchmark")
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--max-side", type=int, default=None, help="decode straight to this size, e.g. 640")
+    parser.add_argument("--max-frames", type=int, default=500)
+    parser.add_argument("--jitter", type=float, default=2.0, help="pixel noise of the synthetic tracker detections")
+    parser.add_argument("--dropout", type=float, default=0.1, help="fraction of missed synthetic detections")
+    args = parser.parse_args()
+
+    if args.video:
+        printTable("decode", benchDecode(args.video, args.stride, args.max_side, args.max_frames))
+    printTable("frame buffers per displayed frame", benchFrameBuffers(args.video, min(args.max_frames, 300)))
+    printTable("trackers (synthetic clip)", benchTrackers(jitter=args.jitter, dropout=args.dropout))
+    printTable("frame transport between processes (1280x720)", benchTransport())
@@ -2,4 +2,9 @@ from . import gui_components, model ,utils
 
 # constants
 ASSETS_PATH = './gui/assets'
-MODELS_PATH = './gui/trained_models'
\ No newline at end of file
+MODELS_PATH = './gui/trained_models'
+PROFILES_PATH = './gui/profiles'
+RECORDINGS_PATH = './gui/recordings'
+SNAPSHOTS_PATH = './gui/snapshots'
+LOGS_PATH = './gui/logs'
+CHECKPOINTS_PATH = './gui/checkpoints'
\ No newline at end of file
@@ -1,9 +1,10 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QComboBox, QTextEdit, QLineEdit, QLabel, QFileDialog
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QComboBox, QTextEdit, QLineEdit, QLabel, QFileDialog, QTableWidget, QTableWidgetItem
 from PyQt5.QtCore import pyqtSignal, QObject
 
 class VideoFileLodingWidget(QWidget):
-    videoLoaded = pyqtSignal(str)  
+    # path or url, True for live streams
+    videoLoaded = pyqtSignal(str, bool)
     
     def __init__(self):
         super().__init__()
@@ -74,7 +75,7 @@ class VideoFileLodingWidget(QWidget):
             file_path = self.fileLineEdit.text()
 
             if file_path:
-                self.videoLoaded.emit(file_path)
+                self.videoLoaded.emit(file_path, False)
                 print(f'Handling "From File" option with file: {file_path}')
                 # Add your logic for handling 'From File' option with file_path
             else:
@@ -82,7 +83,7 @@ class VideoFileLodingWidget(QWidget):
         elif selected_option == 'From HTTP Stream':
             file_path = self.urlTextEdit.toPlainText().strip()
             if file_path:
-                self.videoLoaded.emit(file_path)
+                self.videoLoaded.emit(file_path, True)
                 print(f'Handling "From HTTP Stream" option with URL: {file_path}')
                 # TODO add a message thah
                 # Add your logic for handling 'From HTTP Stream' option with url
@@ -92,6 +93,48 @@ class VideoFileLodingWidget(QWidget):
         self.close()
 
 
+class ODMatrixWidget(QWidget):
+    # origin-destination counts, origin lines as rows and destination lines as columns
+    exportRequested = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.initUI()
+
+    def initUI(self):
+        self.setWindowTitle('Origin-destination matrix')
+
+        main_layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(self)
+        self.summaryLabel = QLabel(self)
+
+        self.exportButton = QPushButton('Export CSV', self)
+        self.exportButton.clicked.connect(self.onExportClicked)
+
+        main_layout.addWidget(self.table)
+        main_layout.addWidget(self.summaryLabel)
+        main_layout.addWidget(self.exportButton)
+
+        self.setLayout(main_layout)
+
+    def showMatrix(self, origins, destinations, counts, open_tracks=0):
+        self.table.setRowCount(len(origins))
+        self.table.setColumnCount(len(destinations) + 1)
+        self.table.setHorizontalHeaderLabels(['No exit line' if d is None else str(d) for d in destinations] + ['Total'])
+        self.table.setVerticalHeaderLabels([str(o) for o in origins])
+        for row, values in enumerate(counts):
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(str(value)))
+            self.table.setItem(row, len(destinations), QTableWidgetItem(str(values.sum())))
+        self.summaryLabel.setText(f'{counts.sum()} finished tracks, {open_tracks} still open')
+
+    def onExportClicked(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, 'Save OD Matrix As CSV', '', 'CSV Files (*.csv);;All Files (*)')
+        if file_path:
+            self.exportRequested.emit(file_path)
+
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     widget = VideoFileLodingWidget()
@@ -0,0 +1,54 @@
+from collections import Counter, defaultdict
+
+import numpy as np
+
+
+class CountAggregator:
+    # running crossing counts per line, split by vehicle and direction
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self):
+        self.counts = defaultdict(Counter)
+        self.speeds = defaultdict(list)
+
+    def add(self, event: dict):
+        self.counts[event["line_id"]][(event["vechile"], event["direction"])] += 1
+        if event.get("speed") is not None:
+            self.speeds[event["line_id"]].append(event["speed"])
+
+    def speedSummary(self, line_id) -> dict:
+        speeds = np.asarray(self.speeds.get(line_id, []), dtype=np.float64)
+        if len(speeds) == 0:
+            return {}
+        return {
+            "count": len(speeds),
+            "mean": round(float(speeds.mean()), 1),
+            "median": round(float(np.median(speeds)), 1),
+            "p85": round(float(np.percentile(speeds, 85)), 1),
+            "max": round(float(speeds.max()), 1),
+        }
+
+    def rebuild(self, events: list):
+        self.reset()
+        for event in events:
+            self.add(event)
+
+    def total(self, line_id) -> int:
+        return sum(self.counts.get(line_id, Counter()).values())
+
+    def summary(self) -> dict:
+        summary = {}
+        for line_id, counter in self.counts.items():
+            by_vehicle, by_direction = Counter(), Counter()
+            for (vehicle, direction), count in counter.items():
+                by_vehicle[vehicle] += count
+                by_direction[direction] += count
+            summary[str(line_id)] = {
+                "total": sum(counter.values()),
+                "by_vehicle": dict(by_vehicle),
+                "by_direction": dict(by_direction),
+                "speed": self.speedSummary(line_id),
+            }
+        return summary
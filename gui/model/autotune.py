@@ -0,0 +1,147 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import socket
+import time
+from pathlib import Path
+
+from gui import PROFILES_PATH
+from gui.model.pipeline import clipAgreement, runClip
+from gui.model.quantization import bf16Supported
+
+
+def defaultGrid(model_path: str) -> dict:
+    cpus = os.cpu_count() or 1
+    precisions = ["fp32", "int8-dynamic"] + (["bf16"] if bf16Supported() else [])
+    return {
+        "model": [model_path],
+        "imgsz": [320, 480, 640],
+        "threads": sorted({cpus, max(cpus // 2, 1)}),
+        "precision": precisions,
+        "frame_stride": [1, 2, 3],
+    }
+
+
+def configGrid(grid: dict) -> list:
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def hostProfilePath() -> Path:
+    return Path(PROFILES_PATH) / f"{socket.gethostname()}.json"
+
+
+def loadHostProfile() -> dict:
+    try:
+        with open(hostProfilePath()) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def saveHostProfile(profile: dict) -> Path:
+    path = hostProfilePath()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(profile, file, indent=2)
+    return path
+
+
+def autotune(
+    detector_factory: callable,
+    video_path: str,
+    lines: dict,
+    grid: dict,
+    frames: int = 150,
+    threshold: float = 0.95,
+    progress: callable = None,
+) -> tuple:
+    """
+    Runs the first `frames` frames of the video for every configuration of the grid and
+    returns (fastest configuration whose accuracy >= threshold, all results).
+
+    Accuracy is count agreement with the reference run (largest imgsz, fp32, stride 1)
+    when the lines see traffic, otherwise detection F1 against it.
+    """
+    reference_config = {
+        "model": grid["model"][-1],
+        "imgsz": max(grid["imgsz"]),
+        "threads": max(grid["threads"]),
+        "precision": "fp32",
+        "frame_stride": 1,
+    }
+    reference = runClip(detector_factory(reference_config), video_path, lines, frames)
+    logging.info(f'autotune reference : {reference_config}, fps {reference["fps"]}')
+
+    results = []
+    configs = configGrid(grid)
+    for index, config in enumerate(configs):
+        try:
+            run = runClip(detector_factory(config), video_path, lines, frames)
+        except Exception as e:
+            logging.warning(f'autotune skipped {config} : {e}')
+            continue
+        agreement = clipAgreement(reference, run)
+        accuracy = agreement["count_agreement"]
+        if accuracy is None:
+            accuracy = agreement["detection_f1"]
+        results.append({**config, "fps": run["fps"], "accuracy": accuracy, **agreement})
+        logging.info(f'autotune {index + 1}/{len(configs)} : {config}, fps {run["fps"]}, accuracy {accuracy}')
+        if progress is not None:
+            progress(index + 1, len(configs))
+
+    passing = [r for r in results if r["accuracy"] >= threshold]
+    best = max(passing, key=lambda r: r["fps"]) if passing else None
+    return best, results
+
+
+def profileFromResult(best: dict, video_path: str, threshold: float) -> dict:
+    return {
+        "host": socket.gethostname(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "video": str(video_path),
+        "threshold": threshold,
+        "fps": best["fps"],
+        "accuracy": best["accuracy"],
+        "config": {k: best[k] for k in ("model", "imgsz", "threads", "precision", "frame_stride")},
+    }
+
+
+def loadLines(path: str) -> dict:
+    # {"line id": [[x, y], ...]} in frame pixels
+    with open(path) as file:
+        return {k: {"geometry": [tuple(p) for p in v], "type": "line"} for k, v in json.load(file).items()}
+
+
+if __name__ == "__main__":
+    from gui import MODELS_PATH
+    from gui.model.detection import Detection
+    from gui.model.renderer import VIZ_NONE
+
+    parser = argparse.ArgumentParser(description="benchmark inference configurations and save the host profile")
+    parser.add_argument("video")
+    parser.add_argument("--model", default=os.path.join(MODELS_PATH, "yolov8n.pt"), nargs="+")
+    parser.add_argument("--lines", default=None, help="json file with counting lines")
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    models = args.model if isinstance(args.model, list) else [args.model]
+    grid = {**defaultGrid(models[0]), "model": models}
+
+    def factory(config):
+        detector = Detection(device=args.device, viz_mode=VIZ_NONE)
+        detector.configure(config)
+        return detector
+
+    best, results = autotune(factory, args.video, loadLines(args.lines) if args.lines else {}, grid, args.frames, args.threshold)
+    for result in sorted(results, key=lambda r: -r["fps"]):
+        print({k: result[k] for k in ("model", "imgsz", "threads", "precision", "frame_stride", "fps", "accuracy")})
+    if best is None:
+        print(f"no configuration reached accuracy {args.threshold}")
+    else:
+        print(f"profile saved : {saveHostProfile(profileFromResult(best, args.video, args.threshold))}")
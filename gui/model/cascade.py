@@ -0,0 +1,172 @@
+import logging
+import os
+import time
+
+import numpy as np
+from shapely.geometry import LineString, Point, Polygon
+from ultralytics import YOLO
+
+from gui.utils.utils import boxIou
+
+
+class CascadeClassifier:
+    """
+    Second opinion of a larger model on the vehicles the small model is unsure about.
+
+    The small model keeps tracking the full frame. A tracked box is re-classified only when it
+    is close to a counting line or zone (within `near` box diagonals) and either its confidence
+    is below `confidence` or the class votes of its track do not agree on `vote_share` of the
+    frames. Candidates of a frame go to the large model as one batch of padded crops, at most
+    `max_batch` of them, nearest to a line first. The answer is kept per track id, so every
+    vehicle is sent once and its class is overridden from then on.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        device="cpu",
+        imgsz: int = 256,
+        confidence: float = 0.6,
+        vote_share: float = 0.7,
+        near: float = 1.0,
+        padding: float = 0.15,
+        max_batch: int = 8,
+        ttl: int = 90,
+    ) -> None:
+        if not os.path.exists(model_path):
+            raise Exception(f"Invalid cascade model path provided : {model_path}")
+        self.model_path = model_path
+        self.model = YOLO(model_path, task="detect")
+        self.model.to(device)
+        self.imgsz = imgsz
+        self.confidence = confidence
+        self.vote_share = vote_share
+        self.near = near
+        self.padding = padding
+        self.max_batch = max_batch
+        # frames a track id is remembered after it was last seen
+        self.ttl = ttl
+        self.reset()
+
+    def reset(self):
+        # track id -> class id of the large model, None when it found no vehicle in the crop
+        self.classes = {}
+        self.last_seen = {}
+        self.geometry_key = None
+        self.geometries = []
+
+        # stats
+        self.checked = 0
+        self.changed = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def __lineGeometries(self, lines: dict) -> list:
+        key = tuple((k, tuple(map(tuple, l["geometry"])), l.get("type", "line")) for k, l in lines.items())
+        if key != self.geometry_key:
+            self.geometry_key = key
+            self.geometries = [
+                Polygon(l["geometry"]).exterior if l.get("type") == "zone" else LineString(l["geometry"])
+                for l in lines.values()
+                if len(l["geometry"]) >= (3 if l.get("type") == "zone" else 2)
+            ]
+        return self.geometries
+
+    def __forget(self, ids: np.ndarray, frame_index: int):
+        for track_id in ids[ids >= 0]:
+            self.last_seen[int(track_id)] = frame_index
+        for track_id in [t for t, seen in self.last_seen.items() if frame_index - seen > self.ttl]:
+            del self.last_seen[track_id]
+            self.classes.pop(track_id, None)
+
+    def __isUncertain(self, track_id: int, confidence: float, track_history: dict) -> bool:
+        if confidence < self.confidence:
+            return True
+        votes = track_history[track_id]["name"] if track_id in track_history else []
+        if len(votes) < 2:
+            return False
+        return max(votes.count(v) for v in set(votes)) / len(votes) < self.vote_share
+
+    def __candidates(self, ids, xyxy, conf, lines: dict, track_history: dict) -> list:
+        geometries = self.__lineGeometries(lines)
+        if not geometries:
+            return []
+        candidates = []
+        for k, (track_id, box, confidence) in enumerate(zip(ids, xyxy, conf)):
+            track_id = int(track_id)
+            if track_id < 0 or track_id in self.classes:
+                continue
+            if not self.__isUncertain(track_id, float(confidence), track_history):
+                continue
+            centre = Point((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)
+            distance = min(g.distance(centre) for g in geometries)
+            if distance <= self.near * np.hypot(box[2] - box[0], box[3] - box[1]):
+                candidates.append((distance, k))
+        return [k for _, k in sorted(candidates)[: self.max_batch]]
+
+    def __classify(self, frame: np.ndarray, boxes: np.ndarray, class_ids: dict) -> list:
+        # class id of every box according to the large model, None when it sees no vehicle there
+        height, width = frame.shape[:2]
+        crops, expected = [], []
+        for x1, y1, x2, y2 in boxes:
+            pad_x, pad_y = (x2 - x1) * self.padding, (y2 - y1) * self.padding
+            left, top = max(int(x1 - pad_x), 0), max(int(y1 - pad_y), 0)
+            right, bottom = min(int(x2 + pad_x) + 1, width), min(int(y2 + pad_y) + 1, height)
+            crops.append(frame[top:bottom, left:right])
+            expected.append((x1 - left, y1 - top, x2 - left, y2 - top))
+
+        answers = []
+        for result, box in zip(self.model.predict(crops, imgsz=self.imgsz, verbose=False), expected):
+            found = result.boxes
+            if len(found) == 0:
+                answers.append(None)
+                continue
+            # the detection covering the tracked box best, weighted by its confidence
+            score = boxIou(np.array([box], dtype=np.float32), found.xyxy.float().cpu().numpy())[0] * found.conf.float().cpu().numpy()
+            best = int(np.argmax(score))
+            name = result.names[int(found.cls[best])]
+            answers.append(class_ids.get(name) if score[best] > 0 else None)
+        return answers
+
+    def refine(self, frame: np.ndarray, ids, xyxy, cls, conf, lines: dict, track_history: dict, names: dict, frame_index: int) -> np.ndarray:
+        """
+        Returns cls with the large model classes of the checked tracks. Tracks whose class
+        changes get their earlier class votes in track_history replaced as well, so the
+        vote at the crossing follows the large model straight away.
+        """
+        self.__forget(ids, frame_index)
+        cls = np.array(cls, copy=True)
+        for k, track_id in enumerate(ids):
+            if self.classes.get(int(track_id)) is not None:
+                cls[k] = self.classes[int(track_id)]
+
+        candidates = self.__candidates(ids, xyxy, conf, lines, track_history)
+        if not candidates:
+            return cls
+        start = time.perf_counter()
+        class_ids = {name: class_id for class_id, name in names.items()}
+        answers = self.__classify(frame, xyxy[candidates], class_ids)
+        self.seconds += time.perf_counter() - start
+        self.batches += 1
+
+        for k, class_id in zip(candidates, answers):
+            track_id = int(ids[k])
+            self.classes[track_id] = class_id
+            self.checked += 1
+            if class_id is None or class_id == cls[k]:
+                continue
+            self.changed += 1
+            cls[k] = class_id
+            if track_id in track_history:
+                votes = track_history[track_id]["name"]
+                votes[:] = [names.get(class_id, str(class_id))] * len(votes)
+            logging.debug(f'cascade changed track {track_id} to {names.get(class_id, class_id)}')
+        return cls
+
+    def stats(self) -> dict:
+        return {
+            "checked": self.checked,
+            "changed": self.changed,
+            "batches": self.batches,
+            "ms_per_batch": round(1000 * self.seconds / self.batches, 1) if self.batches else 0,
+        }
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+
+from gui.model.trajectories import TrajectoryStore
+from gui.utils.utils import toJson
+
+
+CHECKPOINT_VERSION = 2
+
+# one row of the trajectory file, the columns of TrajectoryStore
+TRAJECTORY_ROW = np.dtype([("frame", np.int32), ("track_id", np.int32), ("xy", np.float32, (2,)), ("cls", np.int16)])
+
+
+def atomicWrite(path: str, data: bytes):
+    # a crash leaves either the old file or the new one, never half of it
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+class EventLog:
+    """
+    Append only json lines file of the events of a run.
+
+    Appends are buffered, offset() makes everything written so far durable and returns the
+    byte position a checkpoint points at. Whatever lies past that position when a run resumes
+    was produced after the checkpoint and is produced again, so it is cut off.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "ab")
+
+    def append(self, event: dict):
+        self.file.write(toJson(event).encode() + b"\n")
+
+    def offset(self) -> int:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def truncate(self, offset: int):
+        self.file.flush()
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+    def read(self) -> list:
+        self.file.flush()
+        with open(self.path, "rb") as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    def rewrite(self, events: list):
+        # replaces every event, e.g. after a recount
+        self.file.close()
+        atomicWrite(self.path, b"".join(toJson(event).encode() + b"\n" for event in events))
+        self.file = open(self.path, "ab")
+
+    def close(self):
+        self.file.close()
+
+
+class Checkpointer:
+    """
+    Periodic crash checkpoints of the analysis of one source.
+
+    A checkpoint is a pickle of the pipeline state (frame position, tracker and track
+    stores, lines, ...) replaced atomically every `every` seconds. What grows with the length
+    of the video stays in append only side files the checkpoint only holds an offset into:
+    the events (EventLog) and the trajectory rows, each save appends just the rows since the
+    last one. Resuming cuts both files back to their offsets, so nothing after the checkpoint
+    is counted twice. When a windowed TrajectoryStore dropped old rows the trajectory file is
+    written over, so it stays as small as the window.
+    """
+
+    def __init__(self, directory: str, source: str, every: float = 30.0) -> None:
+        os.makedirs(directory, exist_ok=True)
+        # the same file (or stream url) always maps to the same checkpoint
+        key = hashlib.sha1(str(os.path.abspath(source) if os.path.isfile(source) else source).encode()).hexdigest()[:12]
+        base = os.path.join(directory, f"{Path(source).stem or 'live'}_{key}")
+        self.path = base + ".ckpt"
+        # two trajectory files take turns, a file started over never replaces the one the last checkpoint points at
+        self.trajectory_paths = (base + ".trajectories", base + ".trajectories.1")
+        self.trajectory_path = self.trajectory_paths[0]
+        self.events = EventLog(base + ".events.jsonl")
+        self.every = every
+        self.last_save = time.monotonic()
+        # trajectory rows already in the trajectory file and the rows the store had dropped by then
+        self.trajectory_rows = 0
+        self.trajectory_evicted = 0
+        self.saves = 0
+        self.seconds = 0.0
+
+    def due(self) -> bool:
+        return time.monotonic() - self.last_save >= self.every
+
+    def __appendTrajectories(self, trajectories: TrajectoryStore) -> int:
+        if len(trajectories) < self.trajectory_rows or trajectories.evicted != self.trajectory_evicted:
+            # the store was cleared or its window dropped old rows since the last save, start the file over
+            self.trajectory_rows = 0
+        rows = np.empty(len(trajectories) - self.trajectory_rows, dtype=TRAJECTORY_ROW)
+        start = self.trajectory_rows
+        for name in TRAJECTORY_ROW.names:
+            rows[name] = getattr(trajectories, name)[start: len(trajectories)]
+        if start == 0:
+            self.trajectory_path = self.__otherTrajectoryPath()
+            atomicWrite(self.trajectory_path, rows.tobytes())
+        else:
+            with open(self.trajectory_path, "r+b") as file:
+                file.truncate(start * TRAJECTORY_ROW.itemsize)
+                file.seek(start * TRAJECTORY_ROW.itemsize)
+                file.write(rows.tobytes())
+                file.flush()
+                os.fsync(file.fileno())
+        self.trajectory_rows = len(trajectories)
+        self.trajectory_evicted = trajectories.evicted
+        return self.trajectory_rows
+
+    def __otherTrajectoryPath(self) -> str:
+        return self.trajectory_paths[1 - self.trajectory_paths.index(self.trajectory_path)]
+
+    def save(self, state: dict, trajectories: TrajectoryStore):
+        # side files first, a crash in between leaves the old checkpoint with offsets that still hold
+        start = time.perf_counter()
+        state = {
+            **state,
+            "version": CHECKPOINT_VERSION,
+            "saved_at": time.time(),
+            "event_offset": self.events.offset(),
+            "trajectory_rows": self.__appendTrajectories(trajectories),
+        }
+        state["trajectory_file"] = os.path.basename(self.trajectory_path)
+        atomicWrite(self.path, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+        # the previous file is no longer referenced
+        if os.path.exists(self.__otherTrajectoryPath()):
+            os.remove(self.__otherTrajectoryPath())
+        self.last_save = time.monotonic()
+        self.saves += 1
+        self.seconds += time.perf_counter() - start
+
+    def load(self) -> dict:
+        # the last checkpoint, None when there is none or it cannot be read
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as file:
+                state = pickle.load(file)
+        except Exception as e:
+            logging.error(f'unreadable checkpoint : {self.path}, {e}')
+            return None
+        if state.get("version") != CHECKPOINT_VERSION:
+            logging.warning(f'checkpoint of another version ignored : {self.path}')
+            return None
+        return state
+
+    def restore(self, state: dict, trajectories: TrajectoryStore) -> list:
+        # cuts the side files back to the checkpoint, loads the trajectory rows and returns the events
+        self.events.truncate(state["event_offset"])
+        count = state["trajectory_rows"]
+        self.trajectory_path = os.path.join(os.path.dirname(self.path), state["trajectory_file"])
+        rows = np.fromfile(self.trajectory_path, dtype=TRAJECTORY_ROW, count=count) if count else np.empty(0, dtype=TRAJECTORY_ROW)
+        if len(rows) < count:
+            raise Exception(f"trajectory file is shorter than its checkpoint : {self.trajectory_path}")
+        with open(self.trajectory_path, "ab") as file:
+            file.truncate(count * TRAJECTORY_ROW.itemsize)
+        trajectories.load(rows["frame"], rows["track_id"], rows["xy"], rows["cls"])
+        self.trajectory_rows = count
+        self.trajectory_evicted = trajectories.evicted
+        self.last_save = time.monotonic()
+        return self.events.read()
+
+    def clear(self):
+        # the run finished or is started over, nothing to resume
+        self.events.truncate(0)
+        self.trajectory_rows = 0
+        self.trajectory_evicted = 0
+        self.trajectory_path = self.trajectory_paths[0]
+        for path in (self.path, *self.trajectory_paths):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        self.events.close()
+
+    def stats(self) -> dict:
+        return {
+            "saves": self.saves,
+            "ms_per_save": round(1000 * self.seconds / self.saves, 1) if self.saves else 0,
+            "trajectory_rows": self.trajectory_rows,
+        }
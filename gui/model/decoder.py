@@ -0,0 +1,228 @@
+import logging
+from abc import ABC, abstractmethod
+
+import cv2
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+BACKENDS = ["auto", "opencv", "pyav"]
+
+
+def fitSize(width: int, height: int, max_side: int) -> tuple:
+    # keep aspect ratio, longest side becomes max_side (never upscale)
+    scale = min(max_side / max(width, height), 1.0)
+    return max(int(round(width * scale)), 1), max(int(round(height * scale)), 1)
+
+
+class VideoDecoder(ABC):
+    # common interface of the decoding backends, mirrors the parts of cv2.VideoCapture the app uses
+
+    name = "base"
+
+    def __init__(self, source: str, size: tuple = None) -> None:
+        self.source = source
+        # output (width, height), None keeps the native resolution
+        self.size = size
+        self.fps = 0.0
+        self.frame_count = 0
+        self.width = 0
+        self.height = 0
+        # index of the frame the next read returns
+        self.next_index = 0
+
+    @abstractmethod
+    def isOpened(self) -> bool:
+        ...
+
+    @abstractmethod
+    def grab(self) -> bool:
+        # advance one frame without converting it to an image
+        ...
+
+    @abstractmethod
+    def retrieve(self, out=None):
+        # out is a preallocated frame to decode into, backends that cannot write in place ignore it
+        ...
+
+    @abstractmethod
+    def release(self):
+        ...
+
+    def skip(self, count: int) -> int:
+        skipped = 0
+        while skipped < count and self.grab():
+            skipped += 1
+        self.next_index += skipped
+        return skipped
+
+    def read(self, skip: int = 0, out=None):
+        # frames in between are grabbed only, strided inference never sees them
+        if self.skip(skip) < skip or not self.grab():
+            return False, None
+        self.next_index += 1
+        return self.retrieve(out)
+
+    def seek(self, index: int) -> bool:
+        # the next read returns frame `index`, backends without random access grab their way forward
+        if index < self.next_index:
+            raise Exception(f"{self.name} decoder cannot seek back from frame {self.next_index} to {index}")
+        return self.skip(index - self.next_index) == index - self.next_index
+
+    def setSize(self, size: tuple):
+        # output (width, height) of the frames read from now on, None keeps the native resolution
+        self.size = size
+
+    @property
+    def outputSize(self) -> tuple:
+        return self.size or (self.width, self.height)
+
+
+class OpenCVDecoder(VideoDecoder):
+    name = "opencv"
+
+    def __init__(self, source: str, size: tuple = None) -> None:
+        super().__init__(source, size)
+        self.cap = cv2.VideoCapture(source)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # native size frame reused when the output is resized
+        self.native = None
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def grab(self) -> bool:
+        return self.cap.grab()
+
+    def retrieve(self, out=None):
+        resize = self.size is not None and tuple(self.size) != (self.width, self.height)
+        # opencv writes into a passed array of the right shape instead of allocating one
+        ret, frame = self.cap.retrieve(self.native if resize else out)
+        if not ret:
+            return False, None
+        if resize:
+            self.native = frame
+            frame = cv2.resize(frame, self.size, dst=out, interpolation=cv2.INTER_AREA)
+        return True, frame
+
+    def seek(self, index: int) -> bool:
+        if not self.cap.set(cv2.CAP_PROP_POS_FRAMES, index) or int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) != index:
+            # container without a usable index, decode from the start
+            logging.warning(f'opencv could not seek to frame {index}, decoding up to it')
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.next_index = 0
+            return super().seek(index)
+        self.next_index = index
+        return True
+
+    def release(self):
+        self.cap.release()
+
+
+class PyAVDecoder(VideoDecoder):
+    # FFmpeg through PyAV with frame and slice threading, scaling happens inside swscale during colour conversion
+    name = "pyav"
+
+    def __init__(self, source: str, size: tuple = None, threads: int = 0) -> None:
+        super().__init__(source, size)
+        self.container = None
+        self.frame = None
+        # a seek decoded the target frame already, the next grab hands it out
+        self.pending = False
+        if av is None:
+            raise Exception("PyAV is not installed, pip install av")
+        try:
+            self.container = av.open(source)
+        except Exception as e:
+            logging.error(f'pyav unable to open : {source}, {e}')
+            return
+
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        self.stream.thread_count = threads
+        self.fps = float(self.stream.average_rate or 0)
+        self.frame_count = self.__frameCount(source)
+        self.width = self.stream.codec_context.width
+        self.height = self.stream.codec_context.height
+        self.frames = self.container.decode(self.stream)
+
+    def __frameCount(self, source: str) -> int:
+        # matroska, webm and raw streams carry no frame count, estimate it from the durations
+        if self.stream.frames:
+            return int(self.stream.frames)
+        if self.stream.duration and self.stream.time_base and self.fps:
+            return int(round(float(self.stream.duration * self.stream.time_base) * self.fps))
+        if self.container.duration and self.fps:
+            return int(round(self.container.duration / av.time_base * self.fps))
+        # last resort, OpenCV estimates it the same way for most containers
+        cap = cv2.VideoCapture(source)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0) if cap.isOpened() else 0
+        cap.release()
+        return max(frame_count, 0)
+
+    def isOpened(self) -> bool:
+        return self.container is not None
+
+    def grab(self) -> bool:
+        if self.pending:
+            self.pending = False
+            return True
+        try:
+            self.frame = next(self.frames)
+        except (StopIteration, av.error.FFmpegError):
+            self.frame = None
+            return False
+        return True
+
+    def retrieve(self, out=None):
+        # to_ndarray always allocates, out is ignored
+        if self.frame is None:
+            return False, None
+        if self.size is None:
+            return True, self.frame.to_ndarray(format="bgr24")
+        width, height = self.size
+        return True, self.frame.to_ndarray(format="bgr24", width=width, height=height)
+
+    def seek(self, index: int) -> bool:
+        # to the keyframe before the target, then decode forward to it
+        if not self.fps or self.stream.time_base is None:
+            return super().seek(index)
+        start = self.stream.start_time or 0
+        target = start + int(round(index / self.fps / self.stream.time_base))
+        self.container.seek(target, backward=True, any_frame=False, stream=self.stream)
+        self.frames = self.container.decode(self.stream)
+        while self.grab():
+            if self.frame.pts is not None and self.frame.pts >= target:
+                # the frame is kept for the next read
+                self.next_index = index
+                self.pending = True
+                return True
+        return False
+
+    def release(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+def openDecoder(source: str, backend: str = "auto", size: tuple = None) -> VideoDecoder:
+    if backend == "auto":
+        # OpenCV as before the backends existed, it decodes into the reused buffers. PyAV only
+        # steps in for what OpenCV cannot open
+        decoder = OpenCVDecoder(source, size)
+        if decoder.isOpened() or av is None:
+            return decoder
+        decoder.release()
+        logging.info(f'opencv unable to open : {source}, trying pyav')
+        backend = "pyav"
+    if backend == "pyav":
+        return PyAVDecoder(source, size)
+    if backend == "opencv":
+        return OpenCVDecoder(source, size)
+    raise Exception(f"unknown decoder backend : {backend}")
@@ -2,12 +2,29 @@ from collections import defaultdict
 import cv2, os
 import numpy as np
 from ultralytics import YOLO
+from ultralytics.trackers.basetrack import BaseTrack
 from shapely.geometry import *
 from statistics import mode
 import datetime
 from uuid import UUID
 import torch
 from pathlib import Path
+import logging
+import time
+
+from gui.model.track_cache import TrackCache, fileFingerprint
+from gui.model.trajectories import TrajectoryStore
+from gui.model.zones import ZoneCounter
+from gui.model.speed import SpeedEstimator
+from gui.model.quantization import quantizedModelPath, bf16Supported
+from gui.model.motion import MotionGate
+from gui.model.tracker import IoUTracker, UltralyticsTracker, createTracker
+from gui.model.cascade import CascadeClassifier
+from gui.model.tiling import TiledDetector
+from gui.model.od_matrix import ODMatrix
+from gui.model.heatmap import DensityHeatmap
+from gui.model.renderer import OverlayRenderer, VIZ_NONE, VIZ_TRACK, VIZ_BBOX_TRACK, VIZ_HEATMAP
+from gui.utils.utils import formatTime
 
 
 def line_direction(p1, p2, p3, p4):
@@ -27,15 +44,116 @@ def line_direction(p1, p2, p3, p4):
 
 class Detection:
     def __init__(self, device, viz_mode) -> None:
+        # trailing centroids of every live track with their class names and processed frame indices
         self.track_history = defaultdict(
-            lambda: {"track": [], "name": [], "counted": False}
+            lambda: {"track": [], "name": [], "frame": []}
         )
+        # ordered line crossings per track and the origin-destination counts of finished tracks
+        self.od = ODMatrix()
         self.device = torch.device(device)
         self.viz_mode = viz_mode
+        self.model = None
+        self.model_path = None
+        # ultralytics' own default, model.track used it before the tracker became selectable
+        self.tracker = "botsort.yaml"
+        # built-in tracker behind model.predict, None when ultralytics tracks
+        self.box_tracker = None
+        self.imgsz = 640
+        self.precision = "fp32"
+        # frames used to calibrate static int8 quantization
+        self.calibration_video = None
+        self.names = {}
+        self.frame_index = 0
+        self.fps = 0
+        self.frame_stride = 1
+        # (processed frame index, source frame, stride) from where a stride applies
+        self.stride_changes = [(0, 0, 1)]
+        self.track_cache = None
+        self.trajectories = TrajectoryStore()
+        # seconds of trajectories kept for recounts, None keeps the whole video
+        self.trajectory_window = None
+        self.renderer = OverlayRenderer()
+        self.zones = ZoneCounter()
+        self.speed = SpeedEstimator()
+        self.frame_shape = None
+        self.last_boxes = None
+        self.motion_gate = None
+        # SnapshotWriter saving a crop per crossing, None disables snapshots
+        self.snapshots = None
+        # larger model re-classifying uncertain boxes near the lines, None disables the cascade
+        self.cascade = None
+        # TiledDetector for high resolution feeds, None runs the model on the full frame
+        self.tiler = None
+        # where vehicles drive and stop, kept over resetModel so a finished video can be saved
+        self.heatmap = DensityHeatmap()
 
     def setVizMode(self, mode:int):
         self.viz_mode = mode
 
+    def setFps(self, fps: float):
+        self.fps = fps
+
+    def setFrameStride(self, stride: int, position: int = None):
+        # `position` is the source frame the next read starts from, when the caller knows it
+        self.frame_stride = max(int(stride), 1)
+        if position is None:
+            position = self.sourceFrame(self.frame_index - 1) + 1
+        # the frames processed so far keep the stride they were read with
+        source_frame = position + self.frame_stride - 1
+        self.stride_changes = [c for c in self.stride_changes if c[0] < self.frame_index]
+        self.stride_changes.append((self.frame_index, source_frame, self.frame_stride))
+        self.setTrajectoryWindow(self.trajectory_window)
+
+    def sourceFrame(self, index: int) -> int:
+        # position in the source video of a processed frame, the reads skip stride - 1 frames before each one
+        if index < 0:
+            return -1
+        for start, source_frame, stride in reversed(self.stride_changes):
+            if index >= start:
+                return source_frame + (index - start) * stride
+        return index
+
+    def secondsPerFrame(self) -> float:
+        return self.frame_stride / self.fps if self.fps else 0
+
+    def frameTime(self, index: int) -> str:
+        # time of the processed frame index in the source video
+        seconds = self.sourceFrame(index) / self.fps if self.fps else 0
+        return formatTime(seconds) + ' SEC'
+
+    def setPrecision(self, precision: str, calibration_video: str = None):
+        if precision == "bf16" and not bf16Supported():
+            logging.warning("this CPU has no native bf16 support, bf16 inference will be emulated")
+        self.precision = precision
+        self.calibration_video = calibration_video
+
+    def setTracker(self, tracker: str):
+        self.tracker = tracker
+        if tracker == "iou" or self.tiler is not None:
+            # tiles are only detected, the ultralytics tracker then runs behind them as well
+            self.box_tracker = createTracker(tracker, int(self.fps or 30))
+        else:
+            self.box_tracker = None
+
+    def setTiling(self, enabled: bool):
+        self.tiler = TiledDetector() if enabled else None
+        self.setTracker(self.tracker)
+
+    def setHeatmapDecay(self, half_life: float):
+        # seconds for old traffic to fade to half in the heatmap, None keeps everything
+        self.heatmap.setHalfLife(half_life)
+
+    def setTrajectoryWindow(self, seconds: float):
+        # the store counts processed frames, one per stride source frames
+        self.trajectory_window = seconds
+        self.trajectories.window = int(seconds * (self.fps or 25) / self.frame_stride) if seconds else None
+
+    def setMotionGating(self, enabled: bool):
+        self.motion_gate = MotionGate() if enabled else None
+
+    def setCascade(self, model_path: str):
+        self.cascade = CascadeClassifier(model_path, self.device) if model_path else None
+
     def selectDevice(self, device_name: str):
         self.device = torch.device(device_name)
 
@@ -43,68 +161,214 @@ class Detection:
         # check for model path
         if not os.path.exists(model_path):
             raise Exception("Invalid model path provided")
+        # int8 runs through a quantized onnx export cached next to the model
+        load_path = model_path
+        if self.precision.startswith("int8"):
+            load_path = quantizedModelPath(model_path, self.precision, self.imgsz, self.calibration_video)
         # load model
-        model = YOLO(model_path)
+        model = YOLO(load_path, task="detect")
         # If the model loading fails, raise an error
         if model is None:
             raise Exception("unable to load model")
 
         self.model_path = model_path
         self.model = model
-        self.model.to(self.device)
+        if load_path == model_path:
+            self.model.to(self.device)
+        self.names = self.model.names
+
+    def configure(self, config: dict):
+        # apply a tuned configuration (model, imgsz, precision, frame_stride, threads, tracker, motion_gating)
+        if config.get("threads"):
+            torch.set_num_threads(int(config["threads"]))
+        if config.get("frame_stride"):
+            self.setFrameStride(config["frame_stride"])
+        if config.get("imgsz"):
+            self.imgsz = int(config["imgsz"])
+        if config.get("precision"):
+            self.setPrecision(config["precision"], self.calibration_video)
+        if config.get("tracker"):
+            self.setTracker(config["tracker"])
+        if "motion_gating" in config:
+            self.setMotionGating(bool(config["motion_gating"]))
+        model_path = config.get("model") or self.model_path
+        if model_path:
+            self.loadModel(model_path)
 
     def resetModel(self):
-        self.track_history = defaultdict(lambda: {"track": [], "name": [], "counted": False})
+        self.closeTrackCache()
+        self.track_history = defaultdict(lambda: {"track": [], "name": [], "frame": []})
+        # track ids start over, every open sequence ends here
+        self.od.finishAll()
+        self.frame_index = 0
+        self.stride_changes = [(0, self.frame_stride - 1, self.frame_stride)]
+        self.trajectories.clear()
+        self.zones.reset()
+        self.speed.reset()
+        self.last_boxes = None
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        # a fresh tracker of the configured kind, a resumed checkpoint may have left the one of model.track here
+        self.setTracker(self.tracker)
+        if self.cascade is not None:
+            self.cascade.reset()
         self.loadModel(self.model_path)
 
-    def detectAndTracePath(
-        self, frame: np.ndarray, lines: list[dict], frame_time: str, callback: callable
-    ) -> np.ndarray:
-        
+    def cacheConfig(self) -> dict:
+        # everything that changes the tracked boxes has to be part of the cache key
+        return {
+            "model": fileFingerprint(self.model_path) if self.model_path else None,
+            "tracker": self.tracker,
+            "frame_stride": self.frame_stride,
+            "imgsz": self.imgsz,
+            "precision": self.precision,
+            "motion_gating": self.motion_gate is not None,
+            "cascade": fileFingerprint(self.cascade.model_path) if self.cascade is not None else None,
+            "tiling": self.tiler.config() if self.tiler is not None else None,
+        }
 
-        if self.model is None:
-            return frame
+    def openTrackCache(self, video_path: str, extra_config: dict = None) -> TrackCache:
+        self.closeTrackCache()
+        config = {**self.cacheConfig(), **(extra_config or {})}
+        self.track_cache = TrackCache.forVideo(video_path, config)
+        if self.track_cache.isComplete:
+            self.names = self.track_cache.names or self.names
+        else:
+            self.track_cache.startRecording()
+        return self.track_cache
+
+    def closeTrackCache(self, complete: bool = False):
+        if self.track_cache is None:
+            return
+        self.track_cache.close(complete=complete, names=self.names)
+        self.track_cache = None
+
+    def checkpointState(self) -> dict:
+        # what resuming needs besides the trajectories, which the checkpoint appends separately
+        tracker = self.box_tracker
+        if tracker is None and getattr(getattr(self.model, "predictor", None), "trackers", None):
+            # model.track keeps its tracker inside the predictor
+            tracker = self.model.predictor.trackers[0]
+        return {
+            "config": self.cacheConfig(),
+            "frame_index": self.frame_index,
+            "stride_changes": self.stride_changes,
+            "frame_shape": self.frame_shape,
+            "track_history": {k: {key: list(values) for key, values in v.items()} for k, v in self.track_history.items()},
+            "tracker": tracker,
+            # ultralytics numbers its tracks with a class counter, pickling the tracker misses it
+            "track_count": BaseTrack._count,
+            "last_boxes": self.last_boxes,
+            "od": self.od,
+            "zones": (self.zones.inside, self.zones.occupancy),
+            "speed": self.speed,
+            "heatmap": self.heatmap,
+            "cascade": (self.cascade.classes, self.cascade.last_seen) if self.cascade is not None else None,
+        }
+
+    def restoreCheckpoint(self, state: dict, lines: dict):
+        # continues from checkpointState(), the model and settings have to be the ones it was taken with
+        if state["config"] != self.cacheConfig():
+            raise Exception("the checkpoint was taken with another model or other settings")
+        tracker = state["tracker"]
+        if tracker is not None and not isinstance(tracker, (IoUTracker, UltralyticsTracker)):
+            # the predictor tracker of model.track, it goes on behind model.predict instead
+            self.box_tracker = UltralyticsTracker(self.tracker, int(self.fps or 30))
+            self.box_tracker.tracker = tracker
+        elif tracker is not None:
+            self.box_tracker = tracker
+        BaseTrack._count = max(BaseTrack._count, state["track_count"])
+
+        self.frame_index = state["frame_index"]
+        self.stride_changes = state["stride_changes"]
+        self.frame_shape = state["frame_shape"]
+        self.track_history = defaultdict(lambda: {"track": [], "name": [], "frame": []}, state["track_history"])
+        self.last_boxes = state["last_boxes"]
+        self.od = state["od"]
+        self.speed = state["speed"]
+        self.heatmap = state["heatmap"]
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        if self.cascade is not None and state["cascade"] is not None:
+            self.cascade.classes, self.cascade.last_seen = state["cascade"]
+
+        # zones rasterized up front, otherwise the first frame would take it for a change of zones
+        zones = {k: l for k, l in lines.items() if l.get("type") == "zone"}
+        if zones and self.frame_shape is not None:
+            self.zones.rasterize(zones, self.frame_shape)
+        self.zones.inside, self.zones.occupancy = state["zones"]
+
+    def trackFrame(self, frame: np.ndarray, lines: dict = None):
+        # returns the ultralytics results (None when served from cache) and the box columns
+        if self.track_cache is not None:
+            cached = self.track_cache.frame(self.frame_index)
+            if cached is not None:
+                return None, cached
 
         # Run YOLOv8 tracking on the frame, persisting tracks between frames
-        results = self.model.track(frame, persist=True, verbose=False)
-        try:
-            track_ids = results[0].boxes.id.int().cpu().tolist()
-        except:
-            track_ids = []
+        use_bf16 = self.precision == "bf16" and self.device.type == "cpu"
+        with torch.autocast("cpu", dtype=torch.bfloat16, enabled=use_bf16):
+            if self.tiler is not None:
+                # the tiles near lines and last frame boxes, merged boxes go to the box tracker
+                previous = self.last_boxes[1] if self.last_boxes is not None else None
+                results, (xyxy, cls, conf) = self.tiler.detect(self.model, frame, lines or {}, previous)
+            elif self.box_tracker is None:
+                results = self.model.track(frame, persist=True, verbose=False, tracker=self.tracker, imgsz=self.imgsz)
+            else:
+                results = self.model.predict(frame, verbose=False, imgsz=self.imgsz)
+        if self.tiler is None:
+            boxes = results[0].boxes
+            xyxy = boxes.xyxy.float().cpu().numpy().astype(np.float32)
+            cls = boxes.cls.float().cpu().numpy().astype(np.int16)
+            conf = boxes.conf.float().cpu().numpy().astype(np.float16)
+        if self.box_tracker is not None:
+            ids = self.box_tracker.update(xyxy, cls, conf)
+        elif boxes.id is not None:
+            ids = boxes.id.int().cpu().numpy().astype(np.int32)
+        else:
+            # untracked detections are kept for drawing but never counted
+            ids = np.full(len(xyxy), -1, dtype=np.int32)
+        if self.cascade is not None and lines:
+            cls = self.cascade.refine(frame, ids, xyxy, cls, conf, lines, self.track_history, self.names, self.frame_index)
+
+        if self.track_cache is not None:
+            self.track_cache.append(ids, xyxy, cls, conf)
+        return results, (ids, xyxy, cls, conf)
 
+    def countCrossings(self, ids, xyxy, cls, lines: dict, frame_time: str, callback: callable):
+        track_ids = [int(i) for i in ids if i >= 0]
         track_history_to_delete = set(self.track_history.keys()) - set(track_ids)
 
         for id in track_history_to_delete:
             del self.track_history[id]
 
-        # Visualize the results on the frame
-        frame = results[0].plot(
-            line_width=2, font_size=2, probs=False ,
-            boxes= (self.viz_mode in [0 , 2])
-        )
+        # update every track once per frame
+        boxes = {}
+        for bbox_id, (x1, y1, x2, y2), class_id in zip(ids, xyxy, cls):
+            if bbox_id < 0:
+                continue
+            boxes[int(bbox_id)] = (float(x1), float(y1), float(x2), float(y2))
+            track = self.track_history[int(bbox_id)]
+            track["name"].append(self.names.get(int(class_id), str(class_id)))
+            track["track"].append((float(x1 + x2) / 2, float(y1 + y2) / 2))
+            track["frame"].append(self.frame_index)
+            if len(track["track"]) > 20:
+                track["track"].pop(0)
+                track["name"].pop(0)
+                track["frame"].pop(0)
+
+        if self.speed.isCalibrated:
+            self.speed.update(self.track_history, self.secondsPerFrame())
 
-        # draw cross line
         for line_id, l in lines.items():
+            if l.get("type", "line") != "line":
+                continue
             line_geom = LineString(l["geometry"])
-            # pts = np.array(l["geometry"], dtype=np.int32).reshape((-1, 1, 2))
-            # cv2.polylines(frame, pts=[pts], isClosed=False, color=l["color"], thickness=2)
 
-            for item in results[0].summary():
-                bbox_id = item.get("track_id")
-                if bbox_id is None:
-                    continue
-
-                class_label = item.get("name")
-                x1, y1, x2, y2 = item.get("box").values()
+            for bbox_id in track_ids:
                 track = self.track_history[bbox_id]
-
-                track["name"].append(class_label)
-                track["track"].append(((x1 + x2) / 2, (y1 + y2) / 2))
-                if len(track["track"]) > 20:
-                    track["track"].pop(0)
-                    track["name"].pop(0)
-
-                if len(track["track"]) > 1 and not track["counted"]:
+                # once per line, a track crossing several lines is counted on each of them
+                if len(track["track"]) > 1 and not self.od.hasCrossed(bbox_id, line_id):
                     track_geom = LineString(track["track"])
                     is_intersects = line_geom.intersects(track_geom)
                     if is_intersects:
@@ -115,7 +379,7 @@ class Detection:
                             track["track"][-1],
                         )
                         vechile = mode(track["name"])
-                        track["counted"] = True
+                        self.od.record(bbox_id, line_id, direction, self.frame_index)
                         callback(
                             {
                                 "line_id": line_id,
@@ -123,22 +387,135 @@ class Detection:
                                 "crossing_time": frame_time,
                                 "vechile": vechile,
                                 "direction": direction,
+                                "frame_index": self.frame_index,
+                                "speed": self.speed.speeds.get(bbox_id),
+                                "bbox": boxes[bbox_id],
                             }
                         )
-                
-                if self.viz_mode in [1, 2]:
-                    points = np.hstack(track["track"]).astype(np.int32).reshape((-1, 1, 2))
-                    cv2.polylines(
-                        frame,
-                        [points],
-                        isClosed=False,
-                        color=(0, 250, 250),
-                        thickness=2,
-                        lineType=cv2.LINE_AA,
-                    )
+        self.od.update(track_ids, self.frame_index)
+
+    def countZones(self, ids, xyxy, lines: dict, frame_time: str, callback: callable):
+        zones = {k: l for k, l in lines.items() if l.get("type") == "zone"}
+        if self.frame_shape is None:
+            return
+        self.zones.step(
+            ids, xyxy, zones, self.frame_shape, self.frame_index, self.secondsPerFrame(),
+            frame_time, self.track_history, callback,
+        )
+
+    def drawDetections(self, frame: np.ndarray, ids, xyxy, cls) -> np.ndarray:
+        # Visualize the results on the frame, in place
+        if self.viz_mode == VIZ_NONE:
+            return frame
+        if self.viz_mode == VIZ_HEATMAP:
+            return self.heatmap.render(frame)
+        tracks = []
+        if self.viz_mode in [VIZ_TRACK, VIZ_BBOX_TRACK]:
+            tracks = [self.track_history[int(i)]["track"] for i in ids if int(i) in self.track_history]
+        return self.renderer.render(frame, self.viz_mode, ids, xyxy, cls, self.names, tracks)
+
+    def detectAndTracePath(
+        self, frame: np.ndarray, lines: list[dict], frame_time: str, callback: callable
+    ) -> np.ndarray:
+        
+
+        if self.model is None:
+            return frame
+
+        self.frame_shape = frame.shape
+        if not self.__needsInference(frame, lines):
+            # static scene, the tracker and the counters keep their state
+            ids, xyxy, cls, conf = self.last_boxes
+            if self.track_cache is not None:
+                self.track_cache.append(ids, xyxy, cls, conf)
+            # vehicles standing still are what the heatmap is after
+            self.heatmap.add(xyxy, frame.shape, self.frame_index * self.secondsPerFrame())
+            frame = self.drawDetections(frame, ids, xyxy, cls)
+            self.frame_index += 1
+            return frame
+
+        if self.snapshots is not None:
+            callback = self.__withSnapshot(frame, callback)
+
+        start = time.perf_counter()
+        results, (ids, xyxy, cls, conf) = self.trackFrame(frame, lines)
+        if self.motion_gate is not None and results is not None:
+            self.motion_gate.recordInference(time.perf_counter() - start)
+        self.last_boxes = ids, xyxy, cls, conf
+        self.trajectories.append(self.frame_index, ids, xyxy, cls)
+        self.heatmap.add(xyxy, frame.shape, self.frame_index * self.secondsPerFrame())
+        self.countCrossings(ids, xyxy, cls, lines, frame_time, callback)
+        self.countZones(ids, xyxy, lines, frame_time, callback)
+        frame = self.drawDetections(frame, ids, xyxy, cls)
+        self.frame_index += 1
 
         return frame
 
+    def __withSnapshot(self, frame: np.ndarray, callback: callable) -> callable:
+        # crossings get the path of their crop, taken before the frame is drawn on
+        def snapshotCallback(event):
+            if event.get("type") is None:
+                event["snapshot"] = self.snapshots.submit(frame, event)
+            callback(event)
+        return snapshotCallback
+
+    def __needsInference(self, frame: np.ndarray, lines: dict) -> bool:
+        if self.motion_gate is None or self.last_boxes is None:
+            return True
+        if self.track_cache is not None and self.track_cache.isComplete:
+            # cached boxes are cheaper than the motion check
+            return True
+        return self.motion_gate.shouldInfer(frame, lines)
+
+    def recountTrajectories(self, lines: dict, older: list = ()) -> list:
+        # re-evaluate the retained trajectories against the current lines, `older` are the crossings
+        # before the retained window, they stay as they are and their tracks are not counted again
+        events = self.trajectories.recount(
+            {k: l for k, l in lines.items() if l.get("type", "line") == "line"}, speed_window=self.speed.window
+        )
+        counted = {(str(e["line_id"]), int(e["track_id"])) for e in older}
+        events = [e for e in events if (str(e["line_id"]), e["track_id"]) not in counted]
+        for event in events:
+            event["vechile"] = self.names.get(event.pop("cls"), "unknown")
+            event["crossing_time"] = self.frameTime(event["frame_index"])
+        self.__retroSpeeds(events)
+
+        # crossing sequences from the recount, live tracks are not counted a second time on a line
+        self.od.rebuild(list(older) + events, set(self.track_history))
+        return events
+
+    def __retroSpeeds(self, events: list):
+        speed_points = [event.pop("speed_points") for event in events]
+        speed_frames = np.array([event.pop("speed_frames") for event in events], dtype=np.float64)
+        if not events or not self.speed.isCalibrated or not self.secondsPerFrame():
+            return
+        ground = self.speed.toGround(np.asarray(speed_points, dtype=np.float64).reshape(-1, 2)).reshape(-1, 2, 2)
+        distance = np.linalg.norm(ground[:, 1] - ground[:, 0], axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            speed = distance / (speed_frames * self.secondsPerFrame()) * 3.6
+        for event, value in zip(events, speed):
+            event["speed"] = round(float(value), 1) if np.isfinite(value) else None
+
+    def recountFromCache(self, lines: dict, callback: callable):
+        # counting stage only, tracked boxes come from a complete cache
+        if self.track_cache is None or not self.track_cache.isComplete:
+            raise Exception("no complete track cache for this video")
+
+        live_state = self.track_history, self.frame_index, self.zones
+        self.track_history = defaultdict(lambda: {"track": [], "name": [], "frame": []})
+        self.zones = ZoneCounter()
+        # the recount replaces the origin-destination counts of the video
+        self.od = ODMatrix(self.od.ttl)
+        try:
+            for index in range(self.track_cache.numFrames):
+                ids, xyxy, cls, _ = self.track_cache.frame(index)
+                self.frame_index = index
+                self.countCrossings(ids, xyxy, cls, lines, self.frameTime(index), callback)
+                self.countZones(ids, xyxy, lines, self.frameTime(index), callback)
+        finally:
+            self.track_history, self.frame_index, self.zones = live_state
+            self.od.finishAll()
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import json
+import logging
+import os
+from collections import Counter
+
+import numpy as np
+
+from gui.model.autotune import configGrid, defaultGrid
+from gui.model.decoder import openDecoder
+from gui.model.pipeline import runClip
+from gui.model.tracker import assignPairs
+
+
+def loadAnnotations(path: str) -> dict:
+    """
+    Ground truth crossings of one video.
+
+        {
+            "video": "clip.mp4",                      relative to the annotation file
+            "lines": {"north": [[x, y], [x, y]]},     frame pixels, like --lines files
+            "crossings": [
+                {"line": "north", "class": "car", "direction": "Forward", "start": 12.0, "end": 13.5}
+            ]
+        }
+
+    start / end is the window in video seconds in which the vehicle crosses, class and
+    direction are optional and only scored where given.
+    """
+    with open(path) as file:
+        data = json.load(file)
+    video = data["video"]
+    if not os.path.isabs(video):
+        video = os.path.join(os.path.dirname(os.path.abspath(path)), video)
+    crossings = [
+        {
+            "line": str(c["line"]),
+            "class": c.get("class"),
+            "direction": c.get("direction"),
+            "start": float(c["start"]),
+            "end": float(c.get("end", c["start"])),
+        }
+        for c in data["crossings"]
+    ]
+    return {
+        "path": path,
+        "video": video,
+        "lines": {str(k): {"geometry": [tuple(p) for p in v], "type": "line"} for k, v in data["lines"].items()},
+        "crossings": crossings,
+    }
+
+
+def matchCrossings(truth: list, predicted: list, slack: float = 0.5) -> Counter:
+    # one to one matching per line, a counted crossing matches an annotated one when its time
+    # is inside the window widened by `slack` seconds, ties go to the pair agreeing on class and direction
+    totals = Counter(truth=len(truth), predicted=len(predicted))
+    for line in {c["line"] for c in truth} & {p["line"] for p in predicted}:
+        line_truth = [c for c in truth if c["line"] == line]
+        line_predicted = [p for p in predicted if p["line"] == line]
+        score = np.zeros((len(line_truth), len(line_predicted)))
+        for i, crossing in enumerate(line_truth):
+            for j, counted in enumerate(line_predicted):
+                outside = max(crossing["start"] - counted["time"], counted["time"] - crossing["end"], 0)
+                if outside > slack:
+                    continue
+                score[i, j] = (
+                    1 - 0.5 * outside / max(slack, 1e-6)
+                    + 0.01 * (crossing["class"] == counted["class"])
+                    + 0.01 * (crossing["direction"] == counted["direction"])
+                )
+        rows, cols = assignPairs(score, 1e-6, "hungarian")
+        for i, j in zip(rows, cols):
+            crossing, counted = line_truth[i], line_predicted[j]
+            totals["matched"] += 1
+            if crossing["direction"] is not None:
+                totals["direction_annotated"] += 1
+                totals["direction_correct"] += crossing["direction"] == counted["direction"]
+            if crossing["class"] is not None:
+                totals["class_annotated"] += 1
+                totals["class_correct"] += crossing["class"] == counted["class"]
+    return totals
+
+
+def crossingScores(totals: Counter) -> dict:
+    matched = totals["matched"]
+    precision = matched / totals["predicted"] if totals["predicted"] else 1.0
+    recall = matched / totals["truth"] if totals["truth"] else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if matched else float(totals["truth"] == totals["predicted"] == 0)
+    return {
+        "truth": totals["truth"],
+        "counted": totals["predicted"],
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(f1, 4),
+        "direction_accuracy": round(totals["direction_correct"] / totals["direction_annotated"], 4) if totals["direction_annotated"] else None,
+        "class_accuracy": round(totals["class_correct"] / totals["class_annotated"], 4) if totals["class_annotated"] else None,
+    }
+
+
+def countedCrossings(run: dict, stride: int, fps: float) -> list:
+    # crossing events of a runClip result with their time in video seconds
+    return [
+        {
+            "line": str(event["line_id"]),
+            "class": event["vechile"],
+            "direction": event["direction"],
+            "time": event["frame_index"] * stride / fps,
+        }
+        for event in run["events"]
+        if event.get("type") is None
+    ]
+
+
+def evaluate(
+    detector_factory: callable,
+    annotations: list,
+    configs: list,
+    slack: float = 0.5,
+    frames: int = None,
+    progress: callable = None,
+) -> list:
+    """
+    Runs every annotated video under every configuration and returns one row per configuration
+    with its fps (source frames per second over all videos, decode included) and the crossing
+    precision, recall, F1, direction and class accuracy over all videos.
+
+    With `frames` only the start of each video is run and scored.
+    """
+    results = []
+    for index, config in enumerate(configs):
+        totals = Counter()
+        covered, elapsed = 0, 0.0
+        try:
+            for annotation in annotations:
+                detector = detector_factory(config)
+                decoder = openDecoder(annotation["video"], "opencv")
+                fps = decoder.fps or 25.0
+                detector.setFps(fps)
+                run = runClip(detector, annotation["video"], annotation["lines"], frames, decoder)
+                truth = annotation["crossings"]
+                if frames is not None:
+                    truth = [c for c in truth if c["start"] < run["source_frames"] / fps]
+                totals.update(matchCrossings(truth, countedCrossings(run, detector.frame_stride, fps), slack))
+                covered += run["source_frames"]
+                elapsed += run["source_frames"] / run["fps"] if run["fps"] else 0
+        except Exception as e:
+            logging.warning(f'evaluation skipped {config} : {e}')
+            continue
+        row = {**config, "fps": round(covered / elapsed, 2) if elapsed else 0, **crossingScores(totals)}
+        results.append(row)
+        logging.info(f'evaluation {index + 1}/{len(configs)} : {config}, fps {row["fps"]}, f1 {row["f1"]}')
+        if progress is not None:
+            progress(index + 1, len(configs))
+    return results
+
+
+def paretoFront(results: list, objectives: tuple = ("fps", "f1")) -> list:
+    # the results no other result matches or beats on every objective (higher is better), fastest first
+    def dominates(a, b):
+        return all(a[k] >= b[k] for k in objectives) and any(a[k] > b[k] for k in objectives)
+
+    front = [r for r in results if not any(dominates(other, r) for other in results)]
+    return sorted(front, key=lambda r: -r[objectives[0]])
+
+
+def loadConfigs(path: str) -> list:
+    # a list of configurations, or a grid {"key": [values]} expanded to every combination
+    with open(path) as file:
+        data = json.load(file)
+    return configGrid(data) if isinstance(data, dict) else data
+
+
+if __name__ == "__main__":
+    from gui import MODELS_PATH
+    from gui.model.detection import Detection
+    from gui.model.renderer import VIZ_NONE
+
+    parser = argparse.ArgumentParser(description="count accuracy against throughput for a set of configurations")
+    parser.add_argument("annotations", nargs="+", help="ground truth json files, one per video")
+    parser.add_argument("--configs", default=None, help="json list of configurations or a grid, default is the autotune grid")
+    parser.add_argument("--model", default=os.path.join(MODELS_PATH, "yolov8n.pt"))
+    parser.add_argument("--slack", type=float, default=0.5, help="seconds a counted crossing may fall outside its window")
+    parser.add_argument("--frames", type=int, default=None, help="only run the first frames of every video")
+    parser.add_argument("--objectives", default="fps,f1", help="comma separated columns of the pareto set")
+    parser.add_argument("--output", default=None, help="csv file with every result")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    configs = loadConfigs(args.configs) if args.configs else configGrid(defaultGrid(args.model))
+
+    def factory(config):
+        detector = Detection(device=args.device, viz_mode=VIZ_NONE)
+        detector.configure({"model": args.model, **config})
+        return detector
+
+    results = evaluate(factory, [loadAnnotations(p) for p in args.annotations], configs, args.slack, args.frames)
+    for result in sorted(results, key=lambda r: -r["fps"]):
+        print({k: v for k, v in result.items() if k not in ("truth", "counted")})
+    print("\npareto set :")
+    for result in paretoFront(results, tuple(args.objectives.split(","))):
+        print({k: v for k, v in result.items() if k not in ("truth", "counted", "model")})
+    if args.output and results:
+        keys = list(dict.fromkeys(k for r in results for k in r))
+        with open(args.output, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=keys)
+            writer.writeheader()
+            writer.writerows(results)
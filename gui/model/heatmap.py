@@ -0,0 +1,138 @@
+import logging
+
+import cv2
+import numpy as np
+
+
+# what a tracked box adds to the grid
+HEATMAP_CENTROID, HEATMAP_FOOTPRINT = "centroid", "footprint"
+
+
+class DensityHeatmap:
+    """
+    Where vehicles drive and stop, accumulated on a grid of `cell` x `cell` pixel cells.
+
+    Every processed frame adds its boxes with one scatter-add: the bottom centre of a box
+    (`HEATMAP_CENTROID`) lands in one cell, a footprint adds its four corners to a difference
+    grid that a double cumulative sum turns into the covered cells. Stopped vehicles are
+    added on every frame they stand, so queues show up as the hot spots.
+
+    With `half_life` (seconds) older frames fade out for a live view. The decay is lazy:
+    the grid keeps values in the units of a reference time and only the scale of a new
+    frame changes, the grid itself is rescaled once the scale gets small. Memory and the
+    saved file only depend on the frame size, never on how long the video is.
+    """
+
+    def __init__(self, cell: int = 8, half_life: float = None, mode: str = HEATMAP_CENTROID) -> None:
+        self.cell = cell
+        self.half_life = half_life
+        self.mode = mode
+        self.reset()
+
+    def reset(self):
+        self.frame_shape = None
+        self.grid = None
+        # values are grid * 0.5 ** ((time - reference) / half_life), set by the first frame
+        self.reference = None
+        self.time = 0.0
+        self.frames = 0
+
+    def setHalfLife(self, half_life: float):
+        # bakes the decay so far into the grid before the rate changes
+        if self.grid is not None:
+            self.grid = self.values()
+            self.reference = self.time
+        self.half_life = half_life
+
+    def __scale(self, time: float) -> float:
+        if not self.half_life or self.reference is None:
+            return 1.0
+        return 0.5 ** ((time - self.reference) / self.half_life)
+
+    def __allocate(self, frame_shape: tuple):
+        height, width = frame_shape[:2]
+        self.frame_shape = (height, width)
+        self.grid = np.zeros((-(-height // self.cell), -(-width // self.cell)), dtype=np.float32)
+
+    def add(self, xyxy: np.ndarray, frame_shape: tuple, time: float = 0.0):
+        # adds one frame of boxes, `time` in seconds only matters with a half life
+        if self.grid is None or self.frame_shape != tuple(frame_shape[:2]):
+            if self.grid is not None:
+                logging.warning(f'heatmap of {self.frame_shape} started over for frames of {tuple(frame_shape[:2])}')
+            self.__allocate(frame_shape)
+        if self.reference is None:
+            self.reference = time
+        self.frames += 1
+        self.time = time
+        if len(xyxy) == 0:
+            return
+
+        scale = self.__scale(time)
+        if scale < 1e-6:
+            # the lazy decay is about to lose float precision, rescale the grid once
+            self.grid *= scale
+            self.reference = time
+            scale = 1.0
+        rows, columns = self.grid.shape
+        cells = np.asarray(xyxy, dtype=np.float32) / self.cell
+        if self.mode == HEATMAP_FOOTPRINT:
+            x1 = np.clip(cells[:, 0].astype(np.int64), 0, columns - 1)
+            y1 = np.clip(cells[:, 1].astype(np.int64), 0, rows - 1)
+            x2 = np.clip(np.ceil(cells[:, 2]).astype(np.int64), x1 + 1, columns)
+            y2 = np.clip(np.ceil(cells[:, 3]).astype(np.int64), y1 + 1, rows)
+            # +1 at the top left, -1 right of and below the box, +1 diagonally past it
+            flat = np.concatenate([y1 * (columns + 1) + x1, y1 * (columns + 1) + x2, y2 * (columns + 1) + x1, y2 * (columns + 1) + x2])
+            weights = np.repeat(np.array([1, -1, -1, 1], dtype=np.float64), len(cells))
+            steps = np.bincount(flat, weights, minlength=(rows + 1) * (columns + 1)).reshape(rows + 1, columns + 1)
+            self.grid += (steps.cumsum(axis=0).cumsum(axis=1)[:rows, :columns] / scale).astype(np.float32)
+        else:
+            # bottom centre, where the vehicle touches the road
+            x = np.clip(((cells[:, 0] + cells[:, 2]) / 2).astype(np.int64), 0, columns - 1)
+            y = np.clip(cells[:, 3].astype(np.int64), 0, rows - 1)
+            counts = np.bincount(y * columns + x, minlength=rows * columns).reshape(rows, columns)
+            self.grid += counts.astype(np.float32) / scale
+
+    def values(self) -> np.ndarray:
+        # the decayed grid at the time of the last frame
+        if self.grid is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.grid * np.float32(self.__scale(self.time))
+
+    def render(self, frame: np.ndarray, alpha: float = 0.6) -> np.ndarray:
+        # colour mapped overlay of the grid blended in place, cells never visited are left alone
+        values = self.values()
+        if values.size == 0 or values.max() <= 0:
+            return frame
+        # log scale, a queue is orders of magnitude above a lane driven through
+        levels = np.log1p(values)
+        levels = (255 * levels / levels.max()).astype(np.uint8)
+        height, width = frame.shape[:2]
+        colours = cv2.resize(cv2.applyColorMap(levels, cv2.COLORMAP_JET), (width, height), interpolation=cv2.INTER_LINEAR)
+        visited = cv2.resize((values > 0).astype(np.uint8), (width, height), interpolation=cv2.INTER_NEAREST).astype(bool)
+        frame[visited] = cv2.addWeighted(frame[visited], 1 - alpha, colours[visited], alpha, 0)
+        return frame
+
+    def save(self, path: str):
+        # compressed npz of the decayed grid and its layout, restore() continues from it
+        np.savez_compressed(
+            path,
+            grid=self.values(),
+            cell=self.cell,
+            frame_shape=np.array(self.frame_shape or (0, 0)),
+            mode=self.mode,
+            frames=self.frames,
+        )
+
+    def restore(self, path: str):
+        with np.load(path) as data:
+            grid = data["grid"].astype(np.float32)
+            if grid.size == 0:
+                raise Exception(f"empty heatmap file : {path}")
+            self.cell = int(data["cell"])
+            self.mode = str(data["mode"])
+            self.frame_shape = tuple(int(v) for v in data["frame_shape"])
+            self.frames = int(data["frames"])
+        self.grid = grid
+        # restored values are the current ones, the decay goes on from the next frame
+        self.reference = None
+        self.time = 0.0
@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+
+from gui.model.decoder import VideoDecoder, openDecoder
+
+
+class LiveSource(VideoDecoder):
+    """
+    Drains a live stream on a background thread and keeps only the newest frame.
+
+    read() hands out the freshest frame, frames overwritten before anyone read them are
+    counted as dropped. Errors and end of stream trigger a reconnect with exponential backoff.
+    """
+
+    name = "live"
+
+    def __init__(
+        self,
+        source: str,
+        backend: str = "auto",
+        size: tuple = None,
+        opener: callable = None,
+        read_timeout: float = 0.05,
+        min_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ) -> None:
+        super().__init__(source, size)
+        # opener returns a fresh VideoDecoder, tests pass a synthetic or file decoder here
+        self.opener = opener or (lambda: openDecoder(source, backend))
+        self.read_timeout = read_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_time = 0.0
+        self.frame_consumed = True
+        self.handed_time = None
+        self.running = False
+
+        # stats
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.handoff_lag = 0.0
+        self.end_to_end_lag = 0.0
+
+        self.decoder = self.__connect()
+        if self.decoder is None:
+            return
+        self.fps = self.decoder.fps
+        self.width, self.height = self.decoder.width, self.decoder.height
+        self.running = True
+        self.thread = threading.Thread(target=self.__drain, name="live-source", daemon=True)
+        self.thread.start()
+
+    def __connect(self):
+        try:
+            decoder = self.opener()
+        except Exception as e:
+            logging.warning(f'live source unable to connect : {self.source}, {e}')
+            return None
+        if not decoder.isOpened():
+            decoder.release()
+            return None
+        # a reconnect decodes at the size set last, not the one of the first connection
+        if self.size is not None:
+            decoder.setSize(self.size)
+        return decoder
+
+    def __drain(self):
+        backoff = self.min_backoff
+        while self.running:
+            if self.decoder is None:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                self.decoder = self.__connect()
+                if self.decoder is not None:
+                    logging.info(f'live source reconnected : {self.source}')
+                    backoff = self.min_backoff
+                continue
+
+            try:
+                ret, frame = self.decoder.read()
+            except Exception as e:
+                logging.warning(f'live source read error : {e}')
+                ret = False
+            if not ret:
+                logging.warning(f'live source lost : {self.source}, reconnecting in {backoff:.1f}s')
+                self.decoder.release()
+                self.decoder = None
+                self.reconnects += 1
+                continue
+
+            with self.condition:
+                if not self.frame_consumed:
+                    self.dropped += 1
+                self.frame = frame
+                self.frame_time = time.monotonic()
+                self.frame_consumed = False
+                self.received += 1
+                self.condition.notify_all()
+
+        if self.decoder is not None:
+            self.decoder.release()
+
+    def isOpened(self) -> bool:
+        return self.running
+
+    def setSize(self, size: tuple):
+        # the capture thread scales from its next frame on
+        self.size = size
+        decoder = self.decoder
+        if decoder is not None:
+            decoder.setSize(size)
+
+    @property
+    def outputSize(self) -> tuple:
+        # what the connected decoder delivers
+        decoder = self.decoder
+        return decoder.outputSize if decoder is not None else super().outputSize
+
+    def grab(self) -> bool:
+        with self.condition:
+            if self.frame_consumed:
+                self.condition.wait(self.read_timeout)
+            return self.running and not self.frame_consumed
+
+    def retrieve(self, out=None):
+        # frames come from the capture thread, out is ignored
+        with self.condition:
+            if self.frame_consumed:
+                return False, None
+            frame, captured = self.frame, self.frame_time
+            self.frame_consumed = True
+        self.handed_time = captured
+        self.handoff_lag = time.monotonic() - captured
+        return True, frame
+
+    def read(self, skip: int = 0, out=None):
+        # the freshest frame already skips everything in between
+        if not self.grab():
+            return False, None
+        return self.retrieve(out)
+
+    def markProcessed(self):
+        # called once the handed frame went through detection and display
+        if self.handed_time is None:
+            return
+        self.processed += 1
+        lag = time.monotonic() - self.handed_time
+        self.end_to_end_lag = lag if self.processed == 1 else 0.9 * self.end_to_end_lag + 0.1 * lag
+        self.handed_time = None
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "reconnects": self.reconnects,
+            "handoff_lag": round(self.handoff_lag, 3),
+            "end_to_end_lag": round(self.end_to_end_lag, 3),
+        }
+
+    def release(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+
+
+if __name__ == "__main__":
+    # a 30 fps synthetic camera read by a consumer that only manages ~10 fps
+    from gui.model.synthetic import SyntheticTrafficDecoder
+
+    logging.basicConfig(level=logging.INFO)
+    source = LiveSource("synthetic", opener=lambda: SyntheticTrafficDecoder(frames=150, realtime=True))
+    start = time.monotonic()
+    while time.monotonic() - start < 8:
+        ret, frame = source.read()
+        if not ret:
+            continue
+        time.sleep(0.1)
+        source.markProcessed()
+    source.release()
+    print(source.stats())
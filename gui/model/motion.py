@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap frame differencing on a downscaled frame in front of the model.
+
+    Motion is only looked for near the counting lines and inside zones (the whole frame when
+    there are none) and against the last frame the model saw, so slow vehicles add up until
+    they trigger it. Inference is skipped when the changed fraction of that area stays below
+    `min_fraction`, but never for more than `max_skip` frames in a row so the tracker keeps up.
+    """
+
+    def __init__(
+        self,
+        width: int = 160,
+        threshold: int = 20,
+        min_fraction: float = 0.002,
+        margin: int = 48,
+        max_skip: int = 30,
+    ) -> None:
+        self.width = width
+        self.threshold = threshold
+        self.min_fraction = min_fraction
+        # distance in frame pixels around lines that counts as "near"
+        self.margin = margin
+        self.max_skip = max_skip
+        self.reset()
+
+    def reset(self):
+        self.reference = None
+        self.roi = None
+        self.roi_key = None
+        self.consecutive = 0
+        self.skipped = 0
+        self.inferred = 0
+        self.inference_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def __roiMask(self, lines: dict, frame_shape: tuple, small_shape: tuple) -> np.ndarray:
+        key = (small_shape, tuple((k, tuple(map(tuple, l["geometry"])), l.get("type")) for k, l in lines.items()))
+        if key == self.roi_key:
+            return self.roi
+        height, width = small_shape
+        if not lines:
+            roi = np.full((height, width), 255, dtype=np.uint8)
+        else:
+            scale = width / frame_shape[1]
+            roi = np.zeros((height, width), dtype=np.uint8)
+            thickness = max(int(2 * self.margin * scale), 1)
+            for l in lines.values():
+                pts = np.round(np.asarray(l["geometry"]) * scale).astype(np.int32).reshape((-1, 1, 2))
+                is_zone = l.get("type") == "zone"
+                if is_zone:
+                    cv2.fillPoly(roi, [pts], 255)
+                cv2.polylines(roi, [pts], is_zone, 255, thickness)
+        self.roi, self.roi_key = roi, key
+        return roi
+
+    def shouldInfer(self, frame: np.ndarray, lines: dict) -> bool:
+        height = max(int(frame.shape[0] * self.width / frame.shape[1]), 1)
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+        if self.reference is None or self.consecutive >= self.max_skip:
+            return self.__infer(small)
+
+        roi = self.__roiMask(lines, frame.shape, small.shape[:2])
+        # largest channel difference, vehicles with the road's brightness still differ in colour
+        difference = cv2.absdiff(small, self.reference).max(axis=2)
+        moving = cv2.bitwise_and(cv2.threshold(difference, self.threshold, 255, cv2.THRESH_BINARY)[1], roi)
+        fraction = cv2.countNonZero(moving) / max(cv2.countNonZero(roi), 1)
+        if fraction >= self.min_fraction:
+            return self.__infer(small)
+
+        self.consecutive += 1
+        self.skipped += 1
+        self.saved_seconds += self.averageInference()
+        return False
+
+    def __infer(self, small: np.ndarray) -> bool:
+        self.reference = small
+        self.consecutive = 0
+        return True
+
+    def recordInference(self, seconds: float):
+        self.inferred += 1
+        self.inference_seconds += seconds
+
+    def averageInference(self) -> float:
+        return self.inference_seconds / self.inferred if self.inferred else 0.0
+
+    def stats(self) -> dict:
+        total = self.skipped + self.inferred
+        return {
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "skipped_ratio": round(self.skipped / total, 3) if total else 0,
+            "saved_seconds": round(self.saved_seconds, 2),
+        }
@@ -0,0 +1,104 @@
+import csv
+from collections import defaultdict
+
+import numpy as np
+
+
+class ODMatrix:
+    """
+    Origin-destination counts built from the ordered line crossings of every track.
+
+    record() appends (line index, direction, frame index) to the sequence of a track, line ids
+    are kept once in `line_ids`. A track unseen for more than `ttl` processed frames is
+    finished: the first line it crossed is its origin, the last one its destination (None when
+    it crossed a single line), the pair is added to the counts and the sequence is dropped, so
+    memory only grows with the live tracks. `version` changes with every finished track.
+    """
+
+    def __init__(self, ttl: int = 30) -> None:
+        self.ttl = ttl
+        self.reset()
+
+    def reset(self):
+        self.line_ids = []
+        self.line_index = {}
+        self.sequences = {}
+        self.last_seen = {}
+        # (origin, destination) -> vehicles
+        self.counts = defaultdict(int)
+        self.finished = 0
+        self.version = 0
+
+    def __lineIndex(self, line_id) -> int:
+        if line_id not in self.line_index:
+            self.line_index[line_id] = len(self.line_ids)
+            self.line_ids.append(line_id)
+        return self.line_index[line_id]
+
+    def hasCrossed(self, track_id: int, line_id) -> bool:
+        index = self.line_index.get(line_id)
+        return index is not None and any(step[0] == index for step in self.sequences.get(track_id, ()))
+
+    def record(self, track_id: int, line_id, direction: str, frame_index: int):
+        self.sequences.setdefault(track_id, []).append((self.__lineIndex(line_id), direction, frame_index))
+        self.last_seen[track_id] = max(self.last_seen.get(track_id, frame_index), frame_index)
+
+    def sequence(self, track_id: int) -> list:
+        # [(line id, direction, frame index), ...] of a live track, in crossing order
+        return [(self.line_ids[index], direction, frame) for index, direction, frame in self.sequences.get(track_id, ())]
+
+    def __finish(self, track_id: int):
+        steps = self.sequences.pop(track_id, None)
+        self.last_seen.pop(track_id, None)
+        if not steps:
+            return
+        origin = self.line_ids[steps[0][0]]
+        destination = self.line_ids[steps[-1][0]] if len(steps) > 1 else None
+        self.counts[(origin, destination)] += 1
+        self.finished += 1
+        self.version += 1
+
+    def update(self, track_ids, frame_index: int) -> int:
+        # marks the tracks of this frame as seen and finishes the expired ones, returns how many finished
+        for track_id in track_ids:
+            if track_id in self.sequences:
+                self.last_seen[track_id] = frame_index
+        expired = [t for t, seen in self.last_seen.items() if frame_index - seen > self.ttl]
+        for track_id in expired:
+            self.__finish(track_id)
+        return len(expired)
+
+    def finishAll(self):
+        # end of the video or a tracker reset, track ids start over
+        for track_id in list(self.sequences):
+            self.__finish(track_id)
+
+    def rebuild(self, events: list, live_track_ids: set = ()):
+        # from crossing events (track_id, line_id, direction, frame_index), live tracks stay open
+        self.reset()
+        for event in sorted(events, key=lambda e: e["frame_index"]):
+            self.record(event["track_id"], event["line_id"], event["direction"], event["frame_index"])
+        for track_id in list(self.sequences):
+            if track_id not in live_track_ids:
+                self.__finish(track_id)
+        self.version += 1
+
+    def matrix(self) -> tuple:
+        # (origins, destinations, counts[origin, destination]), destination None is "no exit line"
+        origins = [line_id for line_id in self.line_ids if any(o == line_id for o, _ in self.counts)]
+        destinations = [line_id for line_id in self.line_ids if any(d == line_id for _, d in self.counts)]
+        if any(d is None for _, d in self.counts):
+            destinations.append(None)
+        counts = np.zeros((len(origins), len(destinations)), dtype=np.int64)
+        for (origin, destination), count in self.counts.items():
+            counts[origins.index(origin), destinations.index(destination)] = count
+        return origins, destinations, counts
+
+    def export(self, path: str):
+        # origins as rows, destinations as columns
+        origins, destinations, counts = self.matrix()
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["origin \\ destination"] + ["none" if d is None else str(d) for d in destinations] + ["total"])
+            for origin, row in zip(origins, counts):
+                writer.writerow([str(origin)] + row.tolist() + [int(row.sum())])
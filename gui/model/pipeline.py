@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+
+from gui.model.decoder import openDecoder
+from gui.utils.utils import boxIou
+
+
+def runClip(detector, video_path: str, lines: dict, frames: int = None, decoder=None) -> dict:
+    """
+    Headless run of a video (or an already opened decoder) through `detector`.
+
+    Processed frames are source frames 0, stride, 2 * stride, ... so runs with different
+    strides can be compared frame by frame. fps is source frames covered per second,
+    decode included.
+    """
+    decoder = decoder or openDecoder(video_path, "opencv")
+    stride = detector.frame_stride
+    events, boxes = [], {}
+    source_index = 0
+    start = time.perf_counter()
+    while frames is None or source_index < frames:
+        ret, frame = decoder.read(skip=stride - 1 if boxes else 0)
+        if not ret:
+            break
+        if boxes:
+            source_index += stride
+        detector.detectAndTracePath(frame, lines, detector.frameTime(detector.frame_index), events.append)
+        _, xyxy, cls, _ = detector.last_boxes
+        boxes[source_index] = (xyxy, cls)
+    elapsed = time.perf_counter() - start
+    decoder.release()
+
+    counts = {}
+    for event in events:
+        if event.get("type") is None:
+            counts[event["line_id"]] = counts.get(event["line_id"], 0) + 1
+    covered = source_index + 1 if boxes else 0
+    return {
+        "fps": round(covered / elapsed, 2) if elapsed else 0,
+        "processed": len(boxes),
+        "source_frames": covered,
+        "events": events,
+        "boxes": boxes,
+        "counts": counts,
+    }
+
+
+def matchDetections(reference: tuple, candidate: tuple, iou_threshold: float = 0.5) -> tuple:
+    # greedy same class IoU matching, returns (matched, reference count, candidate count)
+    ref_xyxy, ref_cls = reference
+    cand_xyxy, cand_cls = candidate
+    if len(ref_xyxy) == 0 or len(cand_xyxy) == 0:
+        return 0, len(ref_xyxy), len(cand_xyxy)
+    iou = boxIou(ref_xyxy, cand_xyxy)
+    iou[ref_cls[:, None] != cand_cls[None, :]] = 0
+    matched = 0
+    for flat in np.argsort(-iou, axis=None):
+        i, j = np.unravel_index(flat, iou.shape)
+        if iou[i, j] < iou_threshold:
+            break
+        matched += 1
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return matched, len(ref_xyxy), len(cand_xyxy)
+
+
+def clipAgreement(reference: dict, run: dict) -> dict:
+    # detection F1 on the frames both runs processed and per line count agreement
+    matched = reference_total = candidate_total = 0
+    for index, candidate in run["boxes"].items():
+        if index not in reference["boxes"]:
+            continue
+        m, r, c = matchDetections(reference["boxes"][index], candidate)
+        matched, reference_total, candidate_total = matched + m, reference_total + r, candidate_total + c
+    precision = matched / candidate_total if candidate_total else 1.0
+    recall = matched / reference_total if reference_total else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if matched else float(reference_total == candidate_total == 0)
+
+    line_ids = set(reference["counts"]) | set(run["counts"])
+    errors = sum(abs(run["counts"].get(k, 0) - reference["counts"].get(k, 0)) for k in line_ids)
+    reference_count = sum(reference["counts"].values())
+    return {
+        "detection_f1": round(f1, 4),
+        "count_agreement": round(max(1 - errors / reference_count, 0), 4) if reference_count else None,
+        "reference_count": reference_count,
+        "count": sum(run["counts"].values()),
+    }
@@ -0,0 +1,108 @@
+import logging
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+
+from gui.model.decoder import openDecoder
+from gui.model.pipeline import clipAgreement, runClip
+
+
+PRECISIONS = ["fp32", "bf16", "int8-dynamic", "int8-static"]
+
+
+def bf16Supported() -> bool:
+    # native bf16 matmul/conv on this CPU (avx512_bf16 / amx), otherwise autocast only emulates it slowly
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def letterbox(frame: np.ndarray, imgsz: int) -> np.ndarray:
+    # same preprocessing the exported model expects, 1x3ximgszximgsz float in [0, 1]
+    height, width = frame.shape[:2]
+    scale = imgsz / max(height, width)
+    resized = cv2.resize(frame, (int(round(width * scale)), int(round(height * scale))))
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - resized.shape[0]) // 2, (imgsz - resized.shape[1]) // 2
+    canvas[top: top + resized.shape[0], left: left + resized.shape[1]] = resized
+    return np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255
+
+
+class CalibrationReader:
+    # feeds letterboxed frames of a video to onnxruntime static quantization
+
+    def __init__(self, input_name: str, video_path: str, imgsz: int, frames: int = 64) -> None:
+        self.samples = []
+        decoder = openDecoder(video_path, "opencv")
+        stride = max(decoder.frame_count // frames, 1) if decoder.frame_count else 1
+        while len(self.samples) < frames:
+            ret, frame = decoder.read(skip=stride - 1)
+            if not ret:
+                break
+            self.samples.append({input_name: letterbox(frame, imgsz)})
+        decoder.release()
+        self.iterator = iter(self.samples)
+
+    def get_next(self):
+        return next(self.iterator, None)
+
+    def rewind(self):
+        self.iterator = iter(self.samples)
+
+
+def quantizedModelPath(model_path: str, precision: str, imgsz: int = 640, calibration_video: str = None) -> str:
+    """
+    Exports the model to ONNX and quantizes the weights (int8-dynamic) or weights and
+    activations (int8-static, calibrated on frames of `calibration_video`) with onnxruntime.
+    The result is cached next to the .pt file and rebuilt when the .pt file is newer.
+    """
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from ultralytics import YOLO
+
+    source = Path(model_path)
+    target = source.with_name(f"{source.stem}.{imgsz}.{precision}.onnx")
+    if target.exists() and target.stat().st_mtime >= source.stat().st_mtime:
+        return str(target)
+
+    logging.info(f'exporting {source.name} to onnx for {precision} quantization')
+    exported = Path(YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=False, simplify=True))
+    if precision == "int8-dynamic":
+        quantize_dynamic(str(exported), str(target), weight_type=QuantType.QUInt8)
+    elif precision == "int8-static":
+        if calibration_video is None:
+            raise Exception("static int8 quantization needs a calibration video")
+        import onnx
+
+        input_name = onnx.load(str(exported)).graph.input[0].name
+        reader = CalibrationReader(input_name, calibration_video, imgsz)
+        quantize_static(
+            str(exported), str(target), reader,
+            quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8, calibrate_method=CalibrationMethod.MinMax,
+        )
+    else:
+        raise Exception(f"{precision} is not an onnx precision")
+    logging.info(f'quantized model cached at : {target}')
+    return str(target)
+
+
+def compareWithFp32(detector_factory: callable, precision: str, video_path: str, lines: dict, frames: int = 300) -> dict:
+    """
+    Runs the same frames through an fp32 detector and a `precision` detector and reports
+    detection agreement (IoU >= 0.5 same class F1), per line count agreement and fps of both.
+    """
+    reference = runClip(detector_factory("fp32"), video_path, lines, frames)
+    run = runClip(detector_factory(precision), video_path, lines, frames)
+    agreement = clipAgreement(reference, run)
+    return {
+        "fp32_fps": reference["fps"],
+        f"{precision}_fps": run["fps"],
+        "speedup": round(run["fps"] / reference["fps"], 2) if reference["fps"] else 0,
+        "detection_f1": agreement["detection_f1"],
+        "fp32_count": agreement["reference_count"],
+        f"{precision}_count": agreement["count"],
+        "count_agreement": agreement["count_agreement"],
+    }
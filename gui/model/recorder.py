@@ -0,0 +1,154 @@
+import logging
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+RECORD_POLICIES = ["drop", "block"]
+# name -> (scale, fps divisor)
+RECORD_PRESETS = {
+    "full size": (1.0, 1),
+    "half size": (0.5, 1),
+    "half size, half fps": (0.5, 2),
+}
+
+
+class VideoRecorder:
+    """
+    Writes annotated frames to a video file on its own thread.
+
+    submit() only copies (or downscales) the frame into a bounded queue. When the encoder falls
+    behind, "drop" skips the new frame and "block" waits for room, slowing the frame loop down
+    to the encoder speed. fps_divisor keeps every n-th submitted frame and lowers the output
+    fps to match, scale shrinks the output frames.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fps: float,
+        scale: float = 1.0,
+        fps_divisor: int = 1,
+        policy: str = "drop",
+        queue_size: int = 64,
+        fourcc: str = "mp4v",
+    ) -> None:
+        if policy not in RECORD_POLICIES:
+            raise Exception(f"unknown recording policy : {policy}")
+        self.path = path
+        self.fps_divisor = max(int(fps_divisor), 1)
+        self.fps = (fps or 25.0) / self.fps_divisor
+        self.scale = scale
+        self.policy = policy
+        self.fourcc = fourcc
+        self.queue = queue.Queue(queue_size)
+        self.writer = None
+        self.size = None
+
+        # stats
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.max_queued = 0
+        self.lag = 0.0
+        self.encode_seconds = 0.0
+        self.error = None
+
+        self.thread = threading.Thread(target=self.__encode, name="video-recorder", daemon=True)
+        self.thread.start()
+
+    def __outputSize(self, frame: np.ndarray) -> tuple:
+        height, width = frame.shape[:2]
+        # even sizes, most codecs refuse odd ones
+        return max(int(width * self.scale) // 2 * 2, 2), max(int(height * self.scale) // 2 * 2, 2)
+
+    def submit(self, frame: np.ndarray) -> bool:
+        # returns False when the frame was left out of the recording
+        self.submitted += 1
+        if (self.submitted - 1) % self.fps_divisor or self.error is not None:
+            return False
+        if self.size is None:
+            self.size = self.__outputSize(frame)
+        # the caller keeps drawing into its frame, the queue needs its own pixels
+        if self.size != frame.shape[1::-1]:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        else:
+            frame = frame.copy()
+
+        item = (frame, time.monotonic())
+        if self.policy == "block":
+            self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        self.max_queued = max(self.max_queued, self.queue.qsize())
+        return True
+
+    def __encode(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame, submitted = item
+            if self.error is not None:
+                # keep draining so a blocked submit() never waits on a dead encoder
+                continue
+            start = time.monotonic()
+            try:
+                if self.writer is None:
+                    self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self.size)
+                    if not self.writer.isOpened():
+                        raise Exception(f"unable to open video writer : {self.path}")
+                self.writer.write(frame)
+            except Exception as e:
+                self.error = e
+                logging.error(f'recording stopped : {e}')
+                continue
+            done = time.monotonic()
+            self.encode_seconds += done - start
+            self.written += 1
+            # time from submit to encoded, smoothed
+            lag = done - submitted
+            self.lag = lag if self.written == 1 else 0.9 * self.lag + 0.1 * lag
+        if self.writer is not None:
+            self.writer.release()
+
+    def stats(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+            "max_queued": self.max_queued,
+            "encoder_lag": round(self.lag, 3),
+            "encode_ms": round(1000 * self.encode_seconds / self.written, 2) if self.written else 0,
+        }
+
+    def close(self) -> dict:
+        # waits until every queued frame is encoded
+        self.queue.put(None)
+        self.thread.join()
+        return self.stats()
+
+
+if __name__ == "__main__":
+    # an encoder slower than the frame loop, with both policies
+    from gui.model.synthetic import SyntheticTrafficDecoder
+
+    for policy in RECORD_POLICIES:
+        decoder = SyntheticTrafficDecoder(frames=300)
+        recorder = VideoRecorder(f"recording_{policy}.mp4", decoder.fps, policy=policy, queue_size=16)
+        start = time.perf_counter()
+        while True:
+            ret, frame = decoder.read()
+            if not ret:
+                break
+            recorder.submit(frame)
+        loop_fps = 300 / (time.perf_counter() - start)
+        print(policy, f"loop {loop_fps:.1f} fps", recorder.close())
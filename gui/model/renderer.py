@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+
+
+# indices of the visualization combo box
+VIZ_BBOX, VIZ_TRACK, VIZ_BBOX_TRACK, VIZ_NONE, VIZ_HEATMAP = 0, 1, 2, 3, 4
+VIZ_MODES = ["bbox", "Track", "bbox with track", "None", "Heatmap"]
+
+# BGR palette, one colour per class id
+PALETTE = np.array(
+    [
+        (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+        (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0),
+        (168, 153, 44), (255, 194, 0), (147, 69, 52), (255, 115, 100), (236, 24, 0),
+        (255, 56, 132), (133, 0, 82), (255, 56, 203), (200, 149, 255), (199, 55, 255),
+    ],
+    dtype=np.uint8,
+)
+
+
+class OverlayRenderer:
+    # draws boxes, labels and track polylines in place, only what the viz mode needs
+
+    def __init__(self, line_width: int = 2, font_scale: float = 0.5, max_glyphs: int = 1024) -> None:
+        self.line_width = line_width
+        self.font_scale = font_scale
+        self.max_glyphs = max_glyphs
+        # label text -> pre rendered label patch
+        self.glyphs = {}
+
+    def colour(self, class_id: int) -> tuple:
+        return tuple(int(c) for c in PALETTE[int(class_id) % len(PALETTE)])
+
+    def glyph(self, text: str, class_id: int) -> np.ndarray:
+        key = (text, int(class_id))
+        patch = self.glyphs.get(key)
+        if patch is None:
+            if len(self.glyphs) >= self.max_glyphs:
+                self.glyphs.clear()
+            (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, self.font_scale, 1)
+            patch = np.empty((h + baseline + 2, w + 2, 3), dtype=np.uint8)
+            patch[:] = self.colour(class_id)
+            cv2.putText(patch, text, (1, h + 1), cv2.FONT_HERSHEY_SIMPLEX, self.font_scale, (255, 255, 255), 1, cv2.LINE_AA)
+            self.glyphs[key] = patch
+        return patch
+
+    def drawBoxes(self, frame: np.ndarray, ids, xyxy, cls, names: dict):
+        if len(xyxy) == 0:
+            return
+        boxes = xyxy.astype(np.int32)
+        # 4 corner polygons, one polylines call per class colour
+        corners = np.stack(
+            [boxes[:, [0, 1]], boxes[:, [2, 1]], boxes[:, [2, 3]], boxes[:, [0, 3]]], axis=1
+        ).reshape(-1, 4, 1, 2)
+        for class_id in np.unique(cls):
+            selected = np.flatnonzero(cls == class_id)
+            cv2.polylines(frame, list(corners[selected]), True, self.colour(class_id), self.line_width)
+
+        height, width = frame.shape[:2]
+        for bbox_id, (x1, y1, _, _), class_id in zip(ids, boxes, cls):
+            label = names.get(int(class_id), str(class_id))
+            if bbox_id >= 0:
+                label = f"id:{bbox_id} {label}"
+            patch = self.glyph(label, class_id)
+            # label sits above the box, clipped to the frame
+            top = max(y1 - patch.shape[0], 0)
+            left = min(max(x1, 0), width - 1)
+            bottom = min(top + patch.shape[0], height)
+            right = min(left + patch.shape[1], width)
+            frame[top:bottom, left:right] = patch[: bottom - top, : right - left]
+
+    def drawTracks(self, frame: np.ndarray, tracks: list, colour: tuple = (0, 250, 250)):
+        polylines = [np.asarray(t, dtype=np.int32).reshape(-1, 1, 2) for t in tracks if len(t) > 1]
+        if polylines:
+            cv2.polylines(frame, polylines, False, colour, self.line_width, lineType=cv2.LINE_AA)
+
+    def render(self, frame: np.ndarray, viz_mode: int, ids, xyxy, cls, names: dict, tracks: list) -> np.ndarray:
+        if viz_mode == VIZ_NONE:
+            return frame
+        if viz_mode in [VIZ_BBOX, VIZ_BBOX_TRACK]:
+            self.drawBoxes(frame, ids, xyxy, cls, names)
+        if viz_mode in [VIZ_TRACK, VIZ_BBOX_TRACK]:
+            self.drawTracks(frame, tracks)
+        return frame
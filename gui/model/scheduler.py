@@ -0,0 +1,308 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from gui.model.aggregates import CountAggregator
+from gui.model.renderer import VIZ_NONE
+from gui.utils.utils import formatTime
+
+
+# degradation levels, each one keeps the cuts of the ones before it
+# (name, rendering, stride multiplier, input size or None for the source's own)
+LEVELS = [
+    ("full", True, 1, None),
+    ("no render", False, 1, None),
+    ("stride x2", False, 2, None),
+    ("stride x2, 480 px", False, 2, 480),
+    ("stride x4, 320 px", False, 4, 320),
+]
+
+
+class ScheduledSource:
+    """
+    One source of a Scheduler with its own Detection, lines and service targets.
+
+    `target_fps` is the source frame rate to keep up with (0 uses the source fps),
+    `latency_budget` the seconds a processed frame may finish after it was due. The settings
+    the detector has when it is added are level 0, degrade() and restore() move between LEVELS.
+    """
+
+    def __init__(self, name: str, detector, source, lines: dict, priority: int = 0, target_fps: float = 0, latency_budget: float = 0.5, callback: callable = None) -> None:
+        self.name = name
+        self.detector = detector
+        self.source = source
+        self.lines = lines
+        self.priority = priority
+        self.target_fps = target_fps or source.fps or 25.0
+        self.latency_budget = latency_budget
+        self.callback = callback
+        self.aggregates = CountAggregator()
+
+        self.stride = detector.frame_stride
+        self.imgsz = detector.imgsz
+        self.viz_mode = detector.viz_mode
+        self.level = 0
+        self.finished = False
+        # when the next processed frame is due on the scheduler clock
+        self.due = None
+
+        # stats of the current window
+        self.latencies = []
+        self.covered = 0
+        self.busy = 0.0
+        # totals
+        self.processed = 0
+        self.events = 0
+        self.degradations = 0
+        self.restores = 0
+        self.last_window = {}
+
+    @property
+    def isDegraded(self) -> bool:
+        return self.level > 0
+
+    @property
+    def canDegrade(self) -> bool:
+        return self.level < len(LEVELS) - 1
+
+    def apply(self, level: int):
+        name, render, stride_factor, imgsz = LEVELS[level]
+        self.level = level
+        self.detector.setFrameStride(self.stride * stride_factor)
+        self.detector.setVizMode(self.viz_mode if render else VIZ_NONE)
+        # exported models are built for one input size, only pytorch weights can shrink it
+        if self.detector.precision == "fp32":
+            self.detector.imgsz = min(self.imgsz, imgsz) if imgsz else self.imgsz
+
+    def degrade(self):
+        self.apply(self.level + 1)
+        # the backlog is forgiven, the next windows judge the new level on its own
+        self.due = max(self.due, time.monotonic())
+        self.degradations += 1
+        logging.info(f'scheduler degraded {self.name} to {LEVELS[self.level][0]}')
+
+    def restore(self):
+        self.apply(self.level - 1)
+        self.restores += 1
+        logging.info(f'scheduler restored {self.name} to {LEVELS[self.level][0]}')
+
+    def interval(self) -> float:
+        # seconds between processed frames at the current stride
+        return self.detector.frame_stride / self.target_fps
+
+    def __onEvent(self, event: dict):
+        event["source"] = self.name
+        self.events += 1
+        if event.get("type") is None:
+            self.aggregates.add(event)
+        if self.callback is not None:
+            self.callback(event)
+
+    def step(self, now: float) -> bool:
+        # processes the next frame, False when the source has ended
+        start = time.perf_counter()
+        is_live = self.source.name == "live"
+        ret, frame = self.source.read(skip=self.detector.frame_stride - 1)
+        if not ret and is_live and self.source.isOpened():
+            # no new frame from the stream yet, try again a frame later
+            self.due += 1 / self.target_fps
+            return True
+        if not ret:
+            self.finished = True
+            self.source.release()
+            return False
+        if is_live:
+            frame_time = time.strftime("%H:%M:%S")
+        else:
+            # from the source position, the stride may have changed since the start
+            frame_time = formatTime(max(self.source.next_index - 1, 0) / (self.source.fps or self.target_fps)) + ' SEC'
+        self.detector.detectAndTracePath(frame, self.lines, frame_time, self.__onEvent)
+        elapsed = time.perf_counter() - start
+
+        self.latencies.append(now + elapsed - self.due)
+        self.covered += self.detector.frame_stride
+        self.busy += elapsed
+        self.processed += 1
+        self.due += self.interval()
+        return True
+
+    def window(self, seconds: float, now: float) -> dict:
+        # stats of the window that just ended, then a new one starts
+        latencies = np.asarray(self.latencies) * 1000
+        budget = self.latency_budget * 1000
+        self.last_window = {
+            "fps": round(self.covered / seconds, 2) if seconds else 0,
+            # how far behind its due time the source is, a starved source processes no frames to miss
+            "lag_ms": round(max(now - self.due, 0) * 1000, 1) if not self.finished else 0.0,
+            "latency_p50_ms": round(float(np.median(latencies)), 1) if len(latencies) else None,
+            "latency_p95_ms": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+            "missed": round(float((latencies > budget).mean()), 3) if len(latencies) else 0.0,
+            "busy": round(self.busy / seconds, 3) if seconds else 0,
+        }
+        self.latencies, self.covered, self.busy = [], 0, 0.0
+        return self.last_window
+
+    def meetsTargets(self, miss_rate: float) -> bool:
+        if not self.last_window:
+            return True
+        return self.last_window["missed"] <= miss_rate and self.last_window["lag_ms"] <= self.latency_budget * 1000
+
+    def metrics(self) -> dict:
+        name, render, stride_factor, imgsz = LEVELS[self.level]
+        return {
+            "priority": self.priority,
+            "level": self.level,
+            "degradation": name,
+            "stride": self.detector.frame_stride,
+            "imgsz": self.detector.imgsz,
+            "render": render,
+            "target_fps": self.target_fps,
+            "latency_budget_ms": round(self.latency_budget * 1000, 1),
+            "processed": self.processed,
+            "events": self.events,
+            "degradations": self.degradations,
+            "restores": self.restores,
+            "finished": self.finished,
+            **self.last_window,
+        }
+
+
+class Scheduler:
+    """
+    Runs several sources on one box and sheds load by priority.
+
+    Every source has a due time for its next frame, one frame per `stride / target_fps`
+    seconds. The loop processes the due source with the highest priority, the earliest
+    due first among equals, so under saturation the low priority sources fall behind and
+    miss their latency budget first. Every `window` seconds the controller looks at the
+    misses: when a source missed its budget on more than `miss_rate` of its frames, the
+    lowest priority source that can still be degraded goes one level down. When nobody
+    missed and the box was busy less than `restore_below` of the window for `hold` windows
+    in a row, the highest priority degraded source goes one level up again.
+    """
+
+    def __init__(self, window: float = 2.0, miss_rate: float = 0.1, restore_below: float = 0.7, hold: int = 3) -> None:
+        self.sources = {}
+        self.window = window
+        self.miss_rate = miss_rate
+        self.restore_below = restore_below
+        self.hold = hold
+        self.quiet_windows = 0
+        self.window_start = None
+        self.busy = 0.0
+        self.last_utilization = 0.0
+        self.started = None
+
+    def add(self, source: ScheduledSource):
+        if source.name in self.sources:
+            raise Exception(f"source already scheduled : {source.name}")
+        self.sources[source.name] = source
+
+    def __active(self) -> list:
+        return [s for s in self.sources.values() if not s.finished]
+
+    def __next(self, now: float) -> ScheduledSource:
+        due = [s for s in self.__active() if s.due <= now]
+        if not due:
+            return None
+        return min(due, key=lambda s: (-s.priority, s.due))
+
+    def __adjust(self, now: float):
+        seconds = now - self.window_start
+        for source in self.sources.values():
+            source.window(seconds, now)
+        self.last_utilization = self.busy / seconds if seconds else 0.0
+        self.window_start, self.busy = now, 0.0
+
+        active = self.__active()
+        missing = [s for s in active if not s.meetsTargets(self.miss_rate)]
+        if missing:
+            self.quiet_windows = 0
+            victims = [s for s in active if s.canDegrade]
+            if victims:
+                # lowest priority first, among equals the one missing its budget
+                min(victims, key=lambda s: (s.priority, s not in missing)).degrade()
+            return
+
+        self.quiet_windows += 1
+        degraded = [s for s in active if s.isDegraded]
+        if degraded and self.quiet_windows >= self.hold and self.last_utilization < self.restore_below:
+            max(degraded, key=lambda s: s.priority).restore()
+            self.quiet_windows = 0
+
+    def run(self, seconds: float = None, on_window: callable = None) -> dict:
+        # runs until every source has ended or the time is spent and returns metrics()
+        self.started = self.window_start = time.monotonic()
+        for source in self.sources.values():
+            source.due = self.started
+        while self.__active() and (seconds is None or time.monotonic() - self.started < seconds):
+            now = time.monotonic()
+            source = self.__next(now)
+            if source is None:
+                time.sleep(max(min(s.due for s in self.__active()) - now, 0))
+            else:
+                start = time.perf_counter()
+                source.step(now)
+                self.busy += time.perf_counter() - start
+            if time.monotonic() - self.window_start >= self.window:
+                self.__adjust(time.monotonic())
+                if on_window is not None:
+                    on_window(self.metrics())
+        return self.metrics()
+
+    def metrics(self) -> dict:
+        return {
+            "elapsed": round(time.monotonic() - self.started, 1) if self.started else 0,
+            "utilization": round(self.last_utilization, 3),
+            "sources": {name: source.metrics() for name, source in self.sources.items()},
+        }
+
+
+if __name__ == "__main__":
+    from gui import MODELS_PATH
+    from gui.model.autotune import loadLines
+    from gui.model.decoder import openDecoder
+    from gui.model.detection import Detection
+    from gui.model.live_source import LiveSource
+    from gui.model.shm_ring import openSharedSource
+
+    parser = argparse.ArgumentParser(description="count several sources on one box with priority based load shedding")
+    parser.add_argument("config", help='json list of {"name", "source", "lines", "priority", "target_fps", "latency_budget", "model", "stride"}')
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--window", type=float, default=2.0, help="seconds between scheduling decisions")
+    parser.add_argument("--minutes", type=float, default=None)
+    parser.add_argument("--metrics", default=None, help="json file rewritten with the metrics after every window")
+    parser.add_argument("--decode-processes", action="store_true", help="decode every video file in a worker process of its own, frames come through shared memory")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    scheduler = Scheduler(window=args.window)
+    with open(args.config) as file:
+        for entry in json.load(file):
+            is_live = entry["source"].startswith(("http://", "https://", "rtsp://"))
+            if is_live:
+                source = LiveSource(entry["source"])
+            else:
+                source = openSharedSource(entry["source"], stride=entry.get("stride", 1)) if args.decode_processes else openDecoder(entry["source"], "opencv")
+            detector = Detection(device=args.device, viz_mode=VIZ_NONE)
+            detector.setFps(source.fps)
+            detector.setFrameStride(entry.get("stride", 1))
+            detector.loadModel(entry.get("model", os.path.join(MODELS_PATH, "yolov8n.pt")))
+            scheduler.add(ScheduledSource(
+                entry.get("name", entry["source"]), detector, source, loadLines(entry["lines"]),
+                priority=entry.get("priority", 0), target_fps=entry.get("target_fps", 0),
+                latency_budget=entry.get("latency_budget", 0.5),
+            ))
+
+    def writeMetrics(metrics):
+        logging.info(f'scheduler : {json.dumps({k: (v["degradation"], v.get("fps")) for k, v in metrics["sources"].items()})}, utilization {metrics["utilization"]}')
+        if args.metrics:
+            with open(args.metrics, "w") as file:
+                json.dump(metrics, file, indent=2)
+
+    metrics = scheduler.run(seconds=args.minutes * 60 if args.minutes else None, on_window=writeMetrics)
+    print(json.dumps(metrics, indent=2))
@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import logging
+import socket
+import struct
+import time
+
+from gui.model.aggregates import CountAggregator
+from gui.utils.utils import toJson
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def websocketFrame(payload: bytes, opcode: int = 0x1) -> bytes:
+    # single unmasked server frame, FIN set
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def readWebsocketFrame(reader: asyncio.StreamReader) -> tuple:
+    # (opcode, payload) of a client frame, clients always mask
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else b"\x00" * 4
+    payload = bytearray(await reader.readexactly(length))
+    for i in range(length):
+        payload[i] ^= mask[i % 4]
+    return first & 0x0F, bytes(payload)
+
+
+class Subscriber:
+    # bounded queue of one websocket client, the oldest message goes when it is full
+
+    def __init__(self, peer, size: int) -> None:
+        self.peer = peer
+        self.queue = asyncio.Queue(size)
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, message: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+
+class CountingService:
+    """
+    Headless counting with live results for other systems on the site.
+
+    The detection loop runs on a worker thread and hands events to the asyncio loop, which
+    keeps the aggregates and fans events out to websocket subscribers. Each subscriber has a
+    bounded queue that drops its oldest messages, so a slow consumer only loses its own
+    events and never stalls detection.
+
+        GET /counts   current per line aggregates
+        GET /stats    pipeline and subscriber statistics
+        GET /events   websocket stream of crossing and zone events
+    """
+
+    def __init__(self, detector, source, lines: dict, host: str = "127.0.0.1", port: int = 8765, queue_size: int = 256, live: bool = False) -> None:
+        self.detector = detector
+        self.source = source
+        self.lines = lines
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        # live sources wait out empty reads and stamp events with the wall clock
+        self.live = live
+        self.aggregates = CountAggregator()
+        self.subscribers = set()
+        self.events = 0
+        self.frames = 0
+        self.started = None
+        self.running = False
+        self.loop = None
+        self.server = None
+        self.pipeline = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.__handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.running = True
+        self.started = time.monotonic()
+        self.pipeline = self.loop.run_in_executor(None, self.__runPipeline)
+        logging.info(f'counting service listening on http://{self.host}:{self.port}')
+
+    async def serveForever(self):
+        await self.start()
+        try:
+            await self.pipeline
+            # a finished video keeps its final counts available until the service is stopped
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        self.running = False
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for subscriber in list(self.subscribers):
+            subscriber.offer(None)
+        if self.pipeline is not None:
+            await asyncio.wait([self.pipeline])
+
+    def __runPipeline(self):
+        # worker thread, the asyncio loop is only touched through call_soon_threadsafe
+        try:
+            while self.running:
+                ret, frame = self.source.read(skip=self.detector.frame_stride - 1)
+                if not ret:
+                    if self.live and self.source.isOpened():
+                        continue
+                    break
+                if self.live:
+                    frame_time = time.strftime("%H:%M:%S")
+                else:
+                    frame_time = self.detector.frameTime(self.detector.frame_index)
+                self.detector.detectAndTracePath(frame, self.lines, frame_time, self.__onEvent)
+                self.frames += 1
+        finally:
+            self.source.release()
+            logging.info(f'counting service pipeline stopped after {self.frames} frames')
+
+    def __onEvent(self, event: dict):
+        self.loop.call_soon_threadsafe(self.__publish, dict(event))
+
+    def __publish(self, event: dict):
+        self.events += 1
+        if event.get("type") is None:
+            self.aggregates.add(event)
+        message = toJson(event)
+        for subscriber in self.subscribers:
+            subscriber.offer(message)
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.started if self.started else 0
+        stats = {
+            "pipeline_running": self.pipeline is not None and not self.pipeline.done(),
+            "frames": self.frames,
+            "fps": round(self.frames / elapsed, 2) if elapsed else 0,
+            "events": self.events,
+            "subscribers": [
+                {"peer": str(s.peer), "queued": s.queue.qsize(), "sent": s.sent, "dropped": s.dropped}
+                for s in self.subscribers
+            ],
+        }
+        if hasattr(self.source, "stats"):
+            stats["source"] = self.source.stats()
+        return stats
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        request_line, *header_lines = request.decode("latin-1").split("\r\n")
+        method, path = (request_line.split(" ") + ["", ""])[:2]
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+
+        try:
+            if method != "GET":
+                await self.__respond(writer, 405, {"error": "method not allowed"})
+            elif path == "/counts":
+                await self.__respond(writer, 200, self.aggregates.summary())
+            elif path == "/stats":
+                await self.__respond(writer, 200, self.stats())
+            elif path == "/events" and headers.get("upgrade", "").lower() == "websocket":
+                await self.__stream(reader, writer, headers)
+            else:
+                await self.__respond(writer, 404, {"error": f"unknown path {path}"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def __respond(self, writer: asyncio.StreamWriter, status: int, body: dict):
+        payload = toJson(body).encode()
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+
+    async def __stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: dict):
+        key = headers.get("sec-websocket-key")
+        if not key or headers.get("sec-websocket-version") != "13":
+            await self.__respond(writer, 400, {"error": "websocket upgrade needs a sec-websocket-key and version 13"})
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        await writer.drain()
+
+        # keep the backlog in the subscriber queue where it is bounded, not in socket buffers
+        writer.transport.set_write_buffer_limits(high=16 * 1024)
+        writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 64 * 1024)
+        subscriber = Subscriber(writer.get_extra_info("peername"), self.queue_size)
+        self.subscribers.add(subscriber)
+        receiver = asyncio.ensure_future(self.__receive(reader, writer, subscriber))
+        try:
+            while True:
+                message = await subscriber.queue.get()
+                if message is None:
+                    writer.write(websocketFrame(b"", 0x8))
+                    await writer.drain()
+                    break
+                writer.write(websocketFrame(message.encode()))
+                await writer.drain()
+                subscriber.sent += 1
+        finally:
+            self.subscribers.discard(subscriber)
+            receiver.cancel()
+
+    async def __receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, subscriber: Subscriber):
+        # answers pings and ends the stream when the client closes
+        try:
+            while True:
+                opcode, payload = await readWebsocketFrame(reader)
+                if opcode == 0x9:
+                    writer.write(websocketFrame(payload, 0xA))
+                elif opcode == 0x8:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        subscriber.offer(None)
+
+
+if __name__ == "__main__":
+    from gui import MODELS_PATH
+    from gui.model.autotune import loadLines
+    from gui.model.decoder import openDecoder
+    from gui.model.detection import Detection
+    from gui.model.live_source import LiveSource
+    from gui.model.renderer import VIZ_NONE
+    from gui.model.shm_ring import openSharedSource
+    import os
+
+    parser = argparse.ArgumentParser(description="headless vehicle counting with http and websocket output")
+    parser.add_argument("source", help="video file or stream url")
+    parser.add_argument("--model", default=os.path.join(MODELS_PATH, "yolov8n.pt"))
+    parser.add_argument("--lines", required=True, help="json file with counting lines")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--queue-size", type=int, default=256, help="messages buffered per websocket client")
+    parser.add_argument("--decode-process", action="store_true", help="decode a video file in a worker process, frames come through shared memory")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    detector = Detection(device=args.device, viz_mode=VIZ_NONE)
+    detector.loadModel(args.model)
+    is_live = args.source.startswith(("http://", "https://", "rtsp://"))
+    if is_live:
+        source = LiveSource(args.source)
+    else:
+        source = openSharedSource(args.source) if args.decode_process else openDecoder(args.source, "opencv")
+    detector.setFps(source.fps)
+    service = CountingService(detector, source, loadLines(args.lines), port=args.port, queue_size=args.queue_size, live=is_live)
+    try:
+        asyncio.run(service.serveForever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,235 @@
+import logging
+import multiprocessing as mp
+import os
+import queue
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from gui.model.decoder import VideoDecoder, openDecoder
+
+
+class SharedFrameRing:
+    """
+    Fixed ring of preallocated frame slots in one shared memory block.
+
+    Only slot indices travel through the queues: the producer acquires a free slot, writes the
+    frame into its view and publishes the index, a consumer reads the same memory as a numpy
+    view and releases the slot when it is done with it. Frames are never pickled.
+
+    The ring pickles as a handle, pass it to a multiprocessing.Process and the child attaches
+    to the same block. Published frames go to whichever consumer asks first, so a consumer that
+    tracks (needs every frame in order) gets a ring of its own.
+
+    A small header in front of the slots holds the frame stride the consumer wants, a decoding
+    producer grabs the frames in between without converting or copying them.
+    """
+
+    # bytes in front of the slots, the stride as one int64
+    HEADER = 8
+
+    def __init__(self, shape: tuple, slots: int = 8, dtype=np.uint8, context=None) -> None:
+        context = context or mp.get_context()
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=self.HEADER + frame_bytes * slots)
+        # only the creating process unlinks, forked children inherit this object as is
+        self.owner_pid = os.getpid()
+        # free slot indices and published (slot, frame index) pairs
+        self.free = context.Queue(slots)
+        self.ready = context.Queue(slots + 1)
+        for slot in range(slots):
+            self.free.put(slot)
+        self.__attachFrames()
+        self.stride = 1
+
+    def __attachFrames(self):
+        self.header = np.ndarray(1, dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((self.slots, *self.shape), dtype=self.dtype, buffer=self.shm.buf, offset=self.HEADER)
+
+    @property
+    def stride(self) -> int:
+        return int(self.header[0])
+
+    @stride.setter
+    def stride(self, stride: int):
+        self.header[0] = max(int(stride), 1)
+
+    def __getstate__(self):
+        return {
+            "name": self.shm.name, "shape": self.shape, "dtype": self.dtype.str, "slots": self.slots,
+            "free": self.free, "ready": self.ready, "owner_pid": self.owner_pid,
+        }
+
+    def __setstate__(self, state):
+        self.shape, self.dtype, self.slots = state["shape"], np.dtype(state["dtype"]), state["slots"]
+        self.free, self.ready = state["free"], state["ready"]
+        self.shm = shared_memory.SharedMemory(name=state["name"])
+        self.owner_pid = state["owner_pid"]
+        self.__attachFrames()
+
+    def view(self, slot: int) -> np.ndarray:
+        return self.frames[slot]
+
+    # producer side
+
+    def acquire(self, timeout: float = None) -> int:
+        # a free slot to write into, None when every slot is still held by consumers
+        try:
+            return self.free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def publish(self, slot: int, index: int):
+        self.ready.put((slot, index))
+
+    def put(self, frame: np.ndarray, index: int, timeout: float = None) -> bool:
+        slot = self.acquire(timeout)
+        if slot is None:
+            return False
+        np.copyto(self.frames[slot], frame)
+        self.publish(slot, index)
+        return True
+
+    def finish(self):
+        # end of stream marker, every consumer gets (None, None) from then on
+        self.ready.put((None, None))
+
+    # consumer side
+
+    def next(self, timeout: float = None) -> tuple:
+        # (slot, frame index) of the next published frame, raises queue.Empty on timeout
+        slot, index = self.ready.get(timeout=timeout)
+        if slot is None:
+            # leave the marker for the other consumers
+            self.ready.put((None, None))
+        return slot, index
+
+    def release(self, slot: int):
+        self.free.put(slot)
+
+    def close(self):
+        # views handed out must be gone before the block can be unmapped
+        self.frames = None
+        self.header = None
+        try:
+            self.shm.close()
+        except BufferError:
+            logging.warning("shared frame ring closed while frames are still referenced")
+            return
+        if os.getpid() == self.owner_pid:
+            self.shm.unlink()
+
+
+def captureFrames(ring: SharedFrameRing, opener: callable):
+    # producer process target, opener builds the VideoDecoder inside the child. Frames are
+    # published with their index in the source, the stride is read from the ring every frame
+    decoder = opener()
+    try:
+        while decoder.isOpened():
+            ret, frame = decoder.read(skip=ring.stride - 1 if decoder.next_index else 0)
+            if not ret:
+                break
+            slot = ring.acquire()
+            np.copyto(ring.view(slot), frame)
+            ring.publish(slot, decoder.next_index - 1)
+    finally:
+        decoder.release()
+        ring.finish()
+        ring.close()
+
+
+class SharedFrameSource(VideoDecoder):
+    """
+    Consumer side of a ring as a VideoDecoder, so Detection, runClip and the counting service
+    read frames decoded by another process unchanged.
+
+    read() returns a view into the ring, valid until the next read() or release(). Drawing on
+    it in place is fine, the slot belongs to this consumer until then. With the `worker` that
+    produces the frames, release() also stops it and frees the ring.
+
+    read(skip) hands the stride to the producer instead of skipping here, frames it decoded
+    ahead keep the stride they were decoded with, next_index follows the published indices.
+    """
+
+    name = "shared"
+
+    def __init__(self, ring: SharedFrameRing, fps: float = 0.0, timeout: float = 5.0, worker: mp.Process = None) -> None:
+        super().__init__("shared memory", (ring.shape[1], ring.shape[0]))
+        self.ring = ring
+        self.worker = worker
+        self.fps = fps
+        self.height, self.width = ring.shape[:2]
+        self.timeout = timeout
+        self.slot = None
+        self.index = -1
+        self.opened = True
+
+    def isOpened(self) -> bool:
+        return self.opened
+
+    def __releaseSlot(self):
+        if self.slot is not None:
+            self.ring.release(self.slot)
+            self.slot = None
+
+    def grab(self) -> bool:
+        self.__releaseSlot()
+        if not self.opened:
+            return False
+        try:
+            slot, index = self.ring.next(self.timeout)
+        except queue.Empty:
+            logging.warning("shared frame source timed out waiting for the producer")
+            return False
+        if slot is None:
+            self.opened = False
+            return False
+        self.slot, self.index = slot, index
+        return True
+
+    def retrieve(self, out=None):
+        # the slot view is already preallocated memory, out is ignored
+        if self.slot is None:
+            return False, None
+        return True, self.ring.view(self.slot)
+
+    def read(self, skip: int = 0, out=None):
+        self.ring.stride = skip + 1
+        if not self.grab():
+            return False, None
+        self.next_index = self.index + 1
+        return self.retrieve(out)
+
+    def release(self):
+        self.__releaseSlot()
+        self.opened = False
+        if self.worker is None:
+            return
+        # the worker may be waiting for a slot this side will never free
+        self.worker.terminate()
+        self.worker.join()
+        self.worker = None
+        self.ring.close()
+
+
+def openSharedSource(source: str, backend: str = "opencv", slots: int = 8, stride: int = 1) -> SharedFrameSource:
+    # decodes a video file in a worker process, Detection gets the frames through a ring of its own
+    probe = openDecoder(source, backend)
+    if not probe.isOpened():
+        raise Exception(f"unable to open : {source}")
+    shape, fps, frame_count = (probe.height, probe.width, 3), probe.fps, probe.frame_count
+    probe.release()
+
+    # spawn, a forked child would inherit the parent's torch threads and CUDA state
+    context = mp.get_context("spawn")
+    ring = SharedFrameRing(shape, slots, context=context)
+    ring.stride = stride
+    worker = context.Process(target=captureFrames, args=(ring, partial(openDecoder, source, backend)), daemon=True)
+    worker.start()
+    shared = SharedFrameSource(ring, fps, worker=worker)
+    shared.frame_count = frame_count
+    return shared
@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+class SnapshotWriter:
+    """
+    Saves a crop of every counted vehicle without stalling the frame loop.
+
+    submit() slices the padded box out of the frame it is handed (the frame is drawn on right
+    after counting, so only the crop is kept) and a thread pool encodes and writes the JPEGs.
+    Crops waiting for a worker are limited to `memory_budget` bytes, snapshots beyond it are
+    skipped. Files live at <root>/<video>/<line id>/<frame index>_<track id>.jpg, an event seen
+    again (a replay of the same video) reuses the file instead of writing it twice.
+    """
+
+    def __init__(self, root: str, video: str, workers: int = 2, memory_budget: int = 64 * 2 ** 20, padding: float = 0.1, quality: int = 90) -> None:
+        self.root = root
+        self.video = video
+        self.memory_budget = memory_budget
+        self.padding = padding
+        self.quality = quality
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot")
+        self.lock = threading.Lock()
+        self.pending_bytes = 0
+        self.pending_paths = set()
+
+        # stats
+        self.written = 0
+        self.reused = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def pathFor(self, event: dict) -> str:
+        return os.path.join(self.root, self.video, str(event["line_id"]), f'{event["frame_index"]}_{event["track_id"]}.jpg')
+
+    def crop(self, frame: np.ndarray, bbox) -> np.ndarray:
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = bbox
+        pad_x, pad_y = (x2 - x1) * self.padding, (y2 - y1) * self.padding
+        x1, y1 = max(int(x1 - pad_x), 0), max(int(y1 - pad_y), 0)
+        x2, y2 = min(int(x2 + pad_x) + 1, width), min(int(y2 + pad_y) + 1, height)
+        return frame[y1:y2, x1:x2].copy()
+
+    def submit(self, frame: np.ndarray, event: dict) -> str:
+        # returns the snapshot path, None when it was skipped
+        path = self.pathFor(event)
+        with self.lock:
+            if path in self.pending_paths or os.path.exists(path):
+                self.reused += 1
+                return path
+        crop = self.crop(frame, event["bbox"])
+        if crop.size == 0:
+            return None
+        with self.lock:
+            if self.pending_bytes + crop.nbytes > self.memory_budget:
+                self.dropped += 1
+                return None
+            self.pending_bytes += crop.nbytes
+            self.pending_paths.add(path)
+        self.pool.submit(self.__write, path, crop)
+        return path
+
+    def __write(self, path: str, crop: np.ndarray):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            ret, encoded = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ret:
+                raise Exception("jpeg encoding failed")
+            # write next to the target and rename, readers never see half a file
+            temporary = path + ".tmp"
+            with open(temporary, "wb") as file:
+                file.write(encoded.tobytes())
+            os.replace(temporary, path)
+            written = True
+        except Exception as e:
+            logging.error(f'unable to save snapshot {path} : {e}')
+            written = False
+        with self.lock:
+            self.pending_bytes -= crop.nbytes
+            self.pending_paths.discard(path)
+            if written:
+                self.written += 1
+            else:
+                self.failed += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "written": self.written,
+                "reused": self.reused,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "pending": len(self.pending_paths),
+                "pending_kb": round(self.pending_bytes / 1024, 1),
+            }
+
+    def close(self, wait: bool = True) -> dict:
+        self.pool.shutdown(wait=wait)
+        return self.stats()
@@ -0,0 +1,223 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from gui.model.aggregates import CountAggregator
+from gui.model.detection import Detection
+from gui.model.renderer import VIZ_BBOX_TRACK
+from gui.model.synthetic import VEHICLES, SyntheticTrafficDecoder
+from gui.model.tracker import TRACKERS, IoUTracker, UltralyticsTracker, createTracker
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# allowed growth of every watched metric over the measured part of the run, relative to its early level
+TOLERANCES = {
+    "rss_mb": 0.10,
+    "objects": 0.05,
+    "tracks": 0.50,
+    "tracker_tracks": 0.50,
+    "latency_ms": 0.25,
+}
+
+
+def residentMemory() -> int:
+    # resident set size in bytes
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def trackerTracks(detector: Detection) -> int:
+    # tracks held inside the tracker, lost and removed ones included
+    tracker = detector.box_tracker
+    if isinstance(tracker, IoUTracker):
+        return len(tracker)
+    if isinstance(tracker, UltralyticsTracker):
+        tracker = tracker.tracker
+    elif detector.model is not None and getattr(detector.model, "predictor", None) is not None:
+        trackers = getattr(detector.model.predictor, "trackers", None)
+        tracker = trackers[0] if trackers else None
+    else:
+        tracker = None
+    if tracker is None:
+        return 0
+    return sum(len(getattr(tracker, name, [])) for name in ("tracked_stracks", "lost_stracks", "removed_stracks"))
+
+
+def growth(times: np.ndarray, values: np.ndarray) -> float:
+    # least squares trend over the window, relative to the level at its start
+    if len(values) < 3 or np.ptp(times) == 0:
+        return 0.0
+    slope = np.polyfit(times, values, 1)[0]
+    early = float(np.median(values[: max(len(values) // 4, 1)]))
+    return float(slope * np.ptp(times) / max(abs(early), 1.0))
+
+
+class SyntheticDetection(Detection):
+    """
+    Detection fed with the ground truth boxes of a synthetic clip instead of a model.
+
+    Boxes get pixel jitter and missed detections and go through the chosen tracker, the
+    counting, zones, trajectories and drawing then run unchanged, so a soak run needs no
+    weights and no GPU.
+    """
+
+    def __init__(self, decoder: SyntheticTrafficDecoder, tracker: str = "iou", jitter: float = 2.0, dropout: float = 0.05, seed: int = 0) -> None:
+        super().__init__("cpu", VIZ_BBOX_TRACK)
+        self.decoder = decoder
+        self.jitter = jitter
+        self.dropout = dropout
+        self.rng = np.random.default_rng(seed)
+        self.names = {class_id: vehicle[0] for class_id, vehicle in VEHICLES.items()}
+        self.setTracker(tracker)
+        # detectAndTracePath skips frames without a model, the decoder stands in for one
+        self.model = decoder
+
+    def loadModel(self, model_path: str):
+        pass
+
+    def setTracker(self, tracker: str):
+        # there is no model.track, every tracker runs behind the ground truth boxes
+        self.tracker = tracker
+        self.box_tracker = createTracker(tracker, int(self.decoder.fps))
+
+    def trackFrame(self, frame: np.ndarray, lines: dict = None):
+        _, xyxy, cls = self.decoder.groundTruth()
+        keep = self.rng.random(len(xyxy)) >= self.dropout
+        xyxy = xyxy[keep] + self.rng.normal(0, self.jitter, (int(keep.sum()), 4)).astype(np.float32)
+        cls = cls[keep]
+        conf = self.rng.uniform(0.6, 0.95, len(xyxy)).astype(np.float16)
+        ids = self.box_tracker.update(xyxy, cls, conf)
+        return None, (ids, xyxy, cls, conf)
+
+
+class SoakTest:
+    """
+    Runs the counting pipeline for a long time and watches it for leaks and slowdowns.
+
+    Every `sample_every` frames it records resident memory, the number of gc tracked objects,
+    the live tracks of the counter and of the tracker, and the median per frame latency. The
+    first `warmup` fraction of the samples is ignored (allocator and cache growth), over the
+    rest every metric in `tolerances` must not trend upward by more than its tolerance.
+    """
+
+    def __init__(self, detector: Detection, source, lines: dict, sample_every: int = 500, warmup: float = 0.2, tolerances: dict = None) -> None:
+        self.detector = detector
+        self.source = source
+        self.lines = lines
+        self.sample_every = sample_every
+        self.warmup = warmup
+        self.tolerances = tolerances or TOLERANCES
+        self.aggregates = CountAggregator()
+        self.samples = []
+        self.frames = 0
+        self.events = 0
+        self.started = None
+
+    def __onEvent(self, event: dict):
+        self.events += 1
+        if event.get("type") is None:
+            self.aggregates.add(event)
+
+    def __sample(self, latencies: list):
+        gc.collect()
+        latencies = np.asarray(latencies) * 1000
+        sample = {
+            "elapsed": round(time.monotonic() - self.started, 2),
+            "frames": self.frames,
+            "rss_mb": round(residentMemory() / 2 ** 20, 2),
+            "objects": len(gc.get_objects()),
+            "tracks": len(self.detector.track_history),
+            "tracker_tracks": trackerTracks(self.detector),
+            "trajectory_rows": len(self.detector.trajectories),
+            # median, a single slow frame (gc, page faults) is not a slowdown
+            "latency_ms": round(float(np.median(latencies)), 3),
+            "latency_p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "events": self.events,
+        }
+        self.samples.append(sample)
+        logging.info(f'soak sample : {sample}')
+
+    def run(self, seconds: float = None, frames: int = None) -> dict:
+        # runs until the time or frame budget is spent (or the source ends) and returns report()
+        self.started = time.monotonic()
+        latencies = []
+        while (seconds is None or time.monotonic() - self.started < seconds) and (frames is None or self.frames < frames):
+            start = time.perf_counter()
+            ret, frame = self.source.read(skip=self.detector.frame_stride - 1)
+            if not ret:
+                break
+            frame_time = self.detector.frameTime(self.detector.frame_index)
+            self.detector.detectAndTracePath(frame, self.lines, frame_time, self.__onEvent)
+            latencies.append(time.perf_counter() - start)
+            self.frames += 1
+            if self.frames % self.sample_every == 0:
+                self.__sample(latencies)
+                latencies = []
+        return self.report()
+
+    def report(self) -> dict:
+        measured = self.samples[int(len(self.samples) * self.warmup):]
+        times = np.array([s["elapsed"] for s in measured], dtype=np.float64)
+        trends = {}
+        for metric, tolerance in self.tolerances.items():
+            values = np.array([s[metric] for s in measured], dtype=np.float64)
+            trend = growth(times, values)
+            trends[metric] = {"growth": round(trend, 4), "tolerance": tolerance, "passed": trend <= tolerance}
+        return {
+            "frames": self.frames,
+            "seconds": round(time.monotonic() - self.started, 1) if self.started else 0,
+            "events": self.events,
+            "samples": len(self.samples),
+            # too few samples to see a trend is a failed run, not a passed one
+            "passed": len(measured) >= 3 and all(t["passed"] for t in trends.values()),
+            "trends": trends,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="soak test the counting pipeline on an endless synthetic stream")
+    parser.add_argument("--minutes", type=float, default=10.0)
+    parser.add_argument("--tracker", default="iou", choices=TRACKERS)
+    parser.add_argument("--model", default=None, help="run this model on the synthetic frames instead of the ground truth")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--sample-every", type=int, default=500, help="frames between samples")
+    parser.add_argument("--realtime", action="store_true", help="pace the stream at its fps instead of as fast as possible")
+    parser.add_argument("--report", default=None, help="json file for the report and every sample")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    source = SyntheticTrafficDecoder(frames=None, realtime=args.realtime)
+    if args.model:
+        detector = Detection(device=args.device, viz_mode=VIZ_BBOX_TRACK)
+        detector.setTracker(args.tracker)
+        detector.loadModel(args.model)
+    else:
+        detector = SyntheticDetection(source, args.tracker)
+    detector.setFps(source.fps)
+    detector.setFrameStride(args.stride)
+
+    width, height = source.width, source.height
+    lines = {
+        "soak_line": {"geometry": [(width / 2, 0), (width / 2, height)], "type": "line"},
+        "soak_zone": {"geometry": [(width * 0.2, 0), (width * 0.35, 0), (width * 0.35, height), (width * 0.2, height)], "type": "zone"},
+    }
+    soak = SoakTest(detector, source, lines, sample_every=args.sample_every)
+    report = soak.run(seconds=args.minutes * 60)
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump({**report, "samples_taken": soak.samples}, file, indent=2)
+    sys.exit(0 if report["passed"] else 1)
@@ -0,0 +1,62 @@
+import cv2
+import numpy as np
+
+
+class SpeedEstimator:
+    """
+    Ground plane speed of every live track from a four point calibration.
+
+    The four image points mark a rectangle on the road, given clockwise from the first one:
+    p1 -> p2 spans `width_m` metres and p2 -> p3 spans `length_m` metres.
+    """
+
+    def __init__(self, window: int = 10) -> None:
+        # number of trailing track points the speed is measured over
+        self.window = window
+        self.homography = None
+        self.image_points = None
+        self.speeds = {}
+
+    @property
+    def isCalibrated(self) -> bool:
+        return self.homography is not None
+
+    def calibrate(self, image_points, width_m: float, length_m: float):
+        src = np.asarray(image_points, dtype=np.float32).reshape(4, 2)
+        dst = np.array([[0, 0], [width_m, 0], [width_m, length_m], [0, length_m]], dtype=np.float32)
+        self.homography = cv2.getPerspectiveTransform(src, dst).astype(np.float64)
+        self.image_points = src
+        self.speeds = {}
+
+    def reset(self):
+        self.speeds = {}
+
+    def toGround(self, points: np.ndarray) -> np.ndarray:
+        # projective transform of (N, 2) image points to metres
+        homogeneous = np.hstack([points, np.ones((len(points), 1))]) @ self.homography.T
+        return homogeneous[:, :2] / homogeneous[:, 2:3]
+
+    def update(self, track_history: dict, seconds_per_frame: float):
+        # km/h per track over the last `window` points of every ring buffer, in one batched transform,
+        # points carry their frame index so frames skipped by motion gating count as elapsed time
+        if not self.isCalibrated or not seconds_per_frame:
+            self.speeds = {}
+            return
+        ids, first, last, spans = [], [], [], []
+        for track_id, track in track_history.items():
+            points, frames = track["track"], track["frame"]
+            if len(points) < 2:
+                continue
+            start = max(len(points) - self.window, 0)
+            ids.append(track_id)
+            first.append(points[start])
+            last.append(points[-1])
+            spans.append(frames[-1] - frames[start])
+        if not ids:
+            self.speeds = {}
+            return
+
+        ground = self.toGround(np.asarray(first + last, dtype=np.float64))
+        distance = np.linalg.norm(ground[len(ids):] - ground[: len(ids)], axis=1)
+        speed = distance / (np.asarray(spans, dtype=np.float64) * seconds_per_frame) * 3.6
+        self.speeds = dict(zip(ids, np.round(speed, 1).tolist()))
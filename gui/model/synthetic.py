@@ -0,0 +1,125 @@
+import time
+
+import cv2
+import numpy as np
+
+from gui.model.decoder import VideoDecoder
+
+
+# coco class ids used by the synthetic traffic -> (name, width, height, colour)
+VEHICLES = {
+    2: ("car", 60, 34, (200, 60, 60)),
+    3: ("motorcycle", 30, 18, (60, 200, 60)),
+    5: ("bus", 130, 44, (60, 60, 200)),
+    7: ("truck", 100, 42, (60, 200, 200)),
+}
+
+
+class SyntheticTrafficDecoder(VideoDecoder):
+    """
+    Rectangles driving along horizontal lanes, a decoder with known ground truth.
+
+    frames=None gives an endless source, realtime=True paces grab() at fps like a live camera.
+    """
+
+    name = "synthetic"
+
+    def __init__(
+        self,
+        width: int = 1280,
+        height: int = 720,
+        fps: float = 30.0,
+        frames: int = None,
+        lanes: int = 4,
+        spawn_rate: float = 0.05,
+        seed: int = 0,
+        realtime: bool = False,
+        size: tuple = None,
+    ) -> None:
+        super().__init__("synthetic", size)
+        self.width, self.height, self.fps = width, height, fps
+        self.frame_count = frames or 0
+        self.frames = frames
+        self.lanes = lanes
+        self.spawn_rate = spawn_rate
+        self.realtime = realtime
+        self.rng = np.random.default_rng(seed)
+        self.background = np.full((height, width, 3), 90, dtype=np.uint8)
+        lane_height = height / (lanes + 1)
+        self.lane_y = [(i + 1) * lane_height for i in range(lanes)]
+        for y in self.lane_y:
+            cv2.line(self.background, (0, int(y)), (width, int(y)), (120, 120, 120), 1)
+
+        self.index = -1
+        self.next_id = 0
+        # columns of the live vehicles
+        self.ids = np.empty(0, dtype=np.int32)
+        self.cls = np.empty(0, dtype=np.int16)
+        self.position = np.empty((0, 2), dtype=np.float32)
+        self.velocity = np.empty((0, 2), dtype=np.float32)
+        self.extent = np.empty((0, 2), dtype=np.float32)
+        self.next_time = time.monotonic()
+        self.opened = True
+
+    def isOpened(self) -> bool:
+        return self.opened
+
+    def __spawn(self):
+        for lane, y in enumerate(self.lane_y):
+            if self.rng.random() >= self.spawn_rate:
+                continue
+            class_id = int(self.rng.choice(list(VEHICLES), p=[0.6, 0.1, 0.1, 0.2]))
+            _, w, h, _ = VEHICLES[class_id]
+            forward = lane % 2 == 0
+            speed = self.rng.uniform(3, 9) * (1 if forward else -1)
+            x = -w if forward else self.width + w
+            self.ids = np.append(self.ids, self.next_id)
+            self.cls = np.append(self.cls, class_id).astype(np.int16)
+            self.position = np.vstack([self.position, [[x, y + self.rng.uniform(-4, 4)]]]).astype(np.float32)
+            self.velocity = np.vstack([self.velocity, [[speed, self.rng.uniform(-0.2, 0.2)]]]).astype(np.float32)
+            self.extent = np.vstack([self.extent, [[w, h]]]).astype(np.float32)
+            self.next_id += 1
+
+    def grab(self) -> bool:
+        if not self.opened or (self.frames is not None and self.index + 1 >= self.frames):
+            return False
+        if self.realtime:
+            self.next_time += 1 / self.fps
+            delay = self.next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.index += 1
+        self.position += self.velocity
+        margin = self.extent[:, 0] if len(self.extent) else 0
+        inside = (self.position[:, 0] > -margin - 1) & (self.position[:, 0] < self.width + margin + 1)
+        self.ids, self.cls = self.ids[inside], self.cls[inside]
+        self.position, self.velocity, self.extent = self.position[inside], self.velocity[inside], self.extent[inside]
+        self.__spawn()
+        return True
+
+    def groundTruth(self) -> tuple:
+        # (ids, xyxy, cls) of the vehicles on the current frame, clipped to the image
+        half = self.extent / 2
+        xyxy = np.hstack([self.position - half, self.position + half])
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, self.width - 1)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, self.height - 1)
+        visible = (xyxy[:, 2] - xyxy[:, 0] > 2) & (xyxy[:, 3] - xyxy[:, 1] > 2)
+        return self.ids[visible], xyxy[visible].astype(np.float32), self.cls[visible]
+
+    def retrieve(self, out=None):
+        if self.index < 0:
+            return False, None
+        if out is not None and self.size is None and out.shape == self.background.shape:
+            frame = out
+            np.copyto(frame, self.background)
+        else:
+            frame = self.background.copy()
+        _, xyxy, cls = self.groundTruth()
+        for (x1, y1, x2, y2), class_id in zip(xyxy.astype(np.int32), cls):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), VEHICLES[int(class_id)][3], -1)
+        if self.size is not None:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return True, frame
+
+    def release(self):
+        self.opened = False
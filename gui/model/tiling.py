@@ -0,0 +1,188 @@
+import cv2
+import numpy as np
+import torch
+from shapely.geometry import LineString, Polygon, box
+from torchvision.ops import batched_nms
+
+
+def tileGrid(width: int, height: int, tile: int, overlap: int) -> np.ndarray:
+    # (n, 4) x1, y1, x2, y2 of tile x tile windows covering the frame, the last row / column is
+    # moved back inside the frame instead of being cut short, so every tile has the same shape
+    def starts(size):
+        if size <= tile:
+            return [0]
+        step = tile - overlap
+        positions = list(range(0, size - tile, step)) + [size - tile]
+        return sorted(set(positions))
+
+    xs, ys = starts(width), starts(height)
+    return np.array(
+        [(x, y, min(x + tile, width), min(y + tile, height)) for y in ys for x in xs],
+        dtype=np.int32,
+    )
+
+
+def fastNms(xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray, iou_threshold: float = 0.5) -> np.ndarray:
+    # indices of the kept boxes by descending confidence, same class only. The greedy NMS of
+    # torchvision in one call, a suppressed box never suppresses others
+    if len(xyxy) == 0:
+        return np.empty(0, dtype=np.int64)
+    keep = batched_nms(
+        torch.from_numpy(np.ascontiguousarray(xyxy, dtype=np.float32)),
+        torch.from_numpy(np.ascontiguousarray(conf, dtype=np.float32)),
+        torch.from_numpy(cls.astype(np.int64)),
+        iou_threshold,
+    )
+    return keep.numpy()
+
+
+class TiledDetector:
+    """
+    Detection on overlapping native resolution tiles, for high resolution feeds where far
+    vehicles are only a few pixels at the model input size.
+
+    Active tiles and, with `full_frame`, a letterboxed copy of the whole frame go through
+    model.predict as batches of `max_batch`. Tile boxes touching a cut edge of their tile are
+    dropped when the overlap has them complete in the neighbouring tile, with the full frame
+    all of them are, vehicles larger than the overlap then come from the full frame. What is
+    left is merged with one vectorized NMS. A tile is active when a line or zone passes through it or a
+    tracked box was in it on the last frame, both within `margin` tiles. Without any line or
+    zone every tile runs.
+    """
+
+    def __init__(self, tile: int = 640, overlap: float = 0.2, iou_threshold: float = 0.5, full_frame: bool = True, margin: float = 0.5, max_batch: int = 16, edge: int = 2) -> None:
+        self.tile = tile
+        self.overlap = int(tile * overlap)
+        self.iou_threshold = iou_threshold
+        self.full_frame = full_frame
+        self.margin = int(tile * margin)
+        self.max_batch = max_batch
+        # pixels from a cut edge counting as touching it
+        self.edge = edge
+        self.grid_key = None
+        self.grid = None
+        self.line_key = None
+        self.line_tiles = None
+
+        # stats
+        self.frames = 0
+        self.tiles_run = 0
+        self.tiles_skipped = 0
+
+    def config(self) -> dict:
+        return {"tile": self.tile, "overlap": self.overlap, "iou_threshold": self.iou_threshold, "full_frame": self.full_frame}
+
+    def __tiles(self, width: int, height: int) -> np.ndarray:
+        if self.grid_key != (width, height):
+            self.grid_key = (width, height)
+            self.grid = tileGrid(width, height, self.tile, self.overlap)
+            self.line_key = None
+        return self.grid
+
+    def __lineTiles(self, tiles: np.ndarray, lines: dict) -> np.ndarray:
+        # tiles a line or zone passes through, None when nothing is drawn
+        key = tuple((k, tuple(map(tuple, l["geometry"])), l.get("type", "line")) for k, l in lines.items())
+        if key != self.line_key:
+            self.line_key = key
+            geometries = [
+                Polygon(l["geometry"]) if l.get("type") == "zone" else LineString(l["geometry"])
+                for l in lines.values()
+                if len(l["geometry"]) >= (3 if l.get("type") == "zone" else 2)
+            ]
+            if geometries:
+                self.line_tiles = np.array([
+                    any(g.intersects(box(x1 - self.margin, y1 - self.margin, x2 + self.margin, y2 + self.margin)) for g in geometries)
+                    for x1, y1, x2, y2 in tiles
+                ])
+            else:
+                self.line_tiles = None
+        return self.line_tiles
+
+    def activeTiles(self, tiles: np.ndarray, lines: dict, boxes: np.ndarray = None) -> np.ndarray:
+        line_tiles = self.__lineTiles(tiles, lines)
+        if line_tiles is None:
+            return np.ones(len(tiles), dtype=bool)
+        active = line_tiles.copy()
+        if boxes is not None and len(boxes):
+            grown = tiles + np.array([-self.margin, -self.margin, self.margin, self.margin])
+            active |= (
+                (boxes[None, :, 0] < grown[:, None, 2]) & (boxes[None, :, 2] > grown[:, None, 0])
+                & (boxes[None, :, 1] < grown[:, None, 3]) & (boxes[None, :, 3] > grown[:, None, 1])
+            ).any(axis=1)
+        return active
+
+    def __letterbox(self, frame: np.ndarray) -> tuple:
+        # whole frame scaled into one tile, with the scale and padding to map boxes back
+        height, width = frame.shape[:2]
+        scale = self.tile / max(width, height)
+        resized = cv2.resize(frame, (max(int(width * scale), 1), max(int(height * scale), 1)), interpolation=cv2.INTER_AREA)
+        canvas = np.full((self.tile, self.tile, 3), 114, dtype=frame.dtype)
+        pad_y, pad_x = (self.tile - resized.shape[0]) // 2, (self.tile - resized.shape[1]) // 2
+        canvas[pad_y:pad_y + resized.shape[0], pad_x:pad_x + resized.shape[1]] = resized
+        return canvas, scale, pad_x, pad_y
+
+    def detect(self, model, frame: np.ndarray, lines: dict, boxes: np.ndarray = None, **predict_args) -> tuple:
+        # (ultralytics results of every batch, (xyxy, cls, conf)) in frame pixels
+        height, width = frame.shape[:2]
+        tiles = self.__tiles(width, height)
+        active = self.activeTiles(tiles, lines, boxes)
+        self.frames += 1
+        self.tiles_run += int(active.sum())
+        self.tiles_skipped += int((~active).sum())
+
+        images = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles[active]]
+        windows = list(tiles[active])
+        if self.full_frame and len(tiles) > 1:
+            canvas, scale, pad_x, pad_y = self.__letterbox(frame)
+            images.append(canvas)
+
+        results = []
+        for start in range(0, len(images), self.max_batch):
+            results += model.predict(images[start:start + self.max_batch], imgsz=self.tile, verbose=False, **predict_args)
+
+        all_xyxy, all_cls, all_conf = [], [], []
+        for index, result in enumerate(results):
+            found = result.boxes
+            if len(found) == 0:
+                continue
+            xyxy = found.xyxy.float().cpu().numpy().astype(np.float32)
+            cls = found.cls.float().cpu().numpy().astype(np.int16)
+            conf = found.conf.float().cpu().numpy().astype(np.float32)
+            if index < len(windows):
+                x1, y1, x2, y2 = windows[index]
+                xyxy += np.array([x1, y1, x1, y1], dtype=np.float32)
+                # cut edges are the tile sides inside the frame. Without the full frame a cut box
+                # is only dropped when it fits in the overlap, so a neighbour has it complete
+                fits_x = np.full(len(xyxy), self.full_frame) | (xyxy[:, 2] - xyxy[:, 0] < self.overlap)
+                fits_y = np.full(len(xyxy), self.full_frame) | (xyxy[:, 3] - xyxy[:, 1] < self.overlap)
+                cut = np.zeros(len(xyxy), dtype=bool)
+                if x1 > 0:
+                    cut |= fits_x & (xyxy[:, 0] <= x1 + self.edge)
+                if y1 > 0:
+                    cut |= fits_y & (xyxy[:, 1] <= y1 + self.edge)
+                if x2 < width:
+                    cut |= fits_x & (xyxy[:, 2] >= x2 - self.edge)
+                if y2 < height:
+                    cut |= fits_y & (xyxy[:, 3] >= y2 - self.edge)
+                xyxy, cls, conf = xyxy[~cut], cls[~cut], conf[~cut]
+            else:
+                xyxy = (xyxy - np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)) / scale
+                xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, width)
+                xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, height)
+            all_xyxy.append(xyxy)
+            all_cls.append(cls)
+            all_conf.append(conf)
+
+        if not all_xyxy:
+            return results, (np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.int16), np.empty(0, dtype=np.float16))
+        xyxy, cls, conf = np.concatenate(all_xyxy), np.concatenate(all_cls), np.concatenate(all_conf)
+        keep = fastNms(xyxy, conf, cls, self.iou_threshold)
+        return results, (xyxy[keep], cls[keep], conf[keep].astype(np.float16))
+
+    def stats(self) -> dict:
+        total = self.tiles_run + self.tiles_skipped
+        return {
+            "frames": self.frames,
+            "tiles_per_frame": round(self.tiles_run / self.frames, 2) if self.frames else 0,
+            "skipped": round(self.tiles_skipped / total, 3) if total else 0,
+        }
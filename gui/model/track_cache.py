@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+# column name -> (dtype, per row shape)
+COLUMNS = {
+    "ids": (np.int32, ()),
+    "xyxy": (np.float32, (4,)),
+    "cls": (np.int16, ()),
+    "conf": (np.float16, ()),
+}
+
+
+def fileFingerprint(path: str, sample_size: int = 4 << 20) -> str:
+    # hashing a multi GB video fully is slow, sample head, middle and tail plus the size
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as file:
+        for offset in (0, max(size // 2 - sample_size // 2, 0), max(size - sample_size, 0)):
+            file.seek(offset)
+            digest.update(file.read(sample_size))
+    return digest.hexdigest()
+
+
+class TrackCache:
+    """
+    Per frame tracked boxes stored as memory mapped columns next to the video.
+
+    layout: <video>.trackcache/<key>/{ids,xyxy,cls,conf}.bin + offsets.npy + meta.json
+    row range of frame i is offsets[i]:offsets[i + 1]
+    """
+
+    def __init__(self, root: Path, key: str, config: dict) -> None:
+        self.root = Path(root)
+        self.key = key
+        self.config = config
+        self.meta = self.__readMeta()
+        self.columns = {}
+        self.files = {}
+        self.offsets = [0]
+        self.names = {}
+
+        if self.isComplete:
+            self.__openForRead()
+
+    @classmethod
+    def forVideo(cls, video_path: str, config: dict):
+        key_source = json.dumps(
+            {"video": fileFingerprint(video_path), **config}, sort_keys=True, default=str
+        )
+        key = hashlib.sha1(key_source.encode()).hexdigest()[:16]
+        root = Path(video_path).with_suffix(".trackcache") / key
+        return cls(root, key, config)
+
+    @property
+    def isComplete(self) -> bool:
+        return bool(self.meta.get("complete"))
+
+    @property
+    def isRecording(self) -> bool:
+        return bool(self.files)
+
+    @property
+    def numFrames(self) -> int:
+        return len(self.offsets) - 1
+
+    def __readMeta(self) -> dict:
+        try:
+            with open(self.root / "meta.json") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def __openForRead(self):
+        self.offsets = np.load(self.root / "offsets.npy")
+        self.names = {int(k): v for k, v in self.meta.get("names", {}).items()}
+        rows = int(self.offsets[-1])
+        for name, (dtype, shape) in COLUMNS.items():
+            if rows == 0:
+                self.columns[name] = np.empty((0, *shape), dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(
+                    self.root / f"{name}.bin", dtype=dtype, mode="r", shape=(rows, *shape)
+                )
+
+    def startRecording(self):
+        if self.isComplete:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        # an unfinished cache from an interrupted run is overwritten
+        self.meta = {}
+        self.offsets = [0]
+        self.files = {name: open(self.root / f"{name}.bin", "wb") for name in COLUMNS}
+
+    def frame(self, index: int):
+        if not self.isComplete or index >= self.numFrames:
+            return None
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return tuple(np.asarray(self.columns[name][start:end]) for name in COLUMNS)
+
+    def append(self, ids, xyxy, cls, conf):
+        if not self.isRecording:
+            return
+        for name, values in zip(COLUMNS, (ids, xyxy, cls, conf)):
+            dtype, _ = COLUMNS[name]
+            self.files[name].write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        self.offsets.append(self.offsets[-1] + len(ids))
+
+    def close(self, complete: bool = False, names: dict = None):
+        if not self.isRecording:
+            return
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+        if not complete:
+            return
+
+        self.names = dict(names or {})
+        np.save(self.root / "offsets.npy", np.asarray(self.offsets, dtype=np.int64))
+        self.meta = {
+            "complete": True,
+            "frames": self.numFrames,
+            "rows": self.offsets[-1],
+            "names": self.names,
+            "config": self.config,
+        }
+        with open(self.root / "meta.json", "w") as file:
+            json.dump(self.meta, file, default=str)
+        self.__openForRead()
@@ -0,0 +1,185 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from gui.utils.utils import boxIou
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+# "iou" is the built-in tracker, the yaml files are the ultralytics ones, the first is the default
+TRACKERS = ["botsort.yaml", "bytetrack.yaml", "iou"]
+
+
+def assignPairs(score: np.ndarray, threshold: float, method: str = "greedy") -> tuple:
+    # (rows, cols) of the pairs maximising score, pairs below threshold are never assigned
+    if score.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if method == "hungarian" and linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(score, maximize=True)
+        keep = score[rows, cols] >= threshold
+        return rows[keep], cols[keep]
+
+    rows, cols = [], []
+    score = score.copy()
+    for flat in np.argsort(-score, axis=None):
+        i, j = np.unravel_index(flat, score.shape)
+        if score[i, j] < threshold:
+            break
+        rows.append(i)
+        cols.append(j)
+        score[i, :] = -1
+        score[:, j] = -1
+    return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+
+class IoUTracker:
+    """
+    Detection to track association on IoU matrices with a constant velocity prediction,
+    followed by a centroid distance pass for small or fast vehicles whose boxes stop overlapping.
+
+    Works on any (xyxy, cls, conf) columns, so it runs behind model.predict of every backend
+    and on cached detections. Tracks unseen for more than `ttl` frames are dropped and a track
+    gets its id only after `min_hits` matches, earlier detections are returned with id -1.
+    "hungarian" needs scipy (an ultralytics dependency) and falls back to greedy matching.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        max_distance: float = 0.6,
+        ttl: int = 30,
+        min_hits: int = 2,
+        method: str = "hungarian",
+        class_aware: bool = False,
+    ) -> None:
+        self.iou_threshold = iou_threshold
+        # centroid gate as a fraction of the track box diagonal
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.min_hits = min_hits
+        self.method = method
+        self.class_aware = class_aware
+        self.reset()
+
+    def reset(self):
+        self.next_id = 1
+        self.ids = np.empty(0, dtype=np.int32)
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.velocity = np.empty((0, 4), dtype=np.float32)
+        self.cls = np.empty(0, dtype=np.int16)
+        self.hits = np.empty(0, dtype=np.int32)
+        self.misses = np.empty(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def predicted(self) -> np.ndarray:
+        return self.boxes + self.velocity * (self.misses[:, None] + 1)
+
+    def __centroidScore(self, predicted: np.ndarray, xyxy: np.ndarray) -> np.ndarray:
+        # 1 at the same centre, 0 at max_distance diagonals away
+        track_centre = (predicted[:, :2] + predicted[:, 2:]) / 2
+        detection_centre = (xyxy[:, :2] + xyxy[:, 2:]) / 2
+        distance = np.linalg.norm(track_centre[:, None] - detection_centre[None], axis=2)
+        diagonal = np.linalg.norm(predicted[:, 2:] - predicted[:, :2], axis=1)
+        return 1 - distance / np.maximum(diagonal[:, None] * self.max_distance, 1e-6)
+
+    def update(self, xyxy: np.ndarray, cls: np.ndarray, conf: np.ndarray = None) -> np.ndarray:
+        # returns the track id of every detection, -1 for unconfirmed ones
+        xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        cls = np.asarray(cls, dtype=np.int16).reshape(-1)
+        track_index = np.full(len(xyxy), -1, dtype=np.int64)
+
+        if len(self.ids) and len(xyxy):
+            predicted = self.predicted()
+            same_class = cls[None, :] == self.cls[:, None] if self.class_aware else True
+            score = np.where(same_class, boxIou(predicted, xyxy), 0)
+            rows, cols = assignPairs(score, self.iou_threshold, self.method)
+            track_index[cols] = rows
+
+            free_tracks = np.setdiff1d(np.arange(len(self.ids)), rows)
+            free_detections = np.flatnonzero(track_index < 0)
+            if len(free_tracks) and len(free_detections):
+                score = self.__centroidScore(predicted[free_tracks], xyxy[free_detections])
+                if self.class_aware:
+                    score[cls[None, free_detections] != self.cls[free_tracks, None]] = -1
+                rows, cols = assignPairs(score, 1e-6, self.method)
+                track_index[free_detections[cols]] = free_tracks[rows]
+
+        matched = track_index >= 0
+        tracks = track_index[matched]
+        if len(tracks):
+            steps = (self.misses[tracks] + 1)[:, None]
+            # smoothed per frame box motion
+            self.velocity[tracks] = 0.5 * self.velocity[tracks] + 0.5 * (xyxy[matched] - self.boxes[tracks]) / steps
+            self.boxes[tracks] = xyxy[matched]
+            self.cls[tracks] = cls[matched]
+            self.hits[tracks] += 1
+        seen = np.zeros(len(self.ids), dtype=bool)
+        seen[tracks] = True
+        self.misses[seen] = 0
+        self.misses[~seen] += 1
+
+        # new tracks for the unmatched detections
+        new = np.flatnonzero(~matched)
+        if len(new):
+            track_index[new] = len(self.ids) + np.arange(len(new))
+            self.ids = np.concatenate([self.ids, self.next_id + np.arange(len(new), dtype=np.int32)])
+            self.boxes = np.concatenate([self.boxes, xyxy[new]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((len(new), 4), dtype=np.float32)])
+            self.cls = np.concatenate([self.cls, cls[new]])
+            self.hits = np.concatenate([self.hits, np.ones(len(new), dtype=np.int32)])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=np.int32)])
+            self.next_id += len(new)
+
+        ids = np.where(self.hits[track_index] >= self.min_hits, self.ids[track_index], -1).astype(np.int32)
+
+        # forget tracks lost for longer than ttl, indices above are resolved already
+        alive = self.misses <= self.ttl
+        if not alive.all():
+            self.ids, self.boxes, self.velocity = self.ids[alive], self.boxes[alive], self.velocity[alive]
+            self.cls, self.hits, self.misses = self.cls[alive], self.hits[alive], self.misses[alive]
+        return ids
+
+
+class UltralyticsTracker:
+    # ultralytics BYTETracker / BOTSORT behind the same update(xyxy, cls, conf) interface
+
+    def __init__(self, tracker: str = "bytetrack.yaml", frame_rate: int = 30) -> None:
+        from ultralytics.trackers.track import TRACKER_MAP
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+
+        self.config = IterableSimpleNamespace(**yaml_load(check_yaml(tracker)))
+        self.tracker_class = TRACKER_MAP[self.config.tracker_type]
+        self.frame_rate = frame_rate
+        self.reset()
+
+    def reset(self):
+        self.tracker = self.tracker_class(args=self.config, frame_rate=self.frame_rate)
+
+    def update(self, xyxy: np.ndarray, cls: np.ndarray, conf: np.ndarray, frame: np.ndarray = None) -> np.ndarray:
+        xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        ids = np.full(len(xyxy), -1, dtype=np.int32)
+        if len(xyxy) == 0:
+            return ids
+        detections = SimpleNamespace(
+            xyxy=xyxy, xywh=np.hstack([(xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2]]),
+            cls=np.asarray(cls, dtype=np.float32), conf=np.asarray(conf, dtype=np.float32),
+        )
+        tracks = self.tracker.update(detections, frame)
+        if len(tracks):
+            # columns are x1, y1, x2, y2, id, score, cls, detection index
+            ids[tracks[:, -1].astype(int)] = tracks[:, 4].astype(np.int32)
+        return ids
+
+
+def createTracker(name: str, frame_rate: int = 30):
+    # one of TRACKERS, "iou" or an ultralytics tracker yaml
+    if name == "iou":
+        return IoUTracker()
+    return UltralyticsTracker(name, frame_rate)
@@ -0,0 +1,207 @@
+from statistics import mode
+
+import numpy as np
+
+
+# seconds of trajectories a live stream keeps for recounts
+LIVE_WINDOW = 15 * 60
+
+
+class TrajectoryStore:
+    """
+    Centroid trajectories of the processed part of a video as growable columns,
+    used to recount historical traffic whenever the counting lines change.
+
+    With a `window` (frames) only the rows of the last `window` frames are kept, older ones
+    are dropped whenever the columns fill up, so a recount covers that window and not the
+    whole run. Live streams need one, they never end.
+    """
+
+    def __init__(self, capacity: int = 4096, window: int = None) -> None:
+        self.capacity = capacity
+        self.window = window
+        self.clear()
+
+    def clear(self):
+        self.size = 0
+        self.frame = np.empty(self.capacity, dtype=np.int32)
+        self.track_id = np.empty(self.capacity, dtype=np.int32)
+        self.xy = np.empty((self.capacity, 2), dtype=np.float32)
+        self.cls = np.empty(self.capacity, dtype=np.int16)
+        # rows dropped by the window since the last clear
+        self.evicted = 0
+        self.__sorted = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def retainedFrom(self) -> int:
+        # first frame the rows still cover, 0 as long as the window has not dropped anything
+        return int(self.frame[0]) if self.evicted and self.size else 0
+
+    def __grow(self, needed: int):
+        capacity = len(self.frame)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("frame", "track_id", "xy", "cls"):
+            column = getattr(self, name)
+            grown = np.empty((capacity, *column.shape[1:]), dtype=column.dtype)
+            grown[: self.size] = column[: self.size]
+            setattr(self, name, grown)
+
+    def __evict(self, frame_index: int):
+        # rows are in frame order, the ones out of the window are a prefix
+        count = int(np.searchsorted(self.frame[: self.size], frame_index - self.window, side="right"))
+        if count == 0:
+            return
+        for name in ("frame", "track_id", "xy", "cls"):
+            column = getattr(self, name)
+            column[: self.size - count] = column[count: self.size]
+        self.size -= count
+        self.evicted += count
+
+    def append(self, frame_index: int, ids: np.ndarray, xyxy: np.ndarray, cls: np.ndarray):
+        keep = ids >= 0
+        count = int(keep.sum())
+        if count == 0:
+            return
+        if self.window is not None and self.size + count > len(self.frame):
+            self.__evict(frame_index)
+            # keep half of the columns free, a full window would otherwise evict a few rows on every append
+            self.__grow(2 * (self.size + count))
+        self.__grow(self.size + count)
+        end = self.size + count
+        boxes = xyxy[keep]
+        self.frame[self.size:end] = frame_index
+        self.track_id[self.size:end] = ids[keep]
+        self.xy[self.size:end, 0] = (boxes[:, 0] + boxes[:, 2]) / 2
+        self.xy[self.size:end, 1] = (boxes[:, 1] + boxes[:, 3]) / 2
+        self.cls[self.size:end] = cls[keep]
+        self.size = end
+        self.__sorted = None
+
+    def state(self) -> dict:
+        return {
+            "frame": self.frame[: self.size].copy(),
+            "track_id": self.track_id[: self.size].copy(),
+            "xy": self.xy[: self.size].copy(),
+            "cls": self.cls[: self.size].copy(),
+        }
+
+    def load(self, frame: np.ndarray, track_id: np.ndarray, xy: np.ndarray, cls: np.ndarray):
+        # replaces the rows, e.g. with the ones of a checkpoint
+        self.clear()
+        self.__grow(len(frame))
+        self.size = len(frame)
+        self.frame[: self.size] = frame
+        self.track_id[: self.size] = track_id
+        self.xy[: self.size] = xy
+        self.cls[: self.size] = cls
+
+    def __sortedColumns(self):
+        # rows grouped by track, frames stay ascending inside a track because rows are appended in frame order
+        if self.__sorted is None:
+            order = np.argsort(self.track_id[: self.size], kind="stable")
+            track_id = self.track_id[order]
+            # row index where each row's track starts
+            is_start = np.ones(self.size, dtype=bool)
+            is_start[1:] = track_id[1:] != track_id[:-1]
+            track_start = np.maximum.accumulate(np.where(is_start, np.arange(self.size), 0))
+            self.__sorted = {
+                "frame": self.frame[order],
+                "track_id": track_id,
+                "xy": self.xy[order].astype(np.float64),
+                "cls": self.cls[order],
+                "track_start": track_start,
+            }
+        return self.__sorted
+
+    def lineCrossings(self, geometry) -> tuple:
+        # returns the sorted row index of the step end and the segment index for every step crossing the polyline
+        columns = self.__sortedColumns()
+        xy, track_id = columns["xy"], columns["track_id"]
+        if len(xy) < 2:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        same_track = track_id[1:] == track_id[:-1]
+        p, q = xy[:-1], xy[1:]
+        steps, segments = [], []
+        vertices = np.asarray(geometry, dtype=np.float64)
+        for segment_index, (a, b) in enumerate(zip(vertices[:-1], vertices[1:])):
+            ab = b - a
+            # side of every point relative to the segment, computed once per row
+            side = ab[0] * (xy[:, 1] - a[1]) - ab[1] * (xy[:, 0] - a[0])
+            candidates = np.flatnonzero(same_track & (side[:-1] * side[1:] <= 0))
+            if len(candidates) == 0:
+                continue
+            # only the few sign changes need the second orientation test
+            pq = q[candidates] - p[candidates]
+            d3 = pq[:, 0] * (a[1] - p[candidates, 1]) - pq[:, 1] * (a[0] - p[candidates, 0])
+            d4 = pq[:, 0] * (b[1] - p[candidates, 1]) - pq[:, 1] * (b[0] - p[candidates, 0])
+            hit = candidates[(d3 * d4 <= 0) & ((side[candidates] != 0) | (side[candidates + 1] != 0))]
+            steps.append(hit + 1)
+            segments.append(np.full(len(hit), segment_index))
+
+        if not steps:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(steps), np.concatenate(segments)
+
+    def recount(self, lines: dict, window: int = 20, speed_window: int = 10) -> list:
+        # a track is counted once per line, on its first crossing of it, same as the live counter
+        columns = self.__sortedColumns()
+        rows, line_index = [], []
+        geometries = [l["geometry"] for l in lines.values()]
+        for index, geometry in enumerate(geometries):
+            hit_rows, _ = self.lineCrossings(geometry)
+            rows.append(hit_rows)
+            line_index.append(np.full(len(hit_rows), index))
+        if not rows:
+            return []
+        rows = np.concatenate(rows)
+        line_index = np.concatenate(line_index)
+        if len(rows) == 0:
+            return []
+
+        # first crossing per track and line
+        order = np.lexsort((columns["frame"][rows], line_index, columns["track_id"][rows]))
+        rows, line_index = rows[order], line_index[order]
+        tracks = columns["track_id"][rows]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (tracks[1:] != tracks[:-1]) | (line_index[1:] != line_index[:-1])
+        rows, line_index = rows[first], line_index[first]
+
+        # direction and class over the same trailing window the live counter uses
+        starts = np.maximum(columns["track_start"][rows], rows - (window - 1))
+        line_ids = list(lines.keys())
+        line_vectors = np.array([np.subtract(g[-1], g[0]) for g in geometries], dtype=np.float64)
+        motion = columns["xy"][rows] - columns["xy"][starts]
+        line_vector = line_vectors[line_index]
+        cross_product = line_vector[:, 0] * motion[:, 1] - line_vector[:, 1] * motion[:, 0]
+
+        # end points of the speed window, converted to ground speed by the caller
+        speed_starts = np.maximum(columns["track_start"][rows], rows - (speed_window - 1))
+
+        events = []
+        for row, start, speed_start, index, cross in zip(rows, starts, speed_starts, line_index, cross_product):
+            if cross < 0:
+                direction = "Forward"
+            elif cross > 0:
+                direction = "Backward"
+            else:
+                direction = "Indeterminate direction"
+            events.append(
+                {
+                    "line_id": line_ids[index],
+                    "track_id": int(columns["track_id"][row]),
+                    "frame_index": int(columns["frame"][row]),
+                    "cls": int(mode(columns["cls"][start: row + 1].tolist())),
+                    "direction": direction,
+                    "speed_points": (columns["xy"][speed_start], columns["xy"][row]),
+                    "speed_frames": int(columns["frame"][row] - columns["frame"][speed_start]),
+                }
+            )
+        events.sort(key=lambda e: e["frame_index"])
+        return events
@@ -0,0 +1,95 @@
+from statistics import mode
+
+import cv2
+import numpy as np
+
+
+class ZoneCounter:
+    """
+    Occupancy, entries, exits and dwell time of polygon zones.
+
+    The zones are rasterized once into an integer label mask at frame resolution
+    (0 = no zone, i + 1 = i-th zone) so assigning every centroid to a zone is one array lookup.
+    Where zones overlap the one drawn last wins.
+    """
+
+    def __init__(self) -> None:
+        self.mask = None
+        self.mask_key = None
+        self.zone_ids = []
+        self.reset()
+
+    def reset(self):
+        # track id -> (zone label, entry frame index, vehicle)
+        self.inside = {}
+        self.occupancy = {}
+
+    def rasterize(self, zones: dict, frame_shape: tuple):
+        key = (tuple(frame_shape[:2]), tuple((k, tuple(map(tuple, z["geometry"]))) for k, z in zones.items()))
+        if key == self.mask_key:
+            return
+        height, width = frame_shape[:2]
+        self.mask = np.zeros((height, width), dtype=np.int16)
+        self.zone_ids = list(zones.keys())
+        for label, zone in enumerate(zones.values(), start=1):
+            pts = np.round(np.asarray(zone["geometry"])).astype(np.int32).reshape((-1, 1, 2))
+            cv2.fillPoly(self.mask, [pts], label)
+        self.mask_key = key
+        # labels changed meaning, restart membership
+        self.reset()
+
+    def assign(self, xyxy: np.ndarray) -> np.ndarray:
+        if self.mask is None or len(xyxy) == 0:
+            return np.zeros(len(xyxy), dtype=np.int16)
+        height, width = self.mask.shape
+        cx = ((xyxy[:, 0] + xyxy[:, 2]) / 2).astype(np.int32).clip(0, width - 1)
+        cy = ((xyxy[:, 1] + xyxy[:, 3]) / 2).astype(np.int32).clip(0, height - 1)
+        return self.mask[cy, cx]
+
+    def step(self, ids, xyxy, zones: dict, frame_shape: tuple, frame_index: int, seconds_per_frame: float,
+             frame_time: str, track_history: dict, callback: callable):
+        if not zones:
+            if self.mask is not None:
+                self.mask, self.mask_key, self.zone_ids = None, None, []
+                self.reset()
+            return
+        self.rasterize(zones, frame_shape)
+
+        tracked = ids >= 0
+        labels = self.assign(xyxy[tracked])
+        current = dict(zip((int(i) for i in ids[tracked]), (int(l) for l in labels)))
+
+        def emit(kind, track_id, label, vehicle, dwell=None):
+            event = {
+                "type": kind,
+                "line_id": self.zone_ids[label - 1],
+                "track_id": track_id,
+                "crossing_time": frame_time,
+                "vechile": vehicle,
+                "direction": "Enter" if kind == "zone_enter" else "Exit",
+                "frame_index": frame_index,
+            }
+            if dwell is not None:
+                event["dwell"] = round(dwell, 2)
+            callback(event)
+
+        # exits, including tracks that disappeared inside a zone
+        for track_id, (label, entry_frame, vehicle) in list(self.inside.items()):
+            if current.get(track_id, 0) != label:
+                del self.inside[track_id]
+                emit("zone_exit", track_id, label, vehicle, (frame_index - entry_frame) * seconds_per_frame)
+
+        # entries
+        for track_id, label in current.items():
+            if label == 0 or track_id in self.inside:
+                continue
+            names = track_history[track_id]["name"] if track_id in track_history else []
+            vehicle = mode(names) if names else "unknown"
+            self.inside[track_id] = (label, frame_index, vehicle)
+            emit("zone_enter", track_id, label, vehicle)
+
+        counts = np.bincount(labels[labels > 0], minlength=len(self.zone_ids) + 1)[1:]
+        for zone_id, count in zip(self.zone_ids, counts):
+            if self.occupancy.get(zone_id) != int(count):
+                self.occupancy[zone_id] = int(count)
+                callback({"type": "zone_occupancy", "line_id": zone_id, "occupancy": int(count), "frame_index": frame_index})
@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class FramePool:
+    """
+    Named frame buffers allocated once and written in place every frame.
+
+    get() hands back the same array for a name as long as the requested shape does not change,
+    a new shape (another video, a resized panel) replaces that one buffer. The contents of a
+    buffer are only valid until its next user writes into it, anything kept longer is copied.
+    """
+
+    def __init__(self) -> None:
+        self.buffers = {}
+        # stats
+        self.allocations = 0
+        self.allocated_bytes = 0
+
+    def get(self, name: str, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buffer
+            self.allocations += 1
+            self.allocated_bytes += buffer.nbytes
+        return buffer
+
+    def reserve(self, names: list, shape: tuple, dtype=np.uint8):
+        # allocate up front, the frame loop then starts with every buffer in place
+        for name in names:
+            self.get(name, shape, dtype)
+
+    def clear(self):
+        self.buffers = {}
+
+    def stats(self) -> dict:
+        return {
+            "buffers": len(self.buffers),
+            "held_mb": round(sum(b.nbytes for b in self.buffers.values()) / 2 ** 20, 1),
+            "allocations": self.allocations,
+            "allocated_mb": round(self.allocated_bytes / 2 ** 20, 1),
+        }
@@ -1,19 +1,99 @@
 import sys
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+from collections import deque
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 # Uncomment below for terminal log messages
 # logging.basicConfig(level=logging.DEBUG, format=' %(asctime)s - %(name)s - %(levelname)s - %(message)s')    
 
+class LogBridge(QtCore.QObject):
+    # carries coalesced log lines to the gui thread
+    batch = QtCore.pyqtSignal(str)
+
+
 class QPlainTextEditLogger(logging.Handler):
-    def __init__(self, parent):
+    # lines are buffered by the logging thread and handed to the widget in batches by a gui timer
+    def __init__(self, parent, refresh_ms=250, max_lines=2000, max_pending=5000):
         super().__init__()
         self.widget = QtWidgets.QPlainTextEdit(parent)
-        self.widget.setReadOnly(True)    
+        self.widget.setReadOnly(True)
+        # the console keeps the newest max_lines lines only
+        self.widget.setMaximumBlockCount(max_lines)
+
+        self.pending = deque(maxlen=max_pending)
+        self.skipped = 0
+        self.pending_lock = threading.Lock()
+        self.bridge = LogBridge(parent)
+        self.bridge.batch.connect(self.widget.appendPlainText)
+        self.timer = QtCore.QTimer(parent)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(refresh_ms)
 
     def emit(self, record):
         msg = self.format(record)
-        self.widget.appendPlainText(msg)    
+        with self.pending_lock:
+            if len(self.pending) == self.pending.maxlen:
+                self.skipped += 1
+            self.pending.append(msg)
+
+    def flush(self):
+        with self.pending_lock:
+            if not self.pending:
+                return
+            lines, skipped = list(self.pending), self.skipped
+            self.pending.clear()
+            self.skipped = 0
+        if skipped:
+            lines.insert(0, f'... {skipped} log lines skipped')
+        self.bridge.batch.emit("\n".join(lines))
+
+
+class JsonFormatter(logging.Formatter):
+    # one json object per line for the log file
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%d %H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def setupLogging(handlers, log_dir=None, level=logging.INFO):
+    """
+    Routes the root logger through a QueueHandler, the given handlers (and a rotating json
+    file in log_dir) run on the QueueListener thread so logging never blocks the caller.
+    Returns the listener, stop() it on exit to flush the queue.
+    """
+    handlers = list(handlers)
+    if log_dir is not None:
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(log_dir, 'vehicle_monitor.log'), maxBytes=5 * 2 ** 20, backupCount=5, encoding='utf-8'
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
 
 
 class MyDialog(QtWidgets.QDialog):
@@ -23,9 +103,8 @@ class MyDialog(QtWidgets.QDialog):
         logTextBox = QPlainTextEditLogger(self)
         # You can format what is printed to the text box
         logTextBox.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-        logging.getLogger().addHandler(logTextBox)
         # You can control the logging level
-        logging.getLogger().setLevel(logging.DEBUG)
+        self.listener = setupLogging([logTextBox], level=logging.DEBUG)
 
         self._button = QtWidgets.QPushButton(self)
         self._button.setText('Test Me')    
@@ -50,4 +129,6 @@ if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
     dlg = MyDialog()
     dlg.show()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    dlg.listener.stop()
+    sys.exit(exit_code)
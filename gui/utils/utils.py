@@ -1,5 +1,28 @@
+import json
+
+import numpy as np
+
+
 def formatTime(time_in_Sec):
     hours, remainder = divmod(time_in_Sec, 3600)
     minutes, seconds = divmod(remainder, 60)
     # Formatting the time delta as HH:MM:SS
-    return  f"{hours:02}:{minutes:02}:{seconds:.2f}"
\ No newline at end of file
+    return  f"{hours:02}:{minutes:02}:{seconds:.2f}"
+
+
+def toJson(value) -> str:
+    # events carry numpy scalars from the box columns
+    return json.dumps(value, default=lambda v: v.item() if isinstance(v, np.generic) else str(v))
+
+
+def boxIou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # pairwise IoU matrix of (N, 4) and (M, 4) xyxy boxes
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
@@ -2,6 +2,12 @@ import sys
 from PyQt5 import QtWidgets
 from PyQt5.QtWidgets import (
     QApplication,
+    QCheckBox,
+    QComboBox,
+    QInputDialog,
+    QLabel,
+    QPushButton,
+    QSpinBox,
     QTreeWidget,
     QTreeWidgetItem,
     QMainWindow,
@@ -18,18 +24,30 @@ from gui.gui_components.wigdets import *
 # for detection
 from gui.model.list_devices import list_devices
 from gui.model.detection import Detection
+from gui.model.aggregates import CountAggregator
+from gui.model.decoder import BACKENDS, fitSize, openDecoder
+from gui.model.live_source import LiveSource
+from gui.model.renderer import VIZ_MODES, VIZ_NONE
+from gui.model.quantization import PRECISIONS, compareWithFp32
+from gui.model.autotune import autotune, defaultGrid, loadHostProfile, profileFromResult, saveHostProfile
+from gui.model.tracker import TRACKERS
+from gui.model.trajectories import LIVE_WINDOW
+from gui.model.recorder import RECORD_POLICIES, RECORD_PRESETS, VideoRecorder
+from gui.model.snapshots import SnapshotWriter
+from gui.model.checkpoint import Checkpointer
 
 # util functions
 from gui.utils.utils import formatTime
+from gui.utils.buffer_pool import FramePool
 ## for logging
 from gui.utils.log import * 
 
 # base paths
-from gui import MODELS_PATH, ASSETS_PATH
+from gui import MODELS_PATH, ASSETS_PATH, RECORDINGS_PATH, SNAPSHOTS_PATH, LOGS_PATH, CHECKPOINTS_PATH
 
 import cv2
 import numpy as np
-from uuid import uuid1
+from uuid import uuid1, UUID
 import os, math
 from datetime import datetime
 import csv
@@ -54,9 +72,8 @@ class App(QtWidgets.QWidget):
         logTextBox = QPlainTextEditLogger(self)
         # You can format what is printed to the text box
         logTextBox.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-        logging.getLogger().addHandler(logTextBox)
-        # You can control the logging level
-        logging.getLogger().setLevel(logging.DEBUG)
+        # console and rotating json file are fed from a queue listener thread
+        self.log_listener = setupLogging([logTextBox], LOGS_PATH, logging.INFO)
 
         # Add the new logging box widget to the ui.console groupbox
         layout = QtWidgets.QVBoxLayout(self.ui.console)
@@ -83,6 +100,29 @@ class App(QtWidgets.QWidget):
         
 
         self.ui.modelpathlineedit.setText(default_model)
+        self.__applyHostProfile(loadHostProfile())
+
+    def __applyHostProfile(self, profile):
+        # tuned configuration of this machine, see gui/model/autotune.py
+        if not profile:
+            return
+        config = profile["config"]
+        if not os.path.exists(config.get("model") or ""):
+            config = {**config, "model": self.detector.model_path}
+        try:
+            self.detector.configure(config)
+        except Exception as e:
+            logging.error(f'unable to apply host profile : {e}')
+            return
+
+        for widget in (self.stridespinbox, self.precisionselector):
+            widget.blockSignals(True)
+        self.stridespinbox.setValue(self.detector.frame_stride)
+        self.precisionselector.setCurrentText(self.detector.precision)
+        for widget in (self.stridespinbox, self.precisionselector):
+            widget.blockSignals(False)
+        self.ui.modelpathlineedit.setText(self.detector.model_path)
+        logging.info(f'host profile applied : {config}, {profile.get("fps")} fps, accuracy {profile.get("accuracy")}')
     
     def chooseModel(self):
         modelPath = self.chooseFile()
@@ -104,6 +144,17 @@ class App(QtWidgets.QWidget):
         self.ui.modelchooserbtn.setEnabled(toggle)
         self.ui.deviceselector.setEnabled(toggle)
         self.ui.vizselectro.setEnabled(toggle)
+        self.stridespinbox.setEnabled(toggle)
+        self.motioncheckbox.setEnabled(toggle)
+        self.trackerselector.setEnabled(toggle)
+        self.cascadecheckbox.setEnabled(toggle)
+        self.cascadeselector.setEnabled(toggle)
+        self.tilingcheckbox.setEnabled(toggle)
+        self.recordselector.setEnabled(toggle)
+        self.recordpolicyselector.setEnabled(toggle)
+        self.precisionselector.setEnabled(toggle)
+        self.accuracybtn.setEnabled(toggle)
+        self.autotunebtn.setEnabled(toggle)
 
     def onVizModeChange(self):
         mode_index = self.ui.vizselectro.currentIndex()
@@ -117,6 +168,132 @@ class App(QtWidgets.QWidget):
         self.detector.selectDevice(device)
         self.detector.resetModel()
     
+    def onTrackerChange(self):
+        tracker = self.trackerselector.currentText()
+        logging.info(f"tracker changed to: {tracker}")
+        self.detector.setTracker(tracker)
+        self.__dropTrackCache()
+        self.detector.resetModel()
+
+    def onStrideChange(self, stride):
+        logging.info(f"frame stride changed to: {stride}")
+        # event times of a video follow its decoder position, the new stride starts at the next read
+        position = self.cap.next_index if self.video_path is not None and not self.is_live else None
+        self.detector.setFrameStride(stride, position)
+        self.__dropTrackCache()
+
+    def onMotionGatingToggle(self, checked):
+        logging.info(f"motion gating : {checked}")
+        self.detector.setMotionGating(checked)
+        self.__dropTrackCache()
+
+    def __dropTrackCache(self):
+        # the cache is keyed by the settings it was opened with, boxes tracked with other ones must not end up in it
+        if self.detector.track_cache is None:
+            return
+        logging.info('tracking settings changed, the track cache of this video is dropped')
+        self.detector.closeTrackCache()
+        self.recountbtn.setEnabled(False)
+
+    def onTilingToggle(self, checked):
+        logging.info(f"tiled inference : {checked}")
+        # tiling builds a new tracker, its ids start over like on a tracker change
+        self.detector.setTiling(checked)
+        self.__dropTrackCache()
+        self.detector.resetModel()
+
+    def onCascadeToggle(self, checked):
+        model_path = os.path.join(MODELS_PATH, self.cascadeselector.currentText()) if checked else None
+        try:
+            self.detector.setCascade(model_path)
+        except Exception as e:
+            logging.error(e)
+            QMessageBox.critical(self, "Error", str(e))
+            self.cascadecheckbox.setChecked(False)
+            return
+        logging.info(f"cascade model : {model_path}")
+        self.__dropTrackCache()
+
+    def __calibrationVideo(self):
+        if self.video_path is not None and os.path.isfile(self.video_path):
+            return self.video_path
+        return None
+
+    def onPrecisionChange(self):
+        precision = self.precisionselector.currentText()
+        logging.info(f"precision changed to: {precision}")
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            self.detector.setPrecision(precision, self.__calibrationVideo())
+            self.__dropTrackCache()
+            self.detector.resetModel()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"unable to load {precision} model: {e}")
+            logging.error(e)
+            self.detector.setPrecision("fp32")
+            self.precisionselector.setCurrentIndex(0)
+        finally:
+            QApplication.restoreOverrideCursor()
+
+    def checkPrecisionAccuracy(self):
+        precision = self.precisionselector.currentText()
+        if self.__calibrationVideo() is None or precision == "fp32":
+            QMessageBox.information(self, "Information", "Load a video file and select a reduced precision first")
+            return
+
+        def factory(name):
+            detector = Detection(device=str(self.detector.device), viz_mode=VIZ_NONE)
+            detector.imgsz = self.detector.imgsz
+            detector.setPrecision(name, self.__calibrationVideo())
+            detector.loadModel(self.detector.model_path)
+            return detector
+
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            report = compareWithFp32(factory, precision, self.video_path, self.crossingLines)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"accuracy check failed: {e}")
+            logging.error(e)
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        logging.info(f'precision check : {report}')
+        QMessageBox.information(self, "Precision check", "\n".join(f"{k}: {v}" for k, v in report.items()))
+
+    def autoTune(self, threshold=0.95):
+        if self.__calibrationVideo() is None:
+            QMessageBox.information(self, "Information", "Load a video file first")
+            return
+
+        def factory(config):
+            detector = Detection(device=str(self.detector.device), viz_mode=VIZ_NONE)
+            detector.calibration_video = self.__calibrationVideo()
+            detector.configure(config)
+            return detector
+
+        def progress(done, total):
+            self.ui.progressBar.setValue(int(done / total * 100))
+            QApplication.processEvents()
+
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            lines = self.crossingLines
+            best, _ = autotune(factory, self.video_path, lines, defaultGrid(self.detector.model_path), threshold=threshold, progress=progress)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"auto tune failed: {e}")
+            logging.error(e)
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        if best is None:
+            QMessageBox.information(self, "Auto tune", f"No configuration reached accuracy {threshold}")
+            return
+        profile = profileFromResult(best, self.video_path, threshold)
+        path = saveHostProfile(profile)
+        self.__applyHostProfile(profile)
+        QMessageBox.information(self, "Auto tune", f"Saved to {path}\n" + "\n".join(f"{k}: {v}" for k, v in profile["config"].items()) + f"\nfps: {profile['fps']}")
+
     def chooseFile(self):
         file_dialog = QFileDialog(self)
         file_dialog.setFileMode(QFileDialog.ExistingFile)
@@ -128,6 +305,116 @@ class App(QtWidgets.QWidget):
     def __initWidgets(self):
         self.videoDialog = VideoFileLodingWidget()
 
+        # shape drawn next: counting line or polygon zone
+        self.shapeselector = QComboBox(self.ui.drawing_butt)
+        self.shapeselector.addItems(["Line", "Zone"])
+        self.ui.horizontalLayout_2.insertWidget(0, self.shapeselector)
+
+        # four point ground plane calibration for speeds
+        self.calibratebtn = QPushButton("Calibrate speed", self.ui.drawing_butt)
+        self.ui.horizontalLayout_2.addWidget(self.calibratebtn)
+
+        # which line each vehicle entered by and left by
+        self.odWidget = ODMatrixWidget()
+        self.odbtn = QPushButton("OD matrix", self.ui.drawing_butt)
+        self.ui.horizontalLayout_2.addWidget(self.odbtn)
+
+        # extra visualization modes beyond the ones in the form
+        for mode_name in VIZ_MODES[self.ui.vizselectro.count():]:
+            self.ui.vizselectro.addItem(mode_name)
+
+        # track cache controls
+        self.cachecheckbox = QCheckBox("Cache tracks", self.ui.groupBox_2)
+        self.cachecheckbox.setToolTip("Store tracked boxes next to the video so counts can be recomputed without the model")
+        self.ui.gridLayout_2.addWidget(self.cachecheckbox, 3, 0, 1, 1)
+        self.recountbtn = QPushButton("Recount from cache", self.ui.groupBox_2)
+        self.recountbtn.setEnabled(False)
+        self.ui.gridLayout_2.addWidget(self.recountbtn, 3, 1, 1, 2)
+
+        # decoding controls
+        self.ui.gridLayout_2.addWidget(QLabel("Decoder :", self.ui.groupBox_2), 4, 0, 1, 1)
+        self.decoderselector = QComboBox(self.ui.groupBox_2)
+        self.decoderselector.addItems(BACKENDS)
+        self.ui.gridLayout_2.addWidget(self.decoderselector, 4, 1, 1, 2)
+        self.ui.gridLayout_2.addWidget(QLabel("Frame stride :", self.ui.groupBox_2), 5, 0, 1, 1)
+        self.stridespinbox = QSpinBox(self.ui.groupBox_2)
+        self.stridespinbox.setRange(1, 30)
+        self.stridespinbox.setToolTip("Run the model on every n-th frame, skipped frames are not converted")
+        self.ui.gridLayout_2.addWidget(self.stridespinbox, 5, 1, 1, 1)
+        self.modelsizecheckbox = QCheckBox("Decode at model size", self.ui.groupBox_2)
+        self.ui.gridLayout_2.addWidget(self.modelsizecheckbox, 5, 2, 1, 1)
+
+        # reduced precision inference
+        self.ui.gridLayout_2.addWidget(QLabel("Precision :", self.ui.groupBox_2), 6, 0, 1, 1)
+        self.precisionselector = QComboBox(self.ui.groupBox_2)
+        self.precisionselector.addItems(PRECISIONS)
+        self.ui.gridLayout_2.addWidget(self.precisionselector, 6, 1, 1, 1)
+        self.accuracybtn = QPushButton("Check accuracy", self.ui.groupBox_2)
+        self.accuracybtn.setToolTip("Compare detections and counts of the selected precision against fp32 on the loaded video")
+        self.ui.gridLayout_2.addWidget(self.accuracybtn, 6, 2, 1, 1)
+        self.autotunebtn = QPushButton("Auto tune", self.ui.groupBox_2)
+        self.autotunebtn.setToolTip("Benchmark input size, threads, precision and stride on the loaded video and save the fastest accurate setup for this machine")
+        self.ui.gridLayout_2.addWidget(self.autotunebtn, 7, 1, 1, 2)
+        self.motioncheckbox = QCheckBox("Motion gating", self.ui.groupBox_2)
+        self.motioncheckbox.setToolTip("Skip the model on frames without motion near the lines and zones")
+        self.ui.gridLayout_2.addWidget(self.motioncheckbox, 7, 0, 1, 1)
+        self.ui.gridLayout_2.addWidget(QLabel("Tracker :", self.ui.groupBox_2), 8, 0, 1, 1)
+        self.trackerselector = QComboBox(self.ui.groupBox_2)
+        self.trackerselector.addItems(TRACKERS)
+        self.trackerselector.setToolTip("iou is the built-in numpy tracker, it runs behind every model backend")
+        self.ui.gridLayout_2.addWidget(self.trackerselector, 8, 1, 1, 2)
+
+        # annotated video recording
+        self.recordcheckbox = QCheckBox("Record video", self.ui.groupBox_2)
+        self.recordcheckbox.setToolTip(f"Save the annotated frames to {RECORDINGS_PATH}, encoded on a background thread")
+        self.ui.gridLayout_2.addWidget(self.recordcheckbox, 9, 0, 1, 1)
+        self.recordselector = QComboBox(self.ui.groupBox_2)
+        self.recordselector.addItems(RECORD_PRESETS)
+        self.ui.gridLayout_2.addWidget(self.recordselector, 9, 1, 1, 1)
+        self.recordpolicyselector = QComboBox(self.ui.groupBox_2)
+        self.recordpolicyselector.addItems(RECORD_POLICIES)
+        self.recordpolicyselector.setToolTip("When the encoder falls behind : drop frames from the recording or block the analysis until it catches up")
+        self.ui.gridLayout_2.addWidget(self.recordpolicyselector, 9, 2, 1, 1)
+        self.snapshotcheckbox = QCheckBox("Vehicle snapshots", self.ui.groupBox_2)
+        self.snapshotcheckbox.setToolTip(f"Save a crop of every counted vehicle to {SNAPSHOTS_PATH}")
+        self.ui.gridLayout_2.addWidget(self.snapshotcheckbox, 10, 0, 1, 3)
+
+        # larger model for the vehicles the loaded model is unsure about
+        self.cascadecheckbox = QCheckBox("Re-check with", self.ui.groupBox_2)
+        self.cascadecheckbox.setToolTip("Re-classify low confidence or ambiguous vehicles near the lines with a larger model, once per track")
+        self.ui.gridLayout_2.addWidget(self.cascadecheckbox, 11, 0, 1, 1)
+        self.cascadeselector = QComboBox(self.ui.groupBox_2)
+        if os.path.isdir(MODELS_PATH):
+            self.cascadeselector.addItems(sorted(f for f in os.listdir(MODELS_PATH) if f.endswith(".pt")))
+        self.ui.gridLayout_2.addWidget(self.cascadeselector, 11, 1, 1, 2)
+        self.tilingcheckbox = QCheckBox("Tiled inference", self.ui.groupBox_2)
+        self.tilingcheckbox.setToolTip("Detect on overlapping full resolution tiles near the lines, for small vehicles in 4K feeds")
+        self.ui.gridLayout_2.addWidget(self.tilingcheckbox, 12, 0, 1, 3)
+
+        # traffic density heatmap, shown with the heatmap visualization mode
+        self.heatmapcheckbox = QCheckBox("Live heatmap", self.ui.groupBox_2)
+        self.heatmapcheckbox.setToolTip("Let old traffic fade out of the heatmap, half of it every minute")
+        self.ui.gridLayout_2.addWidget(self.heatmapcheckbox, 13, 0, 1, 1)
+        self.heatmapsavebtn = QPushButton("Save heatmap", self.ui.groupBox_2)
+        self.ui.gridLayout_2.addWidget(self.heatmapsavebtn, 13, 1, 1, 1)
+        self.heatmaploadbtn = QPushButton("Load heatmap", self.ui.groupBox_2)
+        self.ui.gridLayout_2.addWidget(self.heatmaploadbtn, 13, 2, 1, 1)
+        self.heatmapclearbtn = QPushButton("Clear heatmap", self.ui.groupBox_2)
+        self.ui.gridLayout_2.addWidget(self.heatmapclearbtn, 14, 2, 1, 1)
+
+        # crash checkpoints
+        self.checkpointcheckbox = QCheckBox("Checkpoints", self.ui.groupBox_2)
+        self.checkpointcheckbox.setToolTip("Save the progress every 30 seconds, an interrupted video resumes where it stopped")
+        self.checkpointcheckbox.setChecked(True)
+        self.ui.gridLayout_2.addWidget(self.checkpointcheckbox, 14, 0, 1, 2)
+
+        # per line totals next to the line geometry
+        self.ui.infotable_1.setColumnCount(3)
+        self.ui.infotable_1.setHorizontalHeaderItem(2, QTableWidgetItem("Count"))
+        self.ui.infotable_2.setColumnCount(8)
+        self.ui.infotable_2.setHorizontalHeaderItem(6, QTableWidgetItem("Speed (km/h)"))
+        self.ui.infotable_2.setHorizontalHeaderItem(7, QTableWidgetItem("Snapshot"))
+
     def __initEventsAndCallBacks(self):
         # all button callbacks
         self.ui.playpausebtn.setEnabled(False)
@@ -156,6 +443,47 @@ class App(QtWidgets.QWidget):
         # export to csv callback
         self.ui.exportreportbtn.clicked.connect(self.exportTable)
 
+        # recount from track cache
+        self.recountbtn.clicked.connect(self.recountFromCache)
+
+        # speed calibration
+        self.calibratebtn.clicked.connect(self.startSpeedCalibration)
+
+        # origin-destination matrix
+        self.odbtn.clicked.connect(self.showODMatrix)
+        self.odWidget.exportRequested.connect(self.exportODMatrix)
+
+        # precision
+        self.precisionselector.currentIndexChanged.connect(self.onPrecisionChange)
+        self.accuracybtn.clicked.connect(self.checkPrecisionAccuracy)
+        self.autotunebtn.clicked.connect(self.autoTune)
+
+        # motion gating
+        self.motioncheckbox.toggled.connect(self.onMotionGatingToggle)
+
+        # tracker
+        self.trackerselector.currentIndexChanged.connect(self.onTrackerChange)
+
+        # tiling
+        self.tilingcheckbox.toggled.connect(self.onTilingToggle)
+
+        # heatmap
+        self.heatmapcheckbox.toggled.connect(lambda checked: self.detector.setHeatmapDecay(60.0 if checked else None))
+        self.heatmapsavebtn.clicked.connect(self.saveHeatmap)
+        self.heatmaploadbtn.clicked.connect(self.loadHeatmap)
+        self.heatmapclearbtn.clicked.connect(self.clearHeatmap)
+
+        # cascade
+        self.cascadecheckbox.toggled.connect(self.onCascadeToggle)
+        self.cascadeselector.currentIndexChanged.connect(lambda: self.onCascadeToggle(self.cascadecheckbox.isChecked()))
+
+        # frame stride
+        self.stridespinbox.valueChanged.connect(self.onStrideChange)
+
+        # recording
+        self.recordcheckbox.toggled.connect(self.onRecordToggle)
+        self.snapshotcheckbox.toggled.connect(self.onSnapshotToggle)
+
 
     def __initVariables(self):
         self._translate = QCoreApplication.translate
@@ -165,8 +493,19 @@ class App(QtWidgets.QWidget):
         self.currect_point = None
         self.line = []
         self.lines = {}
+        self.shape_types = {}
+        self.zone_occupancy = {}
+        self.calibration_points = None
         self.line_id = uuid1()
         self.video_path = None
+        self.is_live = False
+        self.aggregates = CountAggregator()
+        self.recorder = None
+        # frame sized buffers reused by decode, colour conversion and display
+        self.pool = FramePool()
+        # od matrix version shown in the od window
+        self.od_version = -1
+        self.checkpointer = None
 
         # for toggling video play/payse and drawing
         self.is_video_running = False
@@ -176,9 +515,19 @@ class App(QtWidgets.QWidget):
         self.total_frames = 0
         self.completed_frames = 1
         self.videoDuration = 0
+        self.fps = 0
 
     def initCap(self):
-        self.cap = cv2.VideoCapture(self.video_path)
+        try:
+            if self.is_live:
+                # always process the newest frame of the stream
+                self.cap = LiveSource(self.video_path, self.decoderselector.currentText())
+            else:
+                self.cap = openDecoder(self.video_path, self.decoderselector.currentText())
+        except Exception as e:
+            logging.error(e)
+            QMessageBox.critical(self, "Error", str(e))
+            return
         
         if not self.cap.isOpened():
             logging.error(f'unable to capture video from source : {self.video_path}')
@@ -194,19 +543,36 @@ class App(QtWidgets.QWidget):
         self.ui.toggledrawingbtn.setEnabled(True)
 
         # Calculate the duration in seconds
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.total_frames = self.cap.frame_count
         self.completed_frames = 1
-        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        fps = self.cap.fps
+        self.fps = fps
+        self.detector.setFps(fps)
+        self.detector.setFrameStride(self.stridespinbox.value())
+        # a stream never ends, its recounts only go back a window
+        self.detector.setTrajectoryWindow(LIVE_WINDOW if self.is_live else None)
+
+        # let the decoder scale straight to the model input size
+        if self.modelsizecheckbox.isChecked() and self.cap.width:
+            self.cap.setSize(fitSize(self.cap.width, self.cap.height, self.detector.imgsz))
         try:
             self.videoDuration = self.total_frames / fps
         except Exception as e:
             logging.info(e)
-        logging.info(f'Video loaded Successfilly, Tatal frames: {self.total_frames}, FPS: {fps}, duration: {self.videoDuration}')
+        if not self.total_frames:
+            logging.warning(f'frame count of {self.cap.name} unknown, the progress bar stays empty')
+        logging.info(f'Video loaded Successfilly, Tatal frames: {self.total_frames}, FPS: {fps}, duration: {self.videoDuration}, decoder: {self.cap.name}')
+
+        # buffers for the new resolution, live sources without a known size allocate on the first frame
+        self.pool.clear()
+        width, height = self.cap.outputSize
+        if width and height:
+            self.pool.reserve(["decode", "rgb", "display"], (height, width, 3))
 
-        ret, frame = self.cap.read()
+        ret, frame = self.cap.read(out=self.pool.buffers.get("decode"))
         if not ret:
             return
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.pool.get("rgb", frame.shape))
         self.frame = frame
     
         # Reset progress bar
@@ -215,9 +581,16 @@ class App(QtWidgets.QWidget):
         # Reset video current time
         self.ui.videocurrenttime.setText(self._translate("Form", "00:00:00 SEC"))
 
-        # Reset infotable_1 and lines
+        # Reset infotable_1, lines and counts
         self.lines = {}
+        self.shape_types = {}
+        self.zone_occupancy = {}
         self.ui.infotable_1.setRowCount(0)
+        self.aggregates.reset()
+        self.detector.od.reset()
+        # a loaded heatmap goes on with a source of the same size, e.g. the same camera on another day
+        if self.detector.heatmap.frame_shape != frame.shape[:2]:
+            self.detector.heatmap.reset()
 
         # time pulse for update frames
         self.timer = QTimer()
@@ -225,29 +598,228 @@ class App(QtWidgets.QWidget):
 
         # reset model
         self.detector.resetModel()
+        if not self.is_live:
+            # the first frame was read for the preview already
+            self.detector.setFrameStride(self.detector.frame_stride, self.cap.next_index)
+        self.__initTrackCache()
+        self.__stopRecorder()
+        if self.recordcheckbox.isChecked():
+            self.__startRecorder()
+        self.__stopSnapshots()
+        if self.snapshotcheckbox.isChecked():
+            self.__startSnapshots()
 
 
         self.__display(self.frame)
+        self.__initCheckpoint()
+
+    def __initCheckpoint(self):
+        # offers to resume an interrupted run of this source, then keeps checkpointing it
+        if self.checkpointer is not None:
+            self.checkpointer.close()
+            self.checkpointer = None
+        if not self.checkpointcheckbox.isChecked():
+            return
+        try:
+            self.checkpointer = Checkpointer(CHECKPOINTS_PATH, self.video_path)
+        except Exception as e:
+            logging.error(f'unable to open checkpoints : {e}')
+            return
+
+        state = self.checkpointer.load()
+        if state is None:
+            self.checkpointer.clear()
+            return
+        answer = QMessageBox.question(
+            self, "Resume", f"This video was interrupted at {state['video_time']}, continue from there?"
+        )
+        if answer != QMessageBox.Yes:
+            self.checkpointer.clear()
+            return
+        try:
+            self.__resumeCheckpoint(state)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred while resuming, starting over: {e}")
+            logging.error(e)
+            self.checkpointer.clear()
+            self.initCap()
+            return
+        logging.info(f'resumed from checkpoint at frame {state["position"]}, crossings : {self.ui.infotable_2.rowCount()}')
+
+    def __resumeCheckpoint(self, state):
+        if not self.is_live and not self.cap.seek(state["position"]):
+            raise Exception(f"unable to seek to frame {state['position']}")
+
+        for line_id, line in state["lines"].items():
+            line_id = UUID(line_id)
+            self.lines[line_id] = self.__fromFrameCoordinates(line["points"])
+            self.shape_types[line_id] = line["type"]
+            numRows = self.ui.infotable_1.rowCount()
+            self.ui.infotable_1.insertRow(numRows)
+            self.ui.infotable_1.setItem(numRows, 0, QTableWidgetItem(str(line_id)))
+            self.ui.infotable_1.setItem(numRows, 1, QTableWidgetItem(str(self.lines[line_id])))
+        keys = {str(key): key for key in self.lines}
+        self.zone_occupancy = {keys[k]: v for k, v in state["zone_occupancy"].items() if k in keys}
+
+        # a recording track cache has to start at frame 0, a complete one is still valid
+        if self.detector.track_cache is not None and not self.detector.track_cache.isComplete:
+            self.detector.closeTrackCache()
+        self.detector.restoreCheckpoint(state["detector"], self.crossingLines)
+        self.od_version = -1
+
+        # events past the checkpoint are cut off, the frames after it produce them again
+        events = self.checkpointer.restore(state, self.detector.trajectories)
+        self.__removeTrackingRows(self.video_path)
+        self.ui.infotable_2.setUpdatesEnabled(False)
+        for event in events:
+            event["line_id"] = keys.get(str(event["line_id"]), event["line_id"])
+            self.__appendTrackingRow(event)
+            self.aggregates.add(event)
+        self.ui.infotable_2.setUpdatesEnabled(True)
+        self.__updateLineCounts()
+
+        self.completed_frames = state["completed_frames"]
+        self.ui.videocurrenttime.setText(state["video_time"])
+        if self.total_frames:
+            self.ui.progressBar.setValue(min(math.ceil(self.completed_frames / self.total_frames * 100), 100))
+
+    def __saveCheckpoint(self):
+        state = {
+            "source": self.video_path,
+            "position": self.cap.next_index,
+            "completed_frames": self.completed_frames,
+            "video_time": self.ui.videocurrenttime.text(),
+            "lines": {
+                str(line_id): {"points": self.__toFrameCoordinates(points), "type": self.shape_types.get(line_id, "line")}
+                for line_id, points in self.lines.items()
+            },
+            "zone_occupancy": {str(line_id): occupancy for line_id, occupancy in self.zone_occupancy.items()},
+            "detector": self.detector.checkpointState(),
+        }
+        try:
+            self.checkpointer.save(state, self.detector.trajectories)
+        except Exception as e:
+            logging.error(f'unable to save checkpoint : {e}')
+
+    def __finishCheckpoint(self):
+        # the video is done, there is nothing left to resume
+        if self.checkpointer is None:
+            return
+        logging.info(f'checkpoints : {self.checkpointer.stats()}')
+        self.checkpointer.clear()
+
+
+    def __startRecorder(self):
+        scale, fps_divisor = RECORD_PRESETS[self.recordselector.currentText()]
+        name = Path(self.video_path).stem if not self.is_live else "live"
+        os.makedirs(RECORDINGS_PATH, exist_ok=True)
+        path = os.path.join(RECORDINGS_PATH, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4")
+        # one written frame per processed frame
+        fps = self.fps / self.detector.frame_stride if self.fps else 0
+        try:
+            self.recorder = VideoRecorder(path, fps, scale=scale, fps_divisor=fps_divisor, policy=self.recordpolicyselector.currentText())
+        except Exception as e:
+            logging.error(f'unable to start recording : {e}')
+            return
+        logging.info(f'recording to : {path}')
+
+    def __stopRecorder(self):
+        if self.recorder is None:
+            return
+        recorder, self.recorder = self.recorder, None
+        logging.info(f'recording saved : {recorder.path}, {recorder.close()}')
+
+    def onRecordToggle(self, checked):
+        if not checked:
+            self.__stopRecorder()
+        elif self.recorder is None and self.video_path is not None and self.cap.isOpened():
+            self.__startRecorder()
 
+    def __startSnapshots(self):
+        name = Path(self.video_path).stem if not self.is_live else "live"
+        self.detector.snapshots = SnapshotWriter(SNAPSHOTS_PATH, name)
+
+    def __stopSnapshots(self):
+        if self.detector.snapshots is None:
+            return
+        snapshots, self.detector.snapshots = self.detector.snapshots, None
+        logging.info(f'snapshots : {snapshots.close()}')
+
+    def onSnapshotToggle(self, checked):
+        if not checked:
+            self.__stopSnapshots()
+        elif self.detector.snapshots is None and self.video_path is not None:
+            self.__startSnapshots()
+
+    def __initTrackCache(self):
+        self.recountbtn.setEnabled(False)
+        if not self.cachecheckbox.isChecked() or not os.path.isfile(self.video_path):
+            return
+
+        try:
+            cache = self.detector.openTrackCache(self.video_path, {"decode_size": self.cap.outputSize})
+        except Exception as e:
+            logging.error(f'unable to open track cache : {e}')
+            return
+
+        if cache.isComplete:
+            self.recountbtn.setEnabled(True)
+            logging.info(f'using cached tracks ({cache.numFrames} frames) from : {cache.root}')
+        else:
+            logging.info(f'recording tracks to : {cache.root}')
+
+    def recountFromCache(self):
+        if self.is_video_running:
+            self.videoToggler()
+
+        self.__removeTrackingRows(self.video_path)
+        self.aggregates.reset()
+        self.zone_occupancy = {}
+        if self.checkpointer is not None:
+            # the recount logs every event of the video again
+            self.checkpointer.events.truncate(0)
+        try:
+            self.detector.recountFromCache(self.crossingLines, self.updateTrackingTable)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred while recounting: {e}")
+            logging.error(e)
+            return
+        logging.info(f'recount completed, crossings : {self.ui.infotable_2.rowCount()}')
+        self.__refreshODMatrix()
 
     def __display(self, frame):
 
         height, width, _ = frame.shape
-        for _, line in self.lines.items():
+        # overlays go on a copy, a paused frame is redrawn every tick and has to stay clean
+        canvas = self.pool.get("display", frame.shape)
+        np.copyto(canvas, frame)
+        frame = canvas
+        for line_id, line in self.lines.items():
             scale_x = width / self.q_img.size().width()
             scale_y = height / self.q_img.size().height()
             points = [(point.x() * scale_x, point.y() * scale_y) for point in line]
             pts = np.array(points, dtype=np.int32).reshape((-1, 1, 2))
-            frame = cv2.polylines(frame, [pts], False, (0, 255, 0), 2, lineType=cv2.LINE_AA)
-
-        bytes_per_line = 3 * width
-        self.q_img = QImage(
-            frame.data, width, height, bytes_per_line, QImage.Format_RGB888
+            is_zone = self.shape_types.get(line_id) == "zone"
+            colour = (255, 160, 0) if is_zone else (0, 255, 0)
+            frame = cv2.polylines(frame, [pts], is_zone, colour, 2, lineType=cv2.LINE_AA)
+
+        if self.detector.speed.isCalibrated:
+            pts = self.detector.speed.image_points.astype(np.int32).reshape((-1, 1, 2))
+            frame = cv2.polylines(frame, [pts], True, (0, 120, 255), 1, lineType=cv2.LINE_AA)
+
+        # scale to the panel keeping the aspect ratio, into a buffer reused until the panel is resized
+        panel = self.ui.video_panel.size()
+        scale = min(panel.width() / width, panel.height() / height)
+        scaled_width, scaled_height = max(int(width * scale), 1), max(int(height * scale), 1)
+        scaled = cv2.resize(
+            frame,
+            (scaled_width, scaled_height),
+            dst=self.pool.get("scaled", (scaled_height, scaled_width, 3)),
+            interpolation=cv2.INTER_NEAREST,
         )
-        self.q_img = self.q_img.scaled(
-            self.ui.video_panel.size(),
-            aspectRatioMode=Qt.KeepAspectRatio,
-            transformMode=Qt.FastTransformation,
+        bytes_per_line = 3 * scaled_width
+        self.q_img = QImage(
+            scaled.data, scaled_width, scaled_height, bytes_per_line, QImage.Format_RGB888
         )
         
         self.dif = self.ui.video_panel.size() - self.q_img.size()
@@ -271,35 +843,165 @@ class App(QtWidgets.QWidget):
         self.painter.end()
         self.ui.video_panel.update()
 
-    @property
-    def crossingLines(self):
-        lines = {}
+    def __fromFrameCoordinates(self, points):
+        # frame pixels -> video panel points
+        height, width, _ = self.frame.shape
+        scale_x = width / self.q_img.size().width()
+        scale_y = height / self.q_img.size().height()
+        return [QPoint(round(x / scale_x), round(y / scale_y)) for x, y in points]
+
+    def __toFrameCoordinates(self, points):
+        # video panel points -> frame pixels
         height, width, _ = self.frame.shape
         scale_x = width / self.q_img.size().width()
         scale_y = height / self.q_img.size().height()
+        return [(point.x() * scale_x, point.y() * scale_y) for point in points]
+
+    @property
+    def crossingLines(self):
+        lines = {}
     
         for uuid_key, points in self.lines.items():
             # points= [point + (self.dif / 2) for point in points]
             
-            geometry = [(point.x() * scale_x, point.y() * scale_y) for point in points]
+            geometry = self.__toFrameCoordinates(points)
             # Constructing the final dictionary
+            shape_type = self.shape_types.get(uuid_key, "line")
             lines[uuid_key] = {
                 "geometry": geometry,
-                "color": (0, 255, 0),  # Default color
-                "type": "line"
+                "color": (255, 160, 0) if shape_type == "zone" else (0, 255, 0),  # Default color
+                "type": shape_type
             }
         return lines
     
     def updateTrackingTable(self, data):
+        if data.get("type") == "zone_occupancy":
+            # occupancy changes only update the zone row, not the event table
+            self.zone_occupancy[data["line_id"]] = data["occupancy"]
+            self.__updateLineCounts()
+            return
+
         logging.info(f'Tracking info : {data}')
+        self.__appendTrackingRow(data)
+        self.aggregates.add(data)
+        if self.checkpointer is not None:
+            self.checkpointer.events.append(data)
+        self.__updateLineCounts()
+
+    def __appendTrackingRow(self, data):
         data['file'] = self.video_path
         numRows = self.ui.infotable_2.rowCount()
         self.ui.infotable_2.insertRow(numRows)
         for i, key in enumerate(["file", "line_id", "track_id", "crossing_time","vechile","direction"]):
             self.ui.infotable_2.setItem(numRows, i, QTableWidgetItem(str(data[key])))
+        # the processed frame of the crossing, recounts replace the rows of their window only
+        self.ui.infotable_2.item(numRows, 0).setData(Qt.UserRole, data.get("frame_index"))
+        speed = data.get("speed")
+        self.ui.infotable_2.setItem(numRows, 6, QTableWidgetItem("" if speed is None else str(speed)))
+        self.ui.infotable_2.setItem(numRows, 7, QTableWidgetItem(data.get("snapshot") or ""))
+
+    def __removeTrackingRows(self, file, line_ids=None):
+        # rows of other files (and of other lines when given) stay in the table
+        line_ids = None if line_ids is None else {str(line_id) for line_id in line_ids}
+        for row in reversed(range(self.ui.infotable_2.rowCount())):
+            item = self.ui.infotable_2.item(row, 0)
+            if item is None or item.text() != str(file):
+                continue
+            if line_ids is not None and self.ui.infotable_2.item(row, 1).text() not in line_ids:
+                continue
+            self.ui.infotable_2.removeRow(row)
+
+    def __updateLineCounts(self):
+        keys = {str(key): key for key in self.lines}
+        for row in range(self.ui.infotable_1.rowCount()):
+            key = keys.get(self.ui.infotable_1.item(row, 0).text())
+            if key is None:
+                continue
+            if self.shape_types.get(key) == "zone":
+                entries = sum(c for (_, direction), c in self.aggregates.counts.get(key, {}).items() if direction == "Enter")
+                text = f"{self.zone_occupancy.get(key, 0)} inside, {entries} entered"
+            else:
+                text = str(self.aggregates.total(key))
+                speed = self.aggregates.speedSummary(key)
+                if speed:
+                    text += f", {speed['median']} km/h median, {speed['p85']} p85"
+            self.ui.infotable_1.setItem(row, 2, QTableWidgetItem(text))
+
+    def recountHistory(self):
+        # retroactively count the already processed part of the video against the edited lines
+        if self.video_path is None or len(self.detector.trajectories) == 0:
+            return
+
+        start = datetime.now()
+        # live streams only keep the last LIVE_WINDOW seconds, crossings before that stay as they were counted
+        since = self.detector.trajectories.retainedFrom
+        if since:
+            logging.info(f'recount covers the frames from {since} on, {self.detector.trajectories.evicted} older trajectory points were dropped')
+
+        line_ids = [k for k in self.lines if self.shape_types.get(k, "line") == "line"]
+        keys = {str(line_id): line_id for line_id in line_ids}
+        older, snapshots = [], {}
+        self.ui.infotable_2.setUpdatesEnabled(False)
+        for row in reversed(range(self.ui.infotable_2.rowCount())):
+            item = self.ui.infotable_2.item(row, 0)
+            if item is None or item.text() != str(self.video_path) or self.ui.infotable_2.item(row, 1).text() not in keys:
+                continue
+            values = [self.ui.infotable_2.item(row, column).text() for column in range(8)]
+            frame_index = item.data(Qt.UserRole)
+            if frame_index is not None and frame_index < since:
+                older.append({
+                    "line_id": keys[values[1]], "track_id": int(values[2]), "crossing_time": values[3],
+                    "vechile": values[4], "direction": values[5], "frame_index": frame_index,
+                    "speed": float(values[6]) if values[6] else None,
+                })
+                continue
+            if values[7]:
+                snapshots[(values[1], values[2])] = values[7]
+            self.ui.infotable_2.removeRow(row)
+
+        events = self.detector.recountTrajectories(self.crossingLines, older)
+        for event in events:
+            # a crossing found again keeps the crop taken when it was counted live
+            snapshot = snapshots.get((str(event["line_id"]), str(event["track_id"])))
+            if snapshot:
+                event["snapshot"] = snapshot
+            self.__appendTrackingRow(event)
+        self.ui.infotable_2.setUpdatesEnabled(True)
+
+        for line_id in line_ids:
+            self.aggregates.counts.pop(line_id, None)
+            self.aggregates.speeds.pop(line_id, None)
+        for event in older + events:
+            self.aggregates.add(event)
+        self.__updateLineCounts()
+        logging.info(f'recounted {len(self.detector.trajectories)} trajectory points, crossings : {len(events)}, took : {datetime.now() - start}')
+        self.__refreshODMatrix()
+
+        if self.checkpointer is not None:
+            # logged crossings of the recounted lines in the retained window are replaced as well
+            kept = [e for e in self.checkpointer.events.read() if str(e["line_id"]) not in keys or e["frame_index"] < since]
+            self.checkpointer.events.rewrite(kept + events)
+            self.__saveCheckpoint()
 
     def __resetFrameUpdate(self):
+        self.__stopRecorder()
+        self.__stopSnapshots()
+        # the whole video was tracked, keep the cache for later recounts
+        if self.detector.motion_gate is not None:
+            logging.info(f'motion gating : {self.detector.motion_gate.stats()}')
+        if self.detector.cascade is not None:
+            logging.info(f'cascade : {self.detector.cascade.stats()}')
+        if self.detector.tiler is not None:
+            logging.info(f'tiling : {self.detector.tiler.stats()}')
+        cache = self.detector.track_cache
+        self.detector.closeTrackCache(complete=True)
         self.detector.resetModel()
+        self.__refreshODMatrix()
+        self.__finishCheckpoint()
+        if cache is not None and cache.isComplete:
+            self.detector.track_cache = cache
+            self.recountbtn.setEnabled(True)
+
         self.timer.stop()
         self.videoToggler()
         self.ui.playpausebtn.setEnabled(False)
@@ -307,6 +1009,59 @@ class App(QtWidgets.QWidget):
         self.cap.release()
 
 
+    def showODMatrix(self):
+        self.od_version = -1
+        self.__refreshODMatrix()
+        self.odWidget.show()
+        self.odWidget.raise_()
+
+    def __refreshODMatrix(self):
+        # redrawn only when a track finished since the last refresh
+        od = self.detector.od
+        if od.version == self.od_version:
+            return
+        self.od_version = od.version
+        self.odWidget.showMatrix(*od.matrix(), len(od.sequences))
+
+    def exportODMatrix(self, file_path):
+        try:
+            self.detector.od.export(file_path)
+        except Exception as e:
+            QMessageBox.critical(self.odWidget, "Error", f"An error occurred while exporting the od matrix: {e}")
+            logging.error(e)
+            return
+        QMessageBox.information(self.odWidget, "Export Successful", "OD matrix has been exported successfully!")
+        logging.info(f'od matrix exported to : {file_path}')
+
+    def saveHeatmap(self):
+        filePath, _ = QFileDialog.getSaveFileName(self, "Save Heatmap", "", "Heatmap Files (*.npz);;All Files (*)")
+        if not filePath:
+            return
+        try:
+            self.detector.heatmap.save(filePath)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred while saving the heatmap: {e}")
+            logging.error(e)
+            return
+        logging.info(f'heatmap saved to : {filePath}, frames : {self.detector.heatmap.frames}')
+
+    def loadHeatmap(self):
+        # continues a saved heatmap, e.g. the same camera on another day
+        filePath, _ = QFileDialog.getOpenFileName(self, "Load Heatmap", "", "Heatmap Files (*.npz);;All Files (*)")
+        if not filePath:
+            return
+        try:
+            self.detector.heatmap.restore(filePath)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"An error occurred while loading the heatmap: {e}")
+            logging.error(e)
+            return
+        logging.info(f'heatmap loaded from : {filePath}, frames : {self.detector.heatmap.frames}')
+
+    def clearHeatmap(self):
+        self.detector.heatmap.reset()
+        logging.info('heatmap cleared')
+
     def exportTable(self):
         # Open a file dialog to choose where to save the CSV file
         options = QFileDialog.Options()
@@ -343,28 +1098,94 @@ class App(QtWidgets.QWidget):
 
     def updateFrame(self):
         if self.is_video_running:
-            ret, self.frame = self.cap.read()
+            ret, frame = self.cap.read(skip=self.detector.frame_stride - 1, out=self.pool.buffers.get("decode"))
+            if not ret and self.is_live and self.cap.isOpened():
+                # no new frame from the stream yet
+                return
             if not ret:
+                # self.frame keeps the last frame, the lines are mapped to frame coordinates with its size
                 logging.info(f'process completed : {self.video_path}')
                 self.__resetFrameUpdate()
                 return
-            
+            self.frame = frame
+
             # detect
-            self.frame = self.detector.detectAndTracePath(self.frame, self.crossingLines, self.ui.videocurrenttime.text() ,self.updateTrackingTable) # WORKING
+            self.frame = self.detector.detectAndTracePath(self.frame, self.crossingLines, self.__frameTime() ,self.updateTrackingTable) # WORKING
+            if self.odWidget.isVisible():
+                self.__refreshODMatrix()
+            if self.recorder is not None:
+                self.recorder.submit(self.frame)
+                if self.recorder.submitted % 300 == 0:
+                    logging.info(f'recording stats : {self.recorder.stats()}')
 
             # update progress
-            frame_completed_ratio = self.completed_frames / self.total_frames
-            self.ui.progressBar.setValue(min(math.ceil(frame_completed_ratio * 100), 100))
-            self.ui.videocurrenttime.setText(formatTime(self.videoDuration * frame_completed_ratio) + ' SEC')
-            self.completed_frames += 1
+            if self.is_live:
+                self.__updateLiveStatus()
+            else:
+                if self.total_frames:
+                    frame_completed_ratio = self.completed_frames / self.total_frames
+                    self.ui.progressBar.setValue(min(math.ceil(frame_completed_ratio * 100), 100))
+                # the position in time is known even when the frame count is not
+                self.ui.videocurrenttime.setText(self.__frameTime())
+            self.completed_frames += self.detector.frame_stride
+            if self.checkpointer is not None and self.checkpointer.due():
+                self.__saveCheckpoint()
             # Convert the frame to RGB format
-            self.frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
+            self.frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB, dst=self.pool.get("rgb", self.frame.shape))
 
         ## drown image and interactions
         self.__display(self.frame)
         self.__drawLiveInteractions()
 
+    def __frameTime(self):
+        # live streams have no video position, use the wall clock
+        if self.is_live:
+            return datetime.now().strftime('%H:%M:%S.%f')[:-4]
+        # from the decoder position, a stride changed on the way does not shift it
+        return formatTime(max(self.cap.next_index - 1, 0) / (self.fps or 25)) + ' SEC'
+
+    def __updateLiveStatus(self):
+        self.cap.markProcessed()
+        stats = self.cap.stats()
+        self.ui.videocurrenttime.setText(
+            f"LIVE lag {stats['end_to_end_lag']:.2f}s, dropped {stats['dropped']}"
+        )
+        if stats['processed'] % 300 == 0:
+            logging.info(f'live stream stats : {stats}')
+
+    def startSpeedCalibration(self):
+        if self.video_path is None:
+            return
+        self.calibration_points = []
+        logging.info('speed calibration : click the four corners of a road rectangle, clockwise')
+
+    def __addCalibrationPoint(self, pos):
+        self.calibration_points.append(pos - (self.dif / 2))
+        if len(self.calibration_points) < 4:
+            return
+
+        points, self.calibration_points = self.calibration_points, None
+        width, ok = QInputDialog.getDouble(self, "Speed calibration", "Distance point 1 -> point 2 (m) :", 3.5, 0.1, 10000, 2)
+        if ok:
+            length, ok = QInputDialog.getDouble(self, "Speed calibration", "Distance point 2 -> point 3 (m) :", 10.0, 0.1, 10000, 2)
+        if not ok:
+            logging.info('speed calibration cancelled')
+            return
+
+        try:
+            self.detector.speed.calibrate(self.__toFrameCoordinates(points), width, length)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Invalid calibration points: {e}")
+            logging.error(e)
+            return
+        logging.info(f'speed calibrated, {width} m x {length} m')
+        self.updateFrame()
+
     def onMousePress(self, event):
+        if self.calibration_points is not None and event.buttons() == Qt.LeftButton:
+            self.__addCalibrationPoint(event.pos())
+            return
+
         if not self.is_drawing:
             return
 
@@ -385,9 +1206,11 @@ class App(QtWidgets.QWidget):
             self.currect_point = None
             self.updateFrame()
 
-            if len(self.line) > 1:
-                # add line to collection
+            shape_type = self.shapeselector.currentText().lower()
+            if len(self.line) > (2 if shape_type == "zone" else 1):
+                # add line or zone to collection
                 self.lines[self.line_id] = self.line
+                self.shape_types[self.line_id] = shape_type
 
                 ## update table 1
                 numRows = self.ui.infotable_1.rowCount()
@@ -398,6 +1221,8 @@ class App(QtWidgets.QWidget):
                 self.ui.infotable_1.setItem(
                     numRows, 1, QTableWidgetItem(str(self.line))
                 )
+                if shape_type == "line":
+                    self.recountHistory()
 
             ## reset line and id
             self.line = []
@@ -413,7 +1238,16 @@ class App(QtWidgets.QWidget):
             self.updateFrame()
 
     def closeEvent(self, event):
+        if self.checkpointer is not None:
+            # closing mid video resumes like a crash would
+            if self.detector.frame_index > 0:
+                self.__saveCheckpoint()
+            self.checkpointer.close()
+        self.__stopRecorder()
+        self.__stopSnapshots()
+        self.detector.closeTrackCache()
         self.cap.release()
+        self.log_listener.stop()
         super().closeEvent(event)
 
     def loadVideo(self):
@@ -470,12 +1304,13 @@ class App(QtWidgets.QWidget):
             else:
                 self.timer.stop()
 
-    def videoLoadedSlot(self, path):
+    def videoLoadedSlot(self, path, is_live=False):
         # checking for path existance and validity
         if not path:
             return
 
         self.video_path = path
+        self.is_live = is_live
         logging.info(f'loading video : {self.video_path}')
 
         self.initCap()